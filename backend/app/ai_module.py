@@ -1,109 +1,459 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import pytesseract
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
+import mmap
+import os
+import queue
 import random
+import threading
+import time
+
+from .analysis_config import TILE_MERGE_THRESHOLD, TILE_OVERLAP, TILE_SIZE, TILED_THRESHOLD
+from .tiling import Tile, image_size, tile_grid, core_region, merge_detections
+from .preprocessing import PRESETS, Preset, select_preset
+from .ocr import start_text_extraction
+from .detectors import Detector, load_detector
+from .components import ComponentBatch
+from .postprocess import postprocess, extract_measurements as parse_measurement
+from .revisions import RevisionState, tile_signatures, changed_tiles, thumbnail, estimate_shift, align
+from .inference_pool import ModelUnavailable
+from . import metrics, tracing
 
 logger = logging.getLogger(__name__)
 
-# Initialize YOLO model
-try:
-    model = YOLO("best_floorplan_model.pt")  # Load your trained model
-except Exception as e:
-    logger.error(f"Failed to load YOLO model: {str(e)}")
-    model = None
+# progress(stage, data) callback; see app.jobs for the stages
+Progress = Callable[[str, Dict[str, Any]], None]
+
+MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "best_floorplan_model.pt")
+# Without the model only OCR runs; refuse to analyze instead unless this is off
+MODEL_REQUIRED = os.getenv("MODEL_REQUIRED", "true").lower() == "true"
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+
+# The detection model, loaded by load_model() on first use or ahead of time
+# (see app.serve); the backend (PyTorch, ONNX Runtime or OpenVINO) follows
+# from the file unless DETECTOR_BACKEND says otherwise.
+model: Optional[Detector] = None
+_model_state: Dict[str, Any] = {"loaded": False, "warmed": False, "backend": None, "error": None}
+_model_lock = threading.Lock()
+
+# Tiled inference configuration
+TILE_WORKERS = int(os.getenv("TILE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Micro-batching configuration
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "8"))
+YOLO_BATCH_WINDOW_MS = float(os.getenv("YOLO_BATCH_WINDOW_MS", "20"))
+
+class BatchScheduler:
+    """
+    Collects images from concurrent callers and runs them through the
+    model as one batch.
+
+    A batch is closed when it holds `max_batch_size` images or when
+    `window_ms` has passed since its first image arrived, whichever comes
+    first. Each caller gets back the result for its own image.
+    """
+
+    def __init__(self, predict, max_batch_size: int = YOLO_BATCH_SIZE, window_ms: float = YOLO_BATCH_WINDOW_MS):
+        self.predict_batch = predict
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.batch_sizes: Dict[int, int] = {}
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def predict(self, image: np.ndarray):
+        """
+        Run detection for a single image, sharing a forward pass with any
+        other images submitted within the batching window.
+        """
+        if self.max_batch_size == 1:
+            self._record(1)
+            return self.predict_batch([image])[0]
+
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((image, future))
+        return future.result()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="yolo-batcher", daemon=True)
+                self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            images = [image for image, _ in batch]
+            self._record(len(batch))
+            try:
+                results = self.predict_batch(images)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _record(self, size: int) -> None:
+        with self._lock:
+            self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            histogram = dict(sorted(self.batch_sizes.items()))
+        batches = sum(histogram.values())
+        images = sum(size * count for size, count in histogram.items())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000.0,
+            "batches": batches,
+            "images": images,
+            "mean_batch_size": round(images / batches, 2) if batches else 0.0,
+            "batch_size_histogram": histogram,
+        }
+
+batcher = BatchScheduler(lambda images: model.predict(images))
+
+def warm_up(detector: Detector) -> None:
+    """
+    Run a blank page through preprocessing and the detector so the first
+    request doesn't pay for lazy initialisation (kernel selection, memory
+    arenas, first-touch of the weights).
+    """
+    start = time.perf_counter()
+    page = np.full((TILE_SIZE, TILE_SIZE, 3), 255, np.uint8)
+    detector.predict([PRESETS["quality"].run(page)])
+    _model_state["warmed"] = True
+    _model_state["warmup_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+    logger.info(f"Detection model warmed up in {_model_state['warmup_ms']}ms")
+
+def load_model(required: bool = MODEL_REQUIRED, warm: bool = MODEL_WARMUP) -> Optional[Detector]:
+    """
+    Load (and warm up) the detection model, once per process.
+    Raises ModelUnavailable when it can't be loaded and is `required`;
+    otherwise returns None and detection is skipped.
+    """
+    global model
+    with _model_lock:
+        if model is None and _model_state["error"] is None:
+            try:
+                model = load_detector(MODEL_PATH, strict=True)
+                _model_state.update(loaded=True, backend=model.backend)
+            except Exception as e:
+                _model_state["error"] = f"Failed to load {MODEL_PATH}: {str(e)}"
+        if model is not None and warm and not _model_state["warmed"]:
+            warm_up(model)
+
+    if model is None and required:
+        raise ModelUnavailable(_model_state["error"])
+    return model
+
+def model_status(load: bool = False) -> Dict[str, Any]:
+    """
+    State of the detection model in this process. `ready` means requests
+    can be analyzed: the model is loaded and warmed up, or it failed to
+    load but isn't required. With `load`, the model is loaded first.
+    """
+    if load:
+        load_model(required=False)
+    status = dict(_model_state, path=MODEL_PATH, required=MODEL_REQUIRED, pid=os.getpid())
+    if status["loaded"]:
+        status["ready"] = status["warmed"] or not MODEL_WARMUP
+    else:
+        status["ready"] = status["error"] is not None and not MODEL_REQUIRED
+    return status
 
 def preprocess_image(image: np.ndarray) -> np.ndarray:
     """
     Preprocess the image for better detection.
+    Runs the full "quality" pipeline; see app.preprocessing for the others.
     """
-    # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # Apply adaptive thresholding
-    thresh = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-    )
-    
-    # Denoise
-    denoised = cv2.fastNlMeansDenoising(thresh)
-    
-    return denoised
+    return PRESETS["quality"].run(image)
+
+def detect_components(
+    processed_image: np.ndarray,
+    offset: Tuple[int, int] = (0, 0),
+    scale: float = 1.0
+) -> ComponentBatch:
+    """
+    Run YOLO on a preprocessed image (or tile) and return the detected
+    components in page coordinates. `offset` is the tile origin and
+    `scale` the factor from decoded to original pixels.
+    """
+    detector = load_model()
+    if detector is None:
+        return ComponentBatch.empty()
+
+    # Run YOLO detection, batched with concurrent requests
+    with metrics.timed_stage("detection"):
+        detections = batcher.predict(processed_image)
+    return ComponentBatch.from_detections(detections, detector.names, offset, scale)
+
+def extract_text(
+    processed_image: np.ndarray,
+    offset: Tuple[int, int] = (0, 0),
+    scale: float = 1.0
+) -> List[Dict[str, Any]]:
+    """
+    Extract text annotations using OCR, in page coordinates.
+    Only candidate text regions are OCRed, in parallel (see app.ocr).
+    """
+    return start_text_extraction(processed_image, offset, scale).result()
+
+def analyze_tile(
+    image: np.ndarray,
+    tile: Tile,
+    preset: Preset,
+    timing: Optional[Dict[str, float]] = None
+) -> Tuple[ComponentBatch, List[Dict[str, Any]]]:
+    """
+    Preprocess, detect and OCR one tile of a decoded page. Returns the
+    tile's detections and the text annotations whose centre lies in the
+    tile's core region, both in page coordinates.
+    """
+    height, width = image.shape[:2]
+    x0, y0, x1, y1 = tile
+    processed = preset.run(image[y0:y1, x0:x1], timing)
+    pending_text = start_text_extraction(processed, offset=(x0, y0), scale=preset.scale)
+    detections = detect_components(processed, offset=(x0, y0), scale=preset.scale)
+
+    cx0, cy0, cx1, cy1 = core_region(tile, width, height, TILE_OVERLAP)
+    texts = []
+    for text in pending_text.result():
+        dims = text["dimensions"]
+        cx = (dims["x"] + dims["width"] / 2) / preset.scale
+        cy = (dims["y"] + dims["height"] / 2) / preset.scale
+        if cx0 <= cx < cx1 and cy0 <= cy < cy1:
+            texts.append(text)
+    return detections, texts
+
+def analyze_tiled(
+    image: np.ndarray,
+    preset: Preset = PRESETS["quality"],
+    timing: Optional[Dict[str, float]] = None,
+    progress: Optional[Progress] = None
+) -> ComponentBatch:
+    """
+    Analyze a large drawing tile by tile at native resolution.
+
+    Tiles are preprocessed, detected and OCRed in parallel; detections
+    split or duplicated across tile seams are merged, and each text
+    annotation is kept only by the tile whose core region contains its
+    centre.
+    """
+    height, width = image.shape[:2]
+    tiles = tile_grid(width, height, TILE_SIZE, TILE_OVERLAP)
+    logger.info(f"Tiled analysis of {width}x{height} image in {len(tiles)} tiles")
+
+    def process(tile):
+        return analyze_tile(image, tile, preset, timing)
+
+    detections = []
+    texts = []
+    with ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tile") as executor:
+        for done, (tile_detections, tile_texts) in enumerate(executor.map(tracing.propagate(process), tiles), 1):
+            detections.append(tile_detections)
+            texts.extend(tile_texts)
+            if progress is not None:
+                progress("tile", {"done": done, "total": len(tiles)})
+
+    components = merge_detections(detections, TILE_MERGE_THRESHOLD)
+    if progress is not None:
+        progress("preprocessed", {"preset": preset.name, "tiles": len(tiles)})
+        progress("detected", {"components": components.to_components()})
+        progress("ocr", {"components": texts})
+    return components.with_texts(texts)
 
-def analyze_drawing(file_bytes: bytes) -> List[Dict[str, Any]]:
+def analyze_drawing(
+    file_bytes: bytes,
+    tiled: Optional[bool] = None,
+    preset: Optional[str] = None,
+    progress: Optional[Progress] = None
+) -> ComponentBatch:
     """
     Process the uploaded drawing and return detected components.
+    Drawings larger than TILED_THRESHOLD pixels on either side are
+    analyzed tile by tile unless `tiled` is given explicitly. `preset`
+    names a preprocessing preset (see app.preprocessing), "auto" or None
+    for the configured default. `progress` is called as each stage
+    finishes, with partial results for detection and OCR.
     """
     try:
         logger.info(f"Received file of size {len(file_bytes)} bytes")
+        # Fail before decoding anything when the model is required but missing
+        load_model()
         
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(file_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            raise ValueError("Failed to decode image")
-            
-        # Preprocess image
-        processed_image = preprocess_image(image)
-        
-        # Perform object detection if model is available
-        components = []
-        if model is not None:
-            # Run YOLO detection
-            results = model(processed_image)
-            
-            # Process each detection
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    # Get coordinates and dimensions
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    width = x2 - x1
-                    height = y2 - y1
-                    area = width * height
-                    confidence = box.conf[0].item()
-                    class_id = box.cls[0].item()
-                    component_type = model.names[int(class_id)]
-                    
-                    components.append({
-                        "type": component_type,
-                        "confidence": confidence,
-                        "dimensions": {
-                            "width": width,
-                            "height": height,
-                            "area": area,
-                            "x1": x1,
-                            "y1": y1,
-                            "x2": x2,
-                            "y2": y2
-                        }
-                    })
-        
-        # Extract text annotations using OCR
-        text_results = pytesseract.image_to_data(processed_image, output_type=pytesseract.Output.DICT)
-        for i in range(len(text_results["text"])):
-            if int(text_results["conf"][i]) > 60:  # Filter low confidence text
-                components.append({
-                    "type": "text_annotation",
-                    "text": text_results["text"][i],
-                    "confidence": float(text_results["conf"][i]) / 100,
-                    "dimensions": {
-                        "x": text_results["left"][i],
-                        "y": text_results["top"][i],
-                        "width": text_results["width"][i],
-                        "height": text_results["height"][i]
-                    }
-                })
-        
+        if tiled is None:
+            size = image_size(file_bytes)
+            tiled = size is not None and max(size) > TILED_THRESHOLD
+
+        pipeline = select_preset(file_bytes, preset)
+        timing: Dict[str, float] = {}
+
+        if tiled:
+            # Decode straight to grayscale: a third of the colour buffer
+            image = pipeline.decode(file_bytes, grayscale=True, timing=timing)
+            if image is None:
+                raise ValueError("Failed to decode image")
+            if progress is not None:
+                progress("decoded", {"width": image.shape[1], "height": image.shape[0], "tiled": True})
+            components = analyze_tiled(image, pipeline, timing, progress)
+        else:
+            image = pipeline.decode(file_bytes, timing=timing)
+
+            if image is None:
+                raise ValueError("Failed to decode image")
+            if progress is not None:
+                progress("decoded", {"width": image.shape[1], "height": image.shape[0], "tiled": False})
+
+            # Preprocess image
+            processed_image = pipeline.run(image, timing)
+            if progress is not None:
+                progress("preprocessed", {"preset": pipeline.name})
+
+            # Start OCR on candidate text regions in the background
+            pending_text = start_text_extraction(processed_image, scale=pipeline.scale)
+
+            # Perform object detection if model is available
+            components = detect_components(processed_image, scale=pipeline.scale)
+            if progress is not None:
+                progress("detected", {"components": components.to_components()})
+
+            # Collect the text annotations
+            texts = pending_text.result()
+            if progress is not None:
+                progress("ocr", {"components": texts})
+            components = components.with_texts(texts)
+
+        logger.info(
+            f"Preprocessing '{pipeline.name}': "
+            + ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in timing.items())
+        )
+        # Deduplicate, merge wall segments and link measurement texts
+        with metrics.timed_stage("postprocess"):
+            components = postprocess(components)
+        metrics.record_components(components)
         return components
         
     except Exception as e:
         logger.error(f"Error in analyze_drawing: {str(e)}")
         raise
 
+def analyze_file(
+    path: str,
+    tiled: Optional[bool] = None,
+    preset: Optional[str] = None,
+    progress: Optional[Progress] = None
+) -> ComponentBatch:
+    """
+    analyze_drawing() for an upload spooled to disk. The file is mapped
+    read-only and decoded in place, so it is never copied into memory.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return analyze_drawing(buffer, tiled=tiled, preset=preset, progress=progress)
+
+def analyze_revision(
+    file_bytes: bytes,
+    previous: Optional[RevisionState] = None,
+    preset: Optional[str] = None
+) -> Tuple[ComponentBatch, RevisionState, Dict[str, Any]]:
+    """
+    Analyze a revision of a drawing, re-running preprocessing, detection
+    and OCR only on the tiles that changed since `previous`.
+
+    The page is always analyzed tile by tile (see analyze_tiled). It is
+    aligned to the previous revision by phase correlation, each tile's
+    block-mean signature is compared with the previous one, and unchanged
+    tiles reuse their stored detections and text annotations before tile
+    merging and post-processing. Without a compatible previous state
+    (first revision, other page size or preset) every tile is analyzed.
+
+    Returns the components, the state for the next revision and stats:
+    tile counts and the alignment found.
+    """
+    load_model()
+    start = time.perf_counter()
+    pipeline = select_preset(file_bytes, preset)
+    timing: Dict[str, float] = {}
+    image = pipeline.decode(file_bytes, grayscale=True, timing=timing)
+    if image is None:
+        raise ValueError("Failed to decode image")
+    height, width = image.shape[:2]
+
+    incremental = previous is not None and previous.compatible(
+        (width, height), TILE_SIZE, TILE_OVERLAP, pipeline.name
+    )
+    shift, response = (0, 0), None
+    if incremental:
+        shift, response = estimate_shift(previous.thumbnail, image, previous.thumbnail_scale)
+        image = align(image, *shift)
+
+    tiles = tile_grid(width, height, TILE_SIZE, TILE_OVERLAP)
+    signatures = tile_signatures(image, tiles)
+    changed = changed_tiles(previous.signatures, signatures) if incremental else np.ones(len(tiles), bool)
+
+    detections = list(previous.tile_detections) if incremental else [None] * len(tiles)
+    texts = list(previous.tile_texts) if incremental else [None] * len(tiles)
+    todo = np.flatnonzero(changed).tolist()
+    with ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tile") as executor:
+        for i, (tile_detections, tile_texts) in zip(
+            todo, executor.map(tracing.propagate(lambda i: analyze_tile(image, tiles[i], pipeline, timing)), todo)
+        ):
+            detections[i] = tile_detections
+            texts[i] = tile_texts
+
+    merged = merge_detections(detections, TILE_MERGE_THRESHOLD)
+    with metrics.timed_stage("postprocess"):
+        components = postprocess(merged.with_texts([text for tile_texts in texts for text in tile_texts]))
+    metrics.record_components(components)
+    # Frame (first revision) to page coordinates of this revision
+    offset = (shift[0] * pipeline.scale, shift[1] * pipeline.scale)
+    components = components.translated(*offset)
+
+    if incremental:
+        reference, reference_scale = previous.thumbnail, previous.thumbnail_scale
+    else:
+        reference, reference_scale = thumbnail(image)
+    state = RevisionState(
+        (width, height), TILE_SIZE, TILE_OVERLAP, pipeline.name, pipeline.scale, offset,
+        signatures, reference, reference_scale, detections, texts, components.replace_texts([]),
+    )
+    stats = {
+        "tiles": len(tiles),
+        "analyzed": len(todo),
+        "reused": len(tiles) - len(todo),
+        "incremental": incremental,
+        "alignment": {"dx": offset[0], "dy": offset[1], "response": response},
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    logger.info(f"Revision analysis: {stats['analyzed']} of {len(tiles)} tiles analyzed, shift {offset}")
+    return components, state, stats
+
+def analyze_revision_file(
+    path: str,
+    previous: Optional[RevisionState] = None,
+    preset: Optional[str] = None
+) -> Tuple[ComponentBatch, RevisionState, Dict[str, Any]]:
+    """
+    analyze_revision() for an upload spooled to disk, mapped read-only.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return analyze_revision(buffer, previous, preset)
+
 def calculate_areas(components: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Calculate areas for components that need it (e.g., walls, floors).
@@ -119,7 +469,6 @@ def extract_measurements(text: str) -> Dict[str, float]:
     """
     Extract measurements from OCR text.
     Returns a dictionary of measurements if found.
+    See app.postprocess for the formats understood.
     """
-    # TODO: Implement measurement extraction from text
-    # This would parse text like "width: 5m" or "area: 20m²"
-    return {} 
\ No newline at end of file
+    return parse_measurement(text)
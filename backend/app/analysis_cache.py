@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from . import analysis_config
+from .components import ComponentBatch
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "analysis-cache"))
+ANALYSIS_CACHE_MEMORY_BYTES = int(os.getenv("ANALYSIS_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+ANALYSIS_CACHE_DISK = os.getenv("ANALYSIS_CACHE_DISK", "true").lower() == "true"
+MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "best_floorplan_model.pt")
+
+# Bump whenever preprocessing or post-processing in ai_module changes the
+# components produced for the same input.
+ANALYSIS_VERSION = "7"
+
+
+def model_fingerprint(path: str = MODEL_PATH) -> str:
+    """
+    Content hash of the model weights, or "none" when no weights are present.
+    A directory (e.g. an OpenVINO export) is hashed file by file.
+    """
+    try:
+        digest = hashlib.sha256()
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        else:
+            files = [path]
+        for file in files:
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()[:16]
+    except OSError:
+        return "none"
+
+
+def settings_fingerprint() -> str:
+    """
+    Hash of the analysis settings in effect (see app.analysis_config).
+    """
+    values = {name: getattr(analysis_config, name) for name in analysis_config.FINGERPRINTED}
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache for analyze_drawing results, stored in
+    ComponentBatch's columnar form.
+
+    Entries are keyed by the SHA-256 of the file bytes and the resolved
+    preset, and stored under a version made of ANALYSIS_VERSION, the model
+    fingerprint and the fingerprint of the analysis settings. The memory
+    tier is an LRU bounded by the size of the serialized entries; the disk
+    tier is a directory per version, so it survives restarts and is shared
+    by every worker pointing at the same ANALYSIS_CACHE_DIR.
+    """
+
+    def __init__(
+        self,
+        directory: str = ANALYSIS_CACHE_DIR,
+        memory_bytes: int = ANALYSIS_CACHE_MEMORY_BYTES,
+        disk: bool = ANALYSIS_CACHE_DISK,
+        model_path: str = MODEL_PATH,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk = disk
+        self.model_path = model_path
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._model_stat = None
+        self._settings = None
+        self._version = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def version(self) -> str:
+        """
+        Current cache version. Re-checks the weights file on every call
+        (a stat, not a hash) and invalidates the cache when it changed.
+        """
+        try:
+            st = os.stat(self.model_path)
+            model_stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            model_stat = None
+
+        if self._version is None or model_stat != self._model_stat:
+            previous = self._version
+            if self._settings is None:
+                self._settings = settings_fingerprint()
+            self._model_stat = model_stat
+            self._version = f"{ANALYSIS_VERSION}-{model_fingerprint(self.model_path)}-{self._settings}"
+            if previous is not None and previous != self._version:
+                logger.info(f"Model weights changed ({previous} -> {self._version}), invalidating analysis cache")
+                self.invalidate(purge_disk=True)
+        return self._version
+
+    @staticmethod
+    def key(file_bytes: bytes, *variant: str) -> str:
+        """
+        Cache key for an upload. `variant` distinguishes analysis options
+        that change the result for the same bytes (e.g. the preset).
+        """
+        return AnalysisCache.key_for_digest(hashlib.sha256(file_bytes).hexdigest(), *variant)
+
+    @staticmethod
+    def key_for_digest(digest: str, *variant: str) -> str:
+        """
+        key() for an upload whose SHA-256 hex digest is already known.
+        """
+        key = digest
+        if variant:
+            key += "-" + "-".join(variant)
+        return key
+
+    def _path(self, version: str, key: str) -> str:
+        return os.path.join(self.directory, version, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[ComponentBatch]:
+        version = self.version
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return ComponentBatch.from_dict(json.loads(data))
+
+        if self.disk:
+            try:
+                with open(self._path(version, key), "rb") as f:
+                    data = f.read()
+                components = ComponentBatch.from_dict(json.loads(data))
+                self.disk_hits += 1
+                self._remember(key, data)
+                return components
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable analysis cache entry {key}: {str(e)}")
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, components: ComponentBatch) -> None:
+        data = json.dumps(components.to_dict(), separators=(",", ":")).encode()
+        self._remember(key, data)
+
+        if self.disk:
+            path = self._path(self.version, key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temp file and rename so concurrent readers in
+                # other workers never see a partial entry.
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"Failed to write analysis cache entry {key}: {str(e)}")
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, purge_disk: bool = False) -> None:
+        """
+        Drop every in-memory entry. With purge_disk, also remove on-disk
+        entries that don't belong to the current version.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.invalidations += 1
+
+        if purge_disk and self.disk and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name != self._version:
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "version": self._version,
+            "entries": len(self._entries),
+            "memory_bytes": self._size,
+            "memory_budget": self.memory_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+cache = AnalysisCache()
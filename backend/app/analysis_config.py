@@ -0,0 +1,73 @@
+"""
+Settings that change the components an analysis produces for the same
+drawing. They live here, away from the modules that apply them, so the API
+process can fingerprint them (see app.analysis_cache) without importing
+OpenCV, Tesseract or the detector.
+"""
+
+import os
+from typing import Optional
+
+# Detection
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "auto")  # auto, ultralytics, onnxruntime or openvino
+DETECTOR_CONF_THRESHOLD = float(os.getenv("DETECTOR_CONF_THRESHOLD", "0.25"))
+DETECTOR_IOU_THRESHOLD = float(os.getenv("DETECTOR_IOU_THRESHOLD", "0.7"))
+DETECTOR_MAX_DETECTIONS = int(os.getenv("DETECTOR_MAX_DETECTIONS", "300"))
+
+# Preprocessing
+PREPROCESS_PRESET = os.getenv("PREPROCESS_PRESET", "auto")
+PREPROCESS_NOISE_LOW = float(os.getenv("PREPROCESS_NOISE_LOW", "1.5"))
+PREPROCESS_NOISE_HIGH = float(os.getenv("PREPROCESS_NOISE_HIGH", "3.0"))
+
+# Tiled inference
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1280"))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "256"))
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", "0.6"))
+TILED_THRESHOLD = int(os.getenv("TILED_THRESHOLD", "4096"))  # pixels on the longest side
+
+# Post-processing
+POSTPROCESS_ENABLED = os.getenv("POSTPROCESS_ENABLED", "true").lower() == "true"
+POSTPROCESS_DUPLICATE_IOU = float(os.getenv("POSTPROCESS_DUPLICATE_IOU", "0.7"))
+WALL_MERGE_GAP = float(os.getenv("WALL_MERGE_GAP", "20"))  # pixels along the wall
+WALL_MERGE_ALIGNMENT = float(os.getenv("WALL_MERGE_ALIGNMENT", "0.5"))  # 1-D IoU across the wall
+MEASUREMENT_LINK_DISTANCE = float(os.getenv("MEASUREMENT_LINK_DISTANCE", "150"))  # pixels
+
+# OCR
+OCR_MIN_CHAR_HEIGHT = int(os.getenv("OCR_MIN_CHAR_HEIGHT", "6"))
+OCR_MAX_CHAR_HEIGHT = int(os.getenv("OCR_MAX_CHAR_HEIGHT", "80"))
+OCR_MAX_REGIONS = int(os.getenv("OCR_MAX_REGIONS", "400"))
+OCR_REGION_PADDING = int(os.getenv("OCR_REGION_PADDING", "4"))
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "--psm 6")
+
+# Settings folded into the analysis cache version. The preset isn't one:
+# it is part of every cache key instead (see preset_name()).
+FINGERPRINTED = [
+    "DETECTOR_BACKEND",
+    "DETECTOR_CONF_THRESHOLD",
+    "DETECTOR_IOU_THRESHOLD",
+    "DETECTOR_MAX_DETECTIONS",
+    "PREPROCESS_NOISE_LOW",
+    "PREPROCESS_NOISE_HIGH",
+    "TILE_SIZE",
+    "TILE_OVERLAP",
+    "TILE_MERGE_THRESHOLD",
+    "TILED_THRESHOLD",
+    "POSTPROCESS_ENABLED",
+    "POSTPROCESS_DUPLICATE_IOU",
+    "WALL_MERGE_GAP",
+    "WALL_MERGE_ALIGNMENT",
+    "MEASUREMENT_LINK_DISTANCE",
+    "OCR_MIN_CHAR_HEIGHT",
+    "OCR_MAX_CHAR_HEIGHT",
+    "OCR_MAX_REGIONS",
+    "OCR_REGION_PADDING",
+    "OCR_TESSERACT_CONFIG",
+]
+
+
+def preset_name(name: Optional[str] = None) -> str:
+    """
+    The preset a request asks for, with the PREPROCESS_PRESET default
+    applied. Still "auto" when that's what was asked for.
+    """
+    return (name or PREPROCESS_PRESET).lower()
@@ -1,21 +1,139 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import os
+import secrets
+import threading
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
 from .models import User, UserPlan
-from .database import get_db
+from .database import get_async_db
 
 # Security configuration
 SECRET_KEY = "your-secret-key"  # In production, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Principal cache and password hashing configuration
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+# bcrypt is pure CPU; a dedicated pool keeps login bursts from taking the
+# threads FastAPI uses for sync endpoints and dependencies.
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+class PrincipalCache:
+    """
+    Short-TTL cache of authenticated users keyed by the SHA-256 of their
+    bearer token or API key. Entries for a user are dropped as soon as
+    their plan, email or API key changes in this process; the TTL bounds
+    staleness across workers. When full, the least recently used entry
+    is evicted.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[User]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, user: User, expires_at: Optional[float] = None) -> None:
+        if self.ttl <= 0:
+            return
+        expiry = time.monotonic() + self.ttl
+        if expires_at is not None:
+            expiry = min(expiry, time.monotonic() + max(0.0, expires_at - time.time()))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            elif len(self._entries) >= self.max_size:
+                # Drop the least recently used entry
+                oldest, (_, evicted) = self._entries.popitem(last=False)
+                self._forget(oldest, evicted.id)
+            self._entries[key] = (expiry, user)
+            self._keys_by_user.setdefault(user.id, set()).add(key)
+
+    def invalidate_user(self, user_id: Optional[int]) -> None:
+        if user_id is None:
+            return
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._forget(key, entry[1].id)
+
+    def _forget(self, key: str, user_id: int) -> None:
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+principal_cache = PrincipalCache()
+
+def _snapshot(user: User) -> User:
+    """
+    Detached copy of a user's column values, safe to share between
+    requests and to merge into another session without a query.
+    """
+    copy = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+    make_transient_to_detached(copy)
+    return copy
+
+def _invalidate_on_change(target, value, oldvalue, initiator):
+    # Building a snapshot sets attributes on a transient copy; only changes
+    # to rows that already exist matter here.
+    if value != oldvalue and inspect(target).has_identity:
+        principal_cache.invalidate_user(target.id)
+
+for _attribute in (User.plan, User.email, User.api_key_hash):
+    event.listen(_attribute, "set", _invalidate_on_change)
+
+@event.listens_for(User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target):
+    principal_cache.invalidate_user(target.id)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -23,6 +141,31 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
+
+def hash_api_key(api_key: str) -> str:
+    """
+    API keys are random and high-entropy, so a plain SHA-256 is enough to
+    store and look them up through an indexed column.
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def set_api_key(user: User, api_key: Optional[str] = None) -> str:
+    """
+    Issue a new API key for a user. Only its hash is stored; the plain key
+    is returned once so it can be shown to the user.
+    """
+    api_key = api_key or secrets.token_urlsafe(32)
+    user.api_key_hash = hash_api_key(api_key)
+    user.api_key = None
+    return api_key
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -35,13 +178,20 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Hashed so the cache (and anything that dumps it) never holds usable tokens
+    cache_key = f"token:{hashlib.sha256(token.encode()).hexdigest()}"
+    cached = principal_cache.get(cache_key)
+    if cached is not None:
+        # Attach a copy to this request's session without a round-trip
+        return await db.merge(cached, load=False)
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -49,28 +199,53 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
+    principal_cache.put(cache_key, _snapshot(user), expires_at=payload.get("exp"))
     return user
 
-def verify_api_key(api_key: str, db: Session = Depends(get_db)) -> Optional[User]:
-    user = db.query(User).filter(
-        User.api_key == api_key,
-        User.plan == UserPlan.ENTERPRISE
-    ).first()
+async def get_optional_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Optional[User]:
+    """
+    The authenticated user, or None when the request has no bearer token.
+    An invalid token is still rejected.
+    """
+    if token is None:
+        return None
+    return await get_current_user(token, db)
+
+async def verify_api_key(api_key: str, db: AsyncSession = Depends(get_async_db)) -> Optional[User]:
+    key_hash = hash_api_key(api_key)
+    cache_key = f"api_key:{key_hash}"
+    cached = principal_cache.get(cache_key)
+    if cached is not None:
+        return await db.merge(cached, load=False)
+
+    result = await db.execute(
+        select(User).where(
+            User.api_key_hash == key_hash,
+            User.plan == UserPlan.ENTERPRISE
+        )
+    )
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key or insufficient permissions"
         )
+    principal_cache.put(cache_key, _snapshot(user))
     return user
 
-def authenticate_user(email: str, password: str, db: Session) -> Optional[User]:
-    user = db.query(User).filter(User.email == email).first()
+async def authenticate_user(email: str, password: str, db: AsyncSession) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
-    return user 
\ No newline at end of file
+    return user
@@ -0,0 +1,326 @@
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TEXT_ANNOTATION = "text_annotation"
+
+# Columns of ComponentBatch.measured: dimensions read from the drawing's
+# text (see app.postprocess), in metres and square metres. New fields go
+# at the end, so older binary layouts store a prefix of them.
+MEASURED_FIELDS = ("length", "area", "width", "height")
+
+# to_bytes() layout: magic, detection count, size of the names block.
+# Measured columns stored per layout: CB01 none, CB02 length and area.
+BINARY_MAGIC = b"CB03"
+BINARY_FIELDS = {b"CB01": 0, b"CB02": 2, BINARY_MAGIC: len(MEASURED_FIELDS)}
+BINARY_HEADER = struct.Struct("<4sII")
+BINARY_COMPRESSION = 6
+
+
+class ComponentBatch:
+    """
+    The components found in one drawing, as columns.
+
+    Detections are stored as a class id (into `names`), a confidence and
+    an xyxy box in original page pixels, one row each, plus the
+    MEASURED_FIELDS read for it from the drawing's text (NaN where there
+    is none; see app.postprocess). OCR text annotations are kept as the
+    dicts app.ocr produces, after the detections. The batch travels
+    unchanged from the detector through tile merging, the inference
+    pool, the analysis cache and costing; to_components() builds the
+    list of dicts the API returns.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        cls: np.ndarray,
+        conf: np.ndarray,
+        xyxy: np.ndarray,
+        texts: Optional[List[Dict[str, Any]]] = None,
+        measured: Optional[np.ndarray] = None,
+    ):
+        self.names = list(names)
+        self.cls = cls
+        self.conf = conf
+        self.xyxy = xyxy
+        self.texts = texts if texts is not None else []
+        self.measured = measured if measured is not None else np.full((len(cls), len(MEASURED_FIELDS)), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.cls) + len(self.texts)
+
+    @property
+    def width(self) -> np.ndarray:
+        return self.xyxy[:, 2] - self.xyxy[:, 0]
+
+    @property
+    def height(self) -> np.ndarray:
+        return self.xyxy[:, 3] - self.xyxy[:, 1]
+
+    @property
+    def types(self) -> np.ndarray:
+        """
+        Component type of every detection, as an object array.
+        """
+        return np.asarray(self.names, dtype=object)[self.cls] if self.names else np.zeros(0, dtype=object)
+
+    @classmethod
+    def empty(cls, names: Sequence[str] = ()) -> "ComponentBatch":
+        return cls(names, np.zeros(0, np.int64), np.zeros(0, np.float32), np.zeros((0, 4), np.float64))
+
+    @classmethod
+    def from_detections(
+        cls,
+        detections,
+        names: Dict[int, str],
+        offset: Tuple[int, int] = (0, 0),
+        scale: float = 1.0
+    ) -> "ComponentBatch":
+        """
+        Batch for a detector's Detections (see app.detectors) on an image
+        or tile at `offset`, scaled by `scale` to original page pixels.
+        """
+        dx, dy = offset
+        xyxy = (detections.xyxy.astype(np.float64) + np.array([dx, dy, dx, dy], np.float64)) * scale
+        size = max(names) + 1 if names else 0
+        return cls(
+            [names.get(i, str(i)) for i in range(size)],
+            detections.cls.astype(np.int64),
+            detections.conf,
+            xyxy,
+        )
+
+    @classmethod
+    def from_components(cls, components: List[Dict[str, Any]]) -> "ComponentBatch":
+        """
+        Batch for a list of component dicts (the to_components() layout).
+        """
+        detected, texts = split_components(components)
+        names: List[str] = []
+        index: Dict[str, int] = {}
+        for c in detected:
+            if c["type"] not in index:
+                index[c["type"]] = len(names)
+                names.append(c["type"])
+        dims = [c["dimensions"] for c in detected]
+        measured = [c.get("measured") or {} for c in detected]
+        return cls(
+            names,
+            np.fromiter((index[c["type"]] for c in detected), dtype=np.int64, count=len(detected)),
+            np.fromiter((c["confidence"] for c in detected), dtype=np.float32, count=len(detected)),
+            np.array([[d["x1"], d["y1"], d["x2"], d["y2"]] for d in dims], dtype=np.float64).reshape(-1, 4),
+            texts,
+            np.array(
+                [[m.get(field, np.nan) for field in MEASURED_FIELDS] for m in measured], dtype=np.float64
+            ).reshape(-1, len(MEASURED_FIELDS)),
+        )
+
+    @classmethod
+    def concatenate(cls, batches: List["ComponentBatch"]) -> "ComponentBatch":
+        """
+        One batch with the detections of every batch in order, then their
+        text annotations. Class ids are remapped onto a shared `names`.
+        """
+        if not batches:
+            return cls.empty()
+        names: List[str] = []
+        index: Dict[str, int] = {}
+        classes = []
+        for batch in batches:
+            remap = np.empty(len(batch.names), np.int64)
+            for i, name in enumerate(batch.names):
+                if name not in index:
+                    index[name] = len(names)
+                    names.append(name)
+                remap[i] = index[name]
+            classes.append(remap[batch.cls])
+        texts: List[Dict[str, Any]] = []
+        for batch in batches:
+            texts.extend(batch.texts)
+        return cls(
+            names,
+            np.concatenate(classes),
+            np.concatenate([batch.conf for batch in batches]),
+            np.concatenate([batch.xyxy for batch in batches]),
+            texts,
+            np.concatenate([batch.measured for batch in batches]),
+        )
+
+    def take(self, rows: np.ndarray) -> "ComponentBatch":
+        """
+        Batch with only the given detection rows (an index or mask array),
+        sharing `names` and the text annotations.
+        """
+        return ComponentBatch(
+            self.names, self.cls[rows], self.conf[rows], self.xyxy[rows], self.texts, self.measured[rows]
+        )
+
+    def with_texts(self, texts: List[Dict[str, Any]]) -> "ComponentBatch":
+        return ComponentBatch(self.names, self.cls, self.conf, self.xyxy, self.texts + texts, self.measured)
+
+    def replace_texts(self, texts: List[Dict[str, Any]]) -> "ComponentBatch":
+        return ComponentBatch(self.names, self.cls, self.conf, self.xyxy, texts, self.measured)
+
+    def translated(self, dx: float, dy: float) -> "ComponentBatch":
+        """
+        Batch with every box and text annotation moved by (dx, dy) pixels.
+        """
+        if not dx and not dy:
+            return self
+        texts = []
+        for text in self.texts:
+            dims = text["dimensions"]
+            texts.append(dict(text, dimensions=dict(dims, x=dims["x"] + dx, y=dims["y"] + dy)))
+        xyxy = self.xyxy + np.array([dx, dy, dx, dy], np.float64)
+        return ComponentBatch(self.names, self.cls, self.conf, xyxy, texts, self.measured)
+
+    def to_components(self) -> List[Dict[str, Any]]:
+        """
+        The components as dicts: detections first, then text annotations.
+        """
+        return self.detection_components() + self.texts
+
+    def detection_components(self) -> List[Dict[str, Any]]:
+        """
+        The detections as dicts, without the text annotations.
+        """
+        names = self.names
+        x1, y1, x2, y2 = self.xyxy.T
+        width = x2 - x1
+        height = y2 - y1
+        components = [
+            {
+                "type": names[class_id],
+                "confidence": confidence,
+                "dimensions": {
+                    "width": w,
+                    "height": h,
+                    "area": w * h,
+                    "x1": left,
+                    "y1": top,
+                    "x2": right,
+                    "y2": bottom
+                }
+            }
+            for class_id, confidence, w, h, left, top, right, bottom in zip(
+                self.cls.tolist(), self.conf.tolist(), width.tolist(), height.tolist(),
+                x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist(),
+            )
+        ]
+        # Only components with a measurement get a "measured" entry
+        has_measurement = ~np.isnan(self.measured)
+        for i in np.flatnonzero(has_measurement.any(axis=1)).tolist():
+            components[i]["measured"] = {
+                field: value
+                for field, value, present in zip(MEASURED_FIELDS, self.measured[i].tolist(), has_measurement[i])
+                if present
+            }
+        return components
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Columnar, JSON-serializable form; see from_dict().
+        """
+        return {
+            "names": self.names,
+            "cls": self.cls.tolist(),
+            "conf": self.conf.tolist(),
+            "xyxy": self.xyxy.ravel().tolist(),
+            # NaN isn't valid JSON
+            "measured": [None if np.isnan(v) else v for v in self.measured.ravel().tolist()],
+            "texts": self.texts,
+        }
+
+    def to_bytes(self) -> bytes:
+        """
+        Compact binary form of the detections, for storing with a project:
+        a zlib-compressed header, names, int32 class ids, float32
+        confidences, float64 boxes (kept exact, so re-pricing reproduces
+        the original estimate) and float64 measurements. Text annotations
+        are left out; they are never priced.
+        """
+        names = "\n".join(self.names).encode()
+        header = BINARY_HEADER.pack(BINARY_MAGIC, len(self.cls), len(names))
+        return zlib.compress(b"".join([
+            header,
+            names,
+            self.cls.astype("<i4").tobytes(),
+            self.conf.astype("<f4").tobytes(),
+            self.xyxy.astype("<f8").tobytes(),
+            self.measured.astype("<f8").tobytes(),
+        ]), BINARY_COMPRESSION)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ComponentBatch":
+        """
+        Read what to_bytes() wrote, in this or an older layout. Raises
+        ValueError for anything else, including truncated data.
+        """
+        try:
+            data = zlib.decompress(data)
+        except zlib.error as e:
+            raise ValueError(f"Not a serialized ComponentBatch: {str(e)}") from e
+        if len(data) < BINARY_HEADER.size:
+            raise ValueError("Not a serialized ComponentBatch")
+        magic, count, names_size = BINARY_HEADER.unpack_from(data)
+        fields = BINARY_FIELDS.get(magic)
+        if fields is None:
+            raise ValueError("Not a serialized ComponentBatch")
+        if len(data) != BINARY_HEADER.size + names_size + count * (40 + 8 * fields):
+            raise ValueError("Serialized ComponentBatch has the wrong size")
+        offset = BINARY_HEADER.size
+        names = data[offset:offset + names_size].decode().split("\n") if names_size else []
+        offset += names_size
+        cls_ids = np.frombuffer(data, "<i4", count, offset).astype(np.int64)
+        offset += 4 * count
+        if count and not (0 <= cls_ids.min() and cls_ids.max() < len(names)):
+            raise ValueError("Serialized ComponentBatch has class ids without a name")
+        conf = np.frombuffer(data, "<f4", count, offset).astype(np.float32)
+        offset += 4 * count
+        xyxy = np.frombuffer(data, "<f8", 4 * count, offset).reshape(-1, 4).astype(np.float64)
+        offset += 32 * count
+        measured = np.full((count, len(MEASURED_FIELDS)), np.nan)
+        if fields:
+            measured[:, :fields] = np.frombuffer(data, "<f8", fields * count, offset).reshape(-1, fields)
+        return cls(names, cls_ids, conf, xyxy, measured=measured)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ComponentBatch":
+        return cls(
+            data["names"],
+            np.array(data["cls"], dtype=np.int64),
+            np.array(data["conf"], dtype=np.float32),
+            np.array(data["xyxy"], dtype=np.float64).reshape(-1, 4),
+            data["texts"],
+            np.array(data["measured"], dtype=np.float64).reshape(-1, len(MEASURED_FIELDS)),
+        )
+
+
+def split_components(components: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split a list of component dicts into detections and text annotations.
+    """
+    detected = [c for c in components if c["type"] != TEXT_ANNOTATION]
+    texts = [c for c in components if c["type"] == TEXT_ANNOTATION]
+    return detected, texts
+
+
+def page_text(
+    texts: List[Dict[str, Any]],
+    include: bool = True,
+    offset: int = 0,
+    limit: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    The window of text annotations to return, and a summary of it:
+    {"total", "offset", "returned"}. With `include` off none are returned.
+    """
+    if not include:
+        page: List[Dict[str, Any]] = []
+        offset = 0
+    else:
+        page = texts[offset:] if limit is None else texts[offset:offset + limit]
+    return page, {"total": len(texts), "offset": offset, "returned": len(page)}
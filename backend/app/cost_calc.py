@@ -1,7 +1,15 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 from sqlalchemy.orm import Session
-from .models import MaterialCost, LaborCost, EquipmentCost, IndirectCost
+from .price_catalog import catalog
+from .cost_engine import (
+    RateTable, ComponentArrays, price_columns, format_breakdown, breakdown_rows, breakdown_summary,
+    grand_total, component_quantities, sweep_costs
+)
+from .components import ComponentBatch
+from .metrics import timed_stage
+import numpy as np
 import logging
+import os
 import random
 
 logger = logging.getLogger(__name__)
@@ -15,16 +23,14 @@ def get_material_cost(
     """
     Get the cost for a specific material in a given region.
     """
-    material = db.query(MaterialCost).filter(
-        MaterialCost.name == material_name,
-        MaterialCost.region == region
-    ).first()
+    catalog.ensure_loaded(db)
+    unit_cost = catalog.get("material", material_name, region)
     
-    if not material:
+    if unit_cost is None:
         logger.warning(f"Material cost not found for {material_name} in {region}")
         return 0.0
         
-    return material.unit_cost * quantity
+    return unit_cost * quantity
 
 def get_labor_cost(
     db: Session,
@@ -35,16 +41,14 @@ def get_labor_cost(
     """
     Get the labor cost for a specific trade in a given region.
     """
-    labor = db.query(LaborCost).filter(
-        LaborCost.trade == trade,
-        LaborCost.region == region
-    ).first()
+    catalog.ensure_loaded(db)
+    hourly_rate = catalog.get("labor", trade, region)
     
-    if not labor:
+    if hourly_rate is None:
         logger.warning(f"Labor cost not found for {trade} in {region}")
         return 0.0
         
-    return labor.hourly_rate * hours
+    return hourly_rate * hours
 
 def get_equipment_cost(
     db: Session,
@@ -55,16 +59,14 @@ def get_equipment_cost(
     """
     Get the equipment rental cost for a specific piece of equipment.
     """
-    equipment = db.query(EquipmentCost).filter(
-        EquipmentCost.name == equipment_name,
-        EquipmentCost.region == region
-    ).first()
+    catalog.ensure_loaded(db)
+    daily_rate = catalog.get("equipment", equipment_name, region)
     
-    if not equipment:
+    if daily_rate is None:
         logger.warning(f"Equipment cost not found for {equipment_name} in {region}")
         return 0.0
         
-    return equipment.daily_rate * days
+    return daily_rate * days
 
 def get_indirect_costs(
     db: Session,
@@ -74,173 +76,306 @@ def get_indirect_costs(
     """
     Calculate indirect costs as percentages of direct costs.
     """
-    indirect_costs = db.query(IndirectCost).filter(
-        IndirectCost.region == region
-    ).all()
+    catalog.ensure_loaded(db)
     
     result = {}
     total_percentage = 0.0
     
-    for cost in indirect_costs:
-        amount = direct_cost * (cost.percentage / 100.0)
-        result[cost.name] = amount
-        total_percentage += cost.percentage
+    for name, percentage in catalog.indirect(region):
+        amount = direct_cost * (percentage / 100.0)
+        result[name] = amount
+        total_percentage += percentage
     
     result["total"] = sum(result.values())
     result["total_percentage"] = total_percentage
     
     return result
 
+# Cost rates per component type ($ per square meter unless counted per piece)
+COST_RATES = {
+    "wall": {
+        "material": {"rate": 95, "unit": "m2", "includes": ["drywall", "insulation", "paint"]},
+        "labor": {"rate": 45, "unit": "m2", "hours_per_unit": 1.2},
+        "equipment": {"rate": 0, "unit": "day"},
+        "area": {"per_piece": False}  # Standard wall area
+    },
+    "floor": {
+        "material": {"rate": 65, "unit": "m2", "includes": ["subfloor", "finish flooring"]},
+        "labor": {"rate": 30, "unit": "m2", "hours_per_unit": 0.8},
+        "equipment": {"rate": 5, "unit": "day"},
+        "area": {"per_piece": False}  # Floor area is width * length
+    },
+    "window": {
+        "material": {"rate": 350, "unit": "piece", "includes": ["frame", "glass", "hardware"]},
+        "labor": {"rate": 120, "unit": "piece", "hours_per_unit": 3},
+        "equipment": {"rate": 0, "unit": "day"},
+        "area": {"per_piece": True}  # Windows are counted as pieces
+    },
+    "door": {
+        "material": {"rate": 250, "unit": "piece", "includes": ["door", "frame", "hardware"]},
+        "labor": {"rate": 85, "unit": "piece", "hours_per_unit": 2.5},
+        "equipment": {"rate": 0, "unit": "day"},
+        "area": {"per_piece": True}  # Doors are counted as pieces
+    },
+    "kitchen": {
+        "material": {"rate": 450, "unit": "m2", "includes": ["cabinets", "countertops", "fixtures"]},
+        "labor": {"rate": 200, "unit": "m2", "hours_per_unit": 4},
+        "equipment": {"rate": 10, "unit": "day"},
+        "area": {"per_piece": False}  # Kitchen area is floor space
+    },
+    "bathroom": {
+        "material": {"rate": 550, "unit": "m2", "includes": ["fixtures", "tile", "plumbing"]},
+        "labor": {"rate": 250, "unit": "m2", "hours_per_unit": 5},
+        "equipment": {"rate": 15, "unit": "day"},
+        "area": {"per_piece": False}  # Bathroom area is floor space
+    },
+    "ceiling": {
+        "material": {"rate": 45, "unit": "piece", "includes": ["drywall", "paint"]},
+        "labor": {"rate": 35, "unit": "piece", "hours_per_unit": 0.9},
+        "equipment": {"rate": 0, "unit": "day"},
+        "area": {"per_piece": True}  # Ceiling is now counted as pieces
+    },
+    "roof": {
+        "material": {"rate": 120, "unit": "m2", "includes": ["shingles", "underlayment"]},
+        "labor": {"rate": 65, "unit": "m2", "hours_per_unit": 1.5},
+        "equipment": {"rate": 10, "unit": "day"},
+        "area": {"per_piece": False, "factor": 1.15}  # Roof area with 15% extra for slope
+    }
+}
+
+# Regional cost factors
+REGIONAL_FACTORS = {
+    "default": 1.0,
+    "amsterdam": 1.2,
+    "rotterdam": 1.15,
+    "utrecht": 1.1,
+    "denhaag": 1.15
+}
+
+# Indirect costs as fractions of the direct cost
+INDIRECT_RATES = {
+    "overhead": 0.12,     # 12% overhead
+    "profit": 0.10,       # 10% profit
+    "contingency": 0.08,  # 8% contingency
+    "permits": 0.02,      # 2% permits
+    "insurance": 0.03,    # 3% insurance
+}
+INDIRECT_TOTAL_PERCENTAGE = 35  # Total of all percentages
+
+# Largest region x rate x indirect grid one sweep may price
+SCENARIO_MAX = int(os.getenv("SCENARIO_MAX", "100000"))
+
+# Compiled once at import; see app.cost_engine
+RATE_TABLE = RateTable(COST_RATES)
+
+Components = Union[ComponentBatch, List[Dict[str, Any]]]
+
+def component_arrays(components: Components) -> ComponentArrays:
+    if isinstance(components, ComponentBatch):
+        return ComponentArrays.from_batch(components, RATE_TABLE)
+    return ComponentArrays.from_components(components, RATE_TABLE)
+
 def calculate_costs(
-    components: List[Dict[str, Any]],
+    components: Components,
     region: str = "default"
 ) -> Dict[str, Any]:
     """
-    Calculate total construction costs based on detected components.
+    Calculate total construction costs based on detected components,
+    given as a ComponentBatch or a list of component dicts.
     All dimensions are calculated in square meters except for ceiling.
     """
     try:
-        breakdown = []
-        total_direct_cost = 0.0
-        
-        # More accurate cost rates ($ per square meter)
-        cost_rates = {
-            "wall": {
-                "material": {"rate": 95, "unit": "m2", "includes": ["drywall", "insulation", "paint"]},
-                "labor": {"rate": 45, "unit": "m2", "hours_per_unit": 1.2},
-                "equipment": {"rate": 0, "unit": "day"},
-                "calculate_area": lambda w, h: w * h  # Standard wall area
-            },
-            "floor": {
-                "material": {"rate": 65, "unit": "m2", "includes": ["subfloor", "finish flooring"]},
-                "labor": {"rate": 30, "unit": "m2", "hours_per_unit": 0.8},
-                "equipment": {"rate": 5, "unit": "day"},
-                "calculate_area": lambda w, h: w * h  # Floor area is width * length
-            },
-            "window": {
-                "material": {"rate": 350, "unit": "piece", "includes": ["frame", "glass", "hardware"]},
-                "labor": {"rate": 120, "unit": "piece", "hours_per_unit": 3},
-                "equipment": {"rate": 0, "unit": "day"},
-                "calculate_area": lambda w, h: 1  # Windows are counted as pieces
-            },
-            "door": {
-                "material": {"rate": 250, "unit": "piece", "includes": ["door", "frame", "hardware"]},
-                "labor": {"rate": 85, "unit": "piece", "hours_per_unit": 2.5},
-                "equipment": {"rate": 0, "unit": "day"},
-                "calculate_area": lambda w, h: 1  # Doors are counted as pieces
-            },
-            "kitchen": {
-                "material": {"rate": 450, "unit": "m2", "includes": ["cabinets", "countertops", "fixtures"]},
-                "labor": {"rate": 200, "unit": "m2", "hours_per_unit": 4},
-                "equipment": {"rate": 10, "unit": "day"},
-                "calculate_area": lambda w, h: w * h  # Kitchen area is floor space
-            },
-            "bathroom": {
-                "material": {"rate": 550, "unit": "m2", "includes": ["fixtures", "tile", "plumbing"]},
-                "labor": {"rate": 250, "unit": "m2", "hours_per_unit": 5},
-                "equipment": {"rate": 15, "unit": "day"},
-                "calculate_area": lambda w, h: w * h  # Bathroom area is floor space
-            },
-            "ceiling": {
-                "material": {"rate": 45, "unit": "piece", "includes": ["drywall", "paint"]},
-                "labor": {"rate": 35, "unit": "piece", "hours_per_unit": 0.9},
-                "equipment": {"rate": 0, "unit": "day"},
-                "calculate_area": lambda w, h: 1  # Ceiling is now counted as pieces
-            },
-            "roof": {
-                "material": {"rate": 120, "unit": "m2", "includes": ["shingles", "underlayment"]},
-                "labor": {"rate": 65, "unit": "m2", "hours_per_unit": 1.5},
-                "equipment": {"rate": 10, "unit": "day"},
-                "calculate_area": lambda w, h: w * h * 1.15  # Roof area with 15% extra for slope
-            }
-        }
-        
-        # Regional cost factors
-        regional_factors = {
-            "default": 1.0,
-            "amsterdam": 1.2,
-            "rotterdam": 1.15,
-            "utrecht": 1.1,
-            "denhaag": 1.15
-        }
-        
-        region_factor = regional_factors.get(region.lower(), 1.0)
-        
-        # Process each detected component
-        for component in components:
-            component_type = component["type"]
-            dimensions = component.get("dimensions", {})
-            
-            # Skip non-physical components
-            if component_type == "text_annotation":
-                continue
-                
-            # Get cost rates for this component
-            rates = cost_rates.get(component_type)
-            if not rates:
-                logger.warning(f"No cost data for component type: {component_type}")
-                continue
-            
-            # Get dimensions in meters
-            width = dimensions.get("width", 0) * 0.001  # Convert mm to meters
-            height = dimensions.get("height", 0) * 0.001  # Convert mm to meters
-            
-            # Calculate area using component-specific calculation
-            area = rates["calculate_area"](width, height)
-            
-            # Calculate costs with regional adjustment
-            material_cost = rates["material"]["rate"] * area * region_factor
-            labor_hours = rates["labor"]["hours_per_unit"] * area
-            labor_cost = rates["labor"]["rate"] * labor_hours * region_factor
-            equipment_cost = rates["equipment"]["rate"] * (labor_hours / 8) * region_factor  # Assuming 8-hour workday
-            
-            # Calculate total for this component
-            component_total = material_cost + labor_cost + equipment_cost
-            total_direct_cost += component_total
-            
-            breakdown.append({
-                "component": component_type,
-                "dimensions": {
-                    "width": round(width, 2),
-                    "height": round(height, 2),
-                    "area": round(area, 2)
-                },
-                "unit": rates["material"]["unit"],
-                "material_cost": round(material_cost, 2),
-                "labor_cost": round(labor_cost, 2),
-                "equipment_cost": round(equipment_cost, 2),
-                "total": round(component_total, 2),
-                "includes": rates["material"]["includes"]
-            })
-        
-        # Calculate indirect costs
-        indirect_costs = {
-            "overhead": round(total_direct_cost * 0.12, 2),  # 12% overhead
-            "profit": round(total_direct_cost * 0.10, 2),    # 10% profit
-            "contingency": round(total_direct_cost * 0.08, 2),  # 8% contingency
-            "permits": round(total_direct_cost * 0.02, 2),      # 2% permits
-            "insurance": round(total_direct_cost * 0.03, 2),    # 3% insurance
-        }
-        
-        indirect_costs["total"] = sum(indirect_costs.values())
-        indirect_costs["total_percentage"] = 35  # Total of all percentages
-        
-        # Prepare final result
-        result = {
-            "breakdown": breakdown,
-            "direct_costs": {
-                "total": round(total_direct_cost, 2),
-                "material_total": round(sum(item["material_cost"] for item in breakdown), 2),
-                "labor_total": round(sum(item["labor_cost"] for item in breakdown), 2),
-                "equipment_total": round(sum(item["equipment_cost"] for item in breakdown), 2)
-            },
-            "indirect_costs": indirect_costs,
-            "total_cost": round(total_direct_cost + indirect_costs["total"], 2),
-            "region_factor": region_factor
-        }
-        
-        return result
+        with timed_stage("costing"):
+            region_factor = REGIONAL_FACTORS.get(region.lower(), 1.0)
+            batch = component_arrays(components)
+            columns = price_columns(RATE_TABLE, batch, region_factor)
+            return format_breakdown(columns, region_factor, INDIRECT_RATES, INDIRECT_TOTAL_PERCENTAGE)
         
     except Exception as e:
         logger.error(f"Error calculating costs: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+def calculate_costs_chunked(
+    components: Components,
+    region: str = "default",
+    chunk_size: int = 1000
+) -> Tuple[Dict[str, Any], int, Iterator[List[Dict[str, Any]]]]:
+    """
+    calculate_costs() for consumers that write the breakdown out as they
+    go (see app.exports): returns the result without its "breakdown", the
+    number of breakdown entries, and an iterator over the entries in
+    lists of at most `chunk_size`, so the full list is never built.
+    """
+    try:
+        with timed_stage("costing"):
+            region_factor = REGIONAL_FACTORS.get(region.lower(), 1.0)
+            columns = price_columns(RATE_TABLE, component_arrays(components), region_factor)
+            summary = breakdown_summary(columns, region_factor, INDIRECT_RATES, INDIRECT_TOTAL_PERCENTAGE)
+
+    except Exception as e:
+        logger.error(f"Error calculating costs: {str(e)}")
+        raise
+
+    rows = len(columns.type_index)
+    chunks = (
+        breakdown_rows(columns, start, start + chunk_size)
+        for start in range(0, rows, max(1, chunk_size))
+    )
+    return summary, rows, chunks
+
+def _price_drawings(drawings: List[Components], regions: Union[str, List[str]]):
+    """
+    Price the components of many drawings in one vectorized pass.
+    Returns the region factor and the [start, stop) range of priced rows
+    of each drawing, and the priced columns.
+    """
+    if isinstance(regions, str):
+        regions = [regions] * len(drawings)
+    if len(regions) != len(drawings):
+        raise ValueError("Expected one region per drawing")
+
+    factors = [REGIONAL_FACTORS.get(region.lower(), 1.0) for region in regions]
+    batches = [component_arrays(components) for components in drawings]
+    batch = ComponentArrays.concatenate(batches)
+    per_component = np.repeat(np.array(factors, dtype=np.float64), [len(b) for b in batches])
+    columns = price_columns(RATE_TABLE, batch, per_component)
+
+    ranges = []
+    start = 0
+    for b in batches:
+        stop = start + int(np.count_nonzero(b.type_index >= 0))
+        ranges.append((start, stop))
+        start = stop
+    return factors, ranges, columns
+
+def calculate_costs_batch(
+    drawings: List[Components],
+    regions: Union[str, List[str]] = "default"
+) -> List[Dict[str, Any]]:
+    """
+    Price many drawings in one call. `regions` is a single region for all
+    drawings or one region per drawing. Returns one calculate_costs result
+    per drawing, in order.
+    """
+    try:
+        factors, ranges, columns = _price_drawings(drawings, regions)
+        return [
+            format_breakdown(columns, factor, INDIRECT_RATES, INDIRECT_TOTAL_PERCENTAGE, start, stop)
+            for factor, (start, stop) in zip(factors, ranges)
+        ]
+
+    except Exception as e:
+        logger.error(f"Error calculating costs: {str(e)}")
+        raise
+
+def calculate_totals_batch(
+    drawings: List[Components],
+    regions: Union[str, List[str]] = "default"
+) -> List[float]:
+    """
+    calculate_costs_batch() reduced to each drawing's "total_cost", for
+    bulk re-pricing where the breakdowns aren't needed.
+    """
+    try:
+        _, ranges, columns = _price_drawings(drawings, regions)
+        return [grand_total(columns, INDIRECT_RATES, start, stop) for start, stop in ranges]
+
+    except Exception as e:
+        logger.error(f"Error calculating costs: {str(e)}")
+        raise
+
+def _rate_matrices(rate_scenarios: List[Dict[str, Any]]):
+    """
+    (S, types) material, labor and equipment rate matrices for the rate
+    scenarios. Each scenario starts from COST_RATES, replaces the rates
+    given per type in "rates" (e.g. {"wall": {"material": 110}}) and then
+    applies its "material_multiplier", "labor_multiplier" and
+    "equipment_multiplier".
+    """
+    count = len(rate_scenarios)
+    matrices = {
+        "material": np.tile(RATE_TABLE.material_rate, (count, 1)),
+        "labor": np.tile(RATE_TABLE.labor_rate, (count, 1)),
+        "equipment": np.tile(RATE_TABLE.equipment_rate, (count, 1)),
+    }
+    for row, scenario in enumerate(rate_scenarios):
+        for component_type, rates in (scenario.get("rates") or {}).items():
+            if component_type not in RATE_TABLE.index:
+                raise ValueError(f"Unknown component type '{component_type}' in rate scenario {row}")
+            for kind, rate in rates.items():
+                if kind not in matrices:
+                    raise ValueError(f"Unknown rate '{kind}' for {component_type}; expected material, labor or equipment")
+                matrices[kind][row, RATE_TABLE.index[component_type]] = float(rate)
+        for kind, matrix in matrices.items():
+            matrix[row] *= float(scenario.get(f"{kind}_multiplier", 1.0))
+    return matrices["material"], matrices["labor"], matrices["equipment"]
+
+def _indirect_matrix(indirect_scenarios: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    (I, K) matrix of indirect cost fractions. Each scenario's "rates"
+    override or add to INDIRECT_RATES, e.g. {"profit": 0.08}.
+    """
+    names = list(INDIRECT_RATES)
+    for scenario in indirect_scenarios:
+        names.extend(name for name in (scenario.get("rates") or {}) if name not in names)
+    matrix = np.zeros((len(indirect_scenarios), len(names)), dtype=np.float64)
+    for row, scenario in enumerate(indirect_scenarios):
+        rates = {**INDIRECT_RATES, **(scenario.get("rates") or {})}
+        matrix[row] = [float(rates.get(name, 0.0)) for name in names]
+    return matrix
+
+def calculate_scenarios(
+    components: Components,
+    regions: Optional[List[str]] = None,
+    rate_scenarios: Optional[List[Dict[str, Any]]] = None,
+    indirect_scenarios: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Price one drawing for every combination of regions (default: all of
+    REGIONAL_FACTORS), rate scenarios and indirect cost scenarios in one
+    vectorized pass. With no scenarios given the current rates are used.
+
+    Returns a columnar table: "dimensions" lists the names along each
+    axis, and row n of "columns" is the combination
+    np.unravel_index(n, "shape"), whose indices are also given in the
+    "region", "rate_scenario" and "indirect_scenario" columns.
+    """
+    regions = [region.lower() for region in (regions or REGIONAL_FACTORS)]
+    unknown = [region for region in regions if region not in REGIONAL_FACTORS]
+    if unknown:
+        raise ValueError(f"Unknown regions: {', '.join(unknown)}")
+    rate_scenarios = rate_scenarios or [{"name": "current"}]
+    indirect_scenarios = indirect_scenarios or [{"name": "current"}]
+
+    shape = (len(regions), len(rate_scenarios), len(indirect_scenarios))
+    count = shape[0] * shape[1] * shape[2]
+    if count > SCENARIO_MAX:
+        raise ValueError(f"{count} scenarios requested; at most {SCENARIO_MAX} per sweep")
+
+    quantities = component_quantities(RATE_TABLE, component_arrays(components))
+    material_rates, labor_rates, equipment_rates = _rate_matrices(rate_scenarios)
+    columns = sweep_costs(
+        quantities,
+        np.array([REGIONAL_FACTORS[region] for region in regions], dtype=np.float64),
+        material_rates,
+        labor_rates,
+        equipment_rates,
+        _indirect_matrix(indirect_scenarios),
+    )
+    index = np.indices(shape).reshape(3, -1)
+
+    return {
+        "count": count,
+        "shape": list(shape),
+        "dimensions": {
+            "region": regions,
+            "rate_scenario": [s.get("name", str(i)) for i, s in enumerate(rate_scenarios)],
+            "indirect_scenario": [s.get("name", str(i)) for i, s in enumerate(indirect_scenarios)],
+        },
+        "columns": {
+            "region": index[0],
+            "rate_scenario": index[1],
+            "indirect_scenario": index[2],
+            **columns,
+        },
+    }
@@ -0,0 +1,422 @@
+from typing import List, Dict, Any, Optional, Sequence
+import logging
+
+import numpy as np
+
+from .components import ComponentBatch, MEASURED_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Sentinel type indices in a ComponentArrays batch
+TEXT_ANNOTATION = -2
+UNKNOWN_TYPE = -1
+
+MM_TO_M = 0.001
+
+# Component amounts priced at once per chunk of a cost sweep (8 bytes each, a few arrays)
+SWEEP_CHUNK_ELEMENTS = 1 << 20
+
+
+class RateTable:
+    """
+    Cost rates compiled into arrays indexed by component type.
+
+    Built once from a cost_rates mapping (see cost_calc.COST_RATES) so
+    pricing a batch is a handful of NumPy operations instead of a dict
+    walk per component.
+    """
+
+    def __init__(self, cost_rates: Dict[str, Dict[str, Any]]):
+        self.types: List[str] = list(cost_rates)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.types)}
+
+        rates = [cost_rates[name] for name in self.types]
+        self.material_rate = np.array([r["material"]["rate"] for r in rates], dtype=np.float64)
+        self.labor_rate = np.array([r["labor"]["rate"] for r in rates], dtype=np.float64)
+        self.hours_per_unit = np.array([r["labor"]["hours_per_unit"] for r in rates], dtype=np.float64)
+        self.equipment_rate = np.array([r["equipment"]["rate"] for r in rates], dtype=np.float64)
+        # "piece" types count 1 per component, area types use width * height
+        # times an optional factor (e.g. roof slope).
+        self.per_piece = np.array([r["area"]["per_piece"] for r in rates], dtype=bool)
+        self.area_factor = np.array([r["area"].get("factor", 1.0) for r in rates], dtype=np.float64)
+        self.unit: List[str] = [r["material"]["unit"] for r in rates]
+        self.includes: List[List[str]] = [r["material"]["includes"] for r in rates]
+
+
+class ComponentArrays:
+    """
+    Struct-of-arrays view of a component list: one type index, width and
+    height (in source units, i.e. millimetres) per component, and the
+    length (m) and area (m2) measured from the drawing's text, NaN where
+    none was linked.
+    """
+
+    def __init__(
+        self,
+        type_index: np.ndarray,
+        width: np.ndarray,
+        height: np.ndarray,
+        type_names: Sequence[str],
+        measured_length: Optional[np.ndarray] = None,
+        measured_area: Optional[np.ndarray] = None,
+    ):
+        self.type_index = type_index
+        self.width = width
+        self.height = height
+        self.type_names = type_names
+        self.measured_length = measured_length if measured_length is not None else np.full(len(type_index), np.nan)
+        self.measured_area = measured_area if measured_area is not None else np.full(len(type_index), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.type_index)
+
+    @classmethod
+    def from_components(cls, components: List[Dict[str, Any]], table: RateTable) -> "ComponentArrays":
+        index = table.index
+        type_names = [component["type"] for component in components]
+        type_index = np.fromiter(
+            (
+                TEXT_ANNOTATION if name == "text_annotation" else index.get(name, UNKNOWN_TYPE)
+                for name in type_names
+            ),
+            dtype=np.int64,
+            count=len(type_names),
+        )
+        dims = [component.get("dimensions", {}) for component in components]
+        width = np.fromiter((d.get("width", 0) for d in dims), dtype=np.float64, count=len(dims))
+        height = np.fromiter((d.get("height", 0) for d in dims), dtype=np.float64, count=len(dims))
+        measured = [component.get("measured") or {} for component in components]
+        length = np.fromiter((m.get("length", np.nan) for m in measured), dtype=np.float64, count=len(measured))
+        area = np.fromiter((m.get("area", np.nan) for m in measured), dtype=np.float64, count=len(measured))
+        return cls(type_index, width, height, type_names, length, area)
+
+    @classmethod
+    def from_batch(cls, batch: ComponentBatch, table: RateTable) -> "ComponentArrays":
+        """
+        The detections of a ComponentBatch, without building a dict per
+        component. Text annotations are never priced, so they are left out.
+        """
+        lookup = np.array([table.index.get(name, UNKNOWN_TYPE) for name in batch.names], dtype=np.int64)
+        type_index = lookup[batch.cls] if len(lookup) else np.zeros(0, np.int64)
+        return cls(
+            type_index,
+            batch.width,
+            batch.height,
+            batch.types,
+            batch.measured[:, MEASURED_FIELDS.index("length")],
+            batch.measured[:, MEASURED_FIELDS.index("area")],
+        )
+
+    @classmethod
+    def concatenate(cls, batches: List["ComponentArrays"]) -> "ComponentArrays":
+        if not batches:
+            empty = np.zeros(0)
+            return cls(empty.astype(np.int64), empty, empty, [])
+        type_names: List[str] = []
+        for batch in batches:
+            type_names.extend(batch.type_names)
+        return cls(
+            np.concatenate([b.type_index for b in batches]),
+            np.concatenate([b.width for b in batches]),
+            np.concatenate([b.height for b in batches]),
+            type_names,
+            np.concatenate([b.measured_length for b in batches]),
+            np.concatenate([b.measured_area for b in batches]),
+        )
+
+
+class PricedColumns:
+    """
+    Per-component cost columns for the priced (known, physical) components
+    of a batch, in input order.
+    """
+
+    def __init__(self, table: RateTable, type_index, width, height, area, material, labor, equipment, total):
+        self.table = table
+        self.type_index = type_index
+        self.width = width
+        self.height = height
+        self.area = area
+        self.material = material
+        self.labor = labor
+        self.equipment = equipment
+        self.total = total
+
+
+def component_area(table: RateTable, batch: ComponentArrays, priced: np.ndarray):
+    """
+    Priced quantity of the `priced` rows: 1 for piece types, otherwise
+    width * height in m2 times the type's area factor. A measured area
+    replaces width * height, and a measured length replaces the longer
+    side of the box. Returns (type index, width, height, area).
+    """
+    t = batch.type_index[priced]
+    width = batch.width[priced] * MM_TO_M
+    height = batch.height[priced] * MM_TO_M
+    # width * height * 1.0 is exact, so plain area types still match w * h
+    plan_area = width * height
+    measured_length = batch.measured_length[priced]
+    measured_area = batch.measured_area[priced]
+    if not (np.isnan(measured_length).all() and np.isnan(measured_area).all()):
+        plan_area = np.where(np.isnan(measured_length), plan_area, measured_length * np.minimum(width, height))
+        plan_area = np.where(np.isnan(measured_area), plan_area, measured_area)
+    area = np.where(table.per_piece[t], 1.0, plan_area * table.area_factor[t])
+    return t, width, height, area
+
+
+def price_columns(table: RateTable, batch: ComponentArrays, region_factor: Any) -> PricedColumns:
+    """
+    Compute material, labor and equipment columns in one pass.
+    `region_factor` is a scalar or an array with one factor per component.
+
+    The operations mirror the scalar formulas term by term so every value
+    is bit-for-bit what the per-component loop produced.
+    """
+    for i in np.flatnonzero(batch.type_index == UNKNOWN_TYPE).tolist():
+        logger.warning(f"No cost data for component type: {batch.type_names[i]}")
+
+    priced = batch.type_index >= 0
+    factor = region_factor[priced] if isinstance(region_factor, np.ndarray) else region_factor
+    t, width, height, area = component_area(table, batch, priced)
+
+    material = table.material_rate[t] * area * factor
+    labor_hours = table.hours_per_unit[t] * area
+    labor = table.labor_rate[t] * labor_hours * factor
+    equipment = table.equipment_rate[t] * (labor_hours / 8) * factor
+    total = material + labor + equipment
+
+    return PricedColumns(table, t, width, height, area, material, labor, equipment, total)
+
+
+def _round_array(values: np.ndarray) -> np.ndarray:
+    """
+    round(v, 2) for every value, vectorized, for arrays of any shape.
+
+    Python's round() is correctly rounded, while rint(v * 100) / 100 can
+    pick the wrong side when v * 100 lands within a few ulps of .5. Those
+    (rare) values are re-rounded with the builtin so results stay
+    identical; for everything else k / 100 is the same nearest double.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore", over="ignore"):
+        scaled = values * 100.0
+        rounded = np.rint(scaled) / 100.0
+        fraction = np.abs(scaled - np.floor(scaled))
+        ambiguous = (np.abs(fraction - 0.5) <= 4 * np.spacing(scaled)) | ~(np.abs(scaled) < 2.0 ** 52)
+    positions = np.flatnonzero(ambiguous)
+    if len(positions):
+        # Piece types repeat the same amounts, so round each distinct value once
+        distinct, inverse = np.unique(values.flat[positions], return_inverse=True)
+        rounded.flat[positions] = np.array([round(value, 2) for value in distinct.tolist()])[inverse]
+    return rounded
+
+
+def _round_list(values: np.ndarray) -> List[float]:
+    """
+    round(v, 2) for every value of a 1-D array, as a list.
+    """
+    return _round_array(values).tolist()
+
+
+def direct_total(totals: np.ndarray) -> float:
+    # Running sum, not pairwise: matches the original `+=` accumulation
+    return float(np.cumsum(totals)[-1]) if len(totals) else 0.0
+
+
+def indirect_breakdown(
+    total_direct_cost: float,
+    overhead_rates: Dict[str, float],
+    total_percentage: float
+) -> Dict[str, Any]:
+    indirect_costs = {
+        name: round(total_direct_cost * rate, 2)
+        for name, rate in overhead_rates.items()
+    }
+    indirect_costs["total"] = sum(indirect_costs.values())
+    indirect_costs["total_percentage"] = total_percentage
+    return indirect_costs
+
+
+def grand_total(
+    columns: PricedColumns,
+    overhead_rates: Dict[str, float],
+    start: int = 0,
+    stop: Optional[int] = None
+) -> float:
+    """
+    The "total_cost" of format_breakdown() for rows [start:stop], without
+    building the per-component breakdown.
+    """
+    total_direct_cost = direct_total(columns.total[start:stop])
+    indirect = indirect_breakdown(total_direct_cost, overhead_rates, 0)
+    return round(total_direct_cost + indirect["total"], 2)
+
+
+def breakdown_rows(columns: PricedColumns, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    The "breakdown" entries of format_breakdown() for priced rows [start:stop].
+    """
+    table = columns.table
+    rows = slice(start, stop)
+    t = columns.type_index[rows].tolist()
+    per_piece = table.per_piece[columns.type_index[rows]].tolist()
+
+    width = _round_list(columns.width[rows])
+    height = _round_list(columns.height[rows])
+    # Piece types report an integer area of 1, as the original lambdas did
+    area = [1 if piece else a for piece, a in zip(per_piece, _round_list(columns.area[rows]))]
+    material = _round_list(columns.material[rows])
+    labor = _round_list(columns.labor[rows])
+    equipment = _round_list(columns.equipment[rows])
+    total = _round_list(columns.total[rows])
+
+    return [
+        {
+            "component": table.types[i],
+            "dimensions": {
+                "width": width[n],
+                "height": height[n],
+                "area": area[n]
+            },
+            "unit": table.unit[i],
+            "material_cost": material[n],
+            "labor_cost": labor[n],
+            "equipment_cost": equipment[n],
+            "total": total[n],
+            "includes": table.includes[i]
+        }
+        for n, i in enumerate(t)
+    ]
+
+
+def breakdown_summary(
+    columns: PricedColumns,
+    region_factor: float,
+    overhead_rates: Dict[str, float],
+    total_percentage: float,
+    start: int = 0,
+    stop: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Everything format_breakdown() returns for rows [start:stop] except the
+    per-component "breakdown".
+    """
+    rows = slice(start, stop)
+    totals = columns.total[rows]
+    total_direct_cost = direct_total(totals)
+    indirect_costs = indirect_breakdown(total_direct_cost, overhead_rates, total_percentage)
+
+    return {
+        "direct_costs": {
+            "total": round(total_direct_cost, 2),
+            "material_total": round(sum(_round_list(columns.material[rows])), 2),
+            "labor_total": round(sum(_round_list(columns.labor[rows])), 2),
+            "equipment_total": round(sum(_round_list(columns.equipment[rows])), 2)
+        },
+        "indirect_costs": indirect_costs,
+        "total_cost": round(total_direct_cost + indirect_costs["total"], 2),
+        "region_factor": region_factor
+    }
+
+
+def format_breakdown(
+    columns: PricedColumns,
+    region_factor: float,
+    overhead_rates: Dict[str, float],
+    total_percentage: float,
+    start: int = 0,
+    stop: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Build the calculate_costs result for priced rows [start:stop].
+    """
+    return {
+        "breakdown": breakdown_rows(columns, start, stop),
+        **breakdown_summary(columns, region_factor, overhead_rates, total_percentage, start, stop)
+    }
+
+
+def component_quantities(table: RateTable, batch: ComponentArrays) -> Dict[str, np.ndarray]:
+    """
+    Type index, priced quantity (area in m2, or pieces) and labor hours
+    of every priced component, in input order. Every scenario of a sweep
+    prices these same quantities.
+    """
+    t, _, _, area = component_area(table, batch, batch.type_index >= 0)
+    return {
+        "type_index": t,
+        "area": area,
+        "labor_hours": table.hours_per_unit[t] * area,
+    }
+
+
+def _running_total(values: np.ndarray) -> np.ndarray:
+    # Left-to-right sum along the last axis, like sum() and direct_total()
+    if values.shape[-1] == 0:
+        return np.zeros(values.shape[:-1])
+    return np.cumsum(values, axis=-1)[..., -1]
+
+
+def sweep_costs(
+    quantities: Dict[str, np.ndarray],
+    region_factors: np.ndarray,
+    material_rates: np.ndarray,
+    labor_rates: np.ndarray,
+    equipment_rates: np.ndarray,
+    indirect_rates: np.ndarray,
+    chunk_elements: int = SWEEP_CHUNK_ELEMENTS,
+) -> Dict[str, np.ndarray]:
+    """
+    Cost totals for every combination of R region factors, S rate sets
+    (the (S, types) rate matrices) and I indirect rate sets (an (I, K)
+    matrix of fractions of the direct cost).
+
+    Each (region, rate set) pair prices every component with the same
+    operations, in the same order, as price_columns() and
+    format_breakdown(): per-component amounts, a running sum of the
+    totals, indirect costs rounded to the cent with round() semantics and
+    summed in order. Every column therefore equals the corresponding
+    value of calculate_costs() for that scenario. Pairs are priced
+    `chunk_elements` component amounts at a time to bound memory.
+    Returns flat columns of R * S * I rows in C order (region slowest,
+    indirect set fastest).
+    """
+    t = quantities["type_index"]
+    area = quantities["area"]
+    hours = quantities["labor_hours"]
+    regions, rate_sets = len(region_factors), len(material_rates)
+    pairs = regions * rate_sets
+    # (pair,) region factor and rate set of each region x rate set pair, region slowest
+    pair_factor = np.repeat(np.asarray(region_factors, dtype=np.float64), rate_sets)
+    pair_rates = np.tile(np.arange(rate_sets), regions)
+
+    totals = {name: np.zeros(pairs) for name in ("material_total", "labor_total", "equipment_total")}
+    direct = np.zeros(pairs)
+    step = max(1, chunk_elements // max(1, len(t)))
+    for start in range(0, pairs, step):
+        rows = slice(start, start + step)
+        factor = pair_factor[rows, None]
+        rates = pair_rates[rows]
+        material = material_rates[rates][:, t] * area * factor       # (pairs, N)
+        labor = labor_rates[rates][:, t] * hours * factor
+        equipment = equipment_rates[rates][:, t] * (hours / 8) * factor
+        direct[rows] = _running_total(material + labor + equipment)
+        for name, amounts in (("material_total", material), ("labor_total", labor), ("equipment_total", equipment)):
+            totals[name][rows] = _running_total(_round_array(amounts))
+
+    # (pairs, I, K) indirect costs, each rounded to the cent
+    indirect = _running_total(_round_array(direct[:, None, None] * indirect_rates))   # (pairs, I)
+    total = _round_array(direct[:, None] + indirect)
+    shape = (pairs, len(indirect_rates))
+
+    def expand(values: np.ndarray) -> np.ndarray:
+        return np.broadcast_to(_round_array(values)[:, None], shape).ravel()
+
+    return {
+        "material_total": expand(totals["material_total"]),
+        "labor_total": expand(totals["labor_total"]),
+        "equipment_total": expand(totals["equipment_total"]),
+        "direct_total": expand(direct),
+        "indirect_total": _round_array(indirect).ravel(),
+        "total_cost": total.ravel(),
+    }
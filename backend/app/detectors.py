@@ -0,0 +1,341 @@
+import ast
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .analysis_config import (
+    DETECTOR_BACKEND,
+    DETECTOR_CONF_THRESHOLD,
+    DETECTOR_IOU_THRESHOLD,
+    DETECTOR_MAX_DETECTIONS,
+)
+from .inference_pool import INFERENCE_THREADS_PER_WORKER
+
+logger = logging.getLogger(__name__)
+
+# Detector configuration
+DETECTOR_INTRA_OP_THREADS = int(os.getenv("DETECTOR_INTRA_OP_THREADS", str(INFERENCE_THREADS_PER_WORKER)))
+DETECTOR_INTER_OP_THREADS = int(os.getenv("DETECTOR_INTER_OP_THREADS", "1"))
+
+# Same fill value and coordinate offset as ultralytics' LetterBox/NMS
+LETTERBOX_FILL = 114
+MAX_WH = 7680
+
+
+class Detections:
+    """
+    Detections for one image as arrays: xyxy boxes in the input image's
+    pixel coordinates, confidences and class ids.
+    """
+
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self) -> int:
+        return len(self.conf)
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+
+
+class Detector:
+    """
+    A floor-plan detection model behind a backend-neutral interface.
+    `names` maps class ids to component types.
+    """
+
+    backend = "none"
+    names: Dict[int, str] = {}
+
+    def predict(self, images: List[np.ndarray]) -> List[Detections]:
+        raise NotImplementedError
+
+
+class UltralyticsDetector(Detector):
+    """
+    PyTorch weights (or any format ultralytics loads) run through YOLO.
+    """
+
+    backend = "ultralytics"
+
+    def __init__(self, path: str, threads: int = DETECTOR_INTRA_OP_THREADS):
+        import torch
+        from ultralytics import YOLO
+        torch.set_num_threads(threads)
+        self.model = YOLO(path)
+        self.names = dict(self.model.names)
+
+    def predict(self, images: List[np.ndarray]) -> List[Detections]:
+        detections = []
+        for result in self.model(
+            images,
+            conf=DETECTOR_CONF_THRESHOLD,
+            iou=DETECTOR_IOU_THRESHOLD,
+            max_det=DETECTOR_MAX_DETECTIONS,
+            verbose=False,
+        ):
+            boxes = result.boxes
+            detections.append(Detections(
+                boxes.xyxy.cpu().numpy(),
+                boxes.conf.cpu().numpy(),
+                boxes.cls.cpu().numpy().astype(np.int64),
+            ))
+        return detections
+
+
+def letterbox(image: np.ndarray, size: Tuple[int, int]) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """
+    Resize keeping the aspect ratio and pad to `size` (height, width),
+    centred, as ultralytics' LetterBox does. Returns the image, the gain
+    and the (x, y) padding to subtract from predicted boxes (rounded the
+    way ultralytics' scale_boxes does).
+    """
+    height, width = image.shape[:2]
+    gain = min(size[0] / height, size[1] / width)
+    new_width, new_height = int(round(width * gain)), int(round(height * gain))
+    pad_x, pad_y = (size[1] - new_width) / 2, (size[0] - new_height) / 2
+
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(LETTERBOX_FILL,) * 3)
+    offset = (round((size[1] - width * gain) / 2 - 0.1), round((size[0] - height * gain) / 2 - 0.1))
+    return image, gain, offset
+
+
+def to_input(image: np.ndarray, size: Tuple[int, int]) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """
+    Letterbox a BGR or grayscale image into a 3xHxW float32 RGB tensor
+    scaled to [0, 1].
+    """
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    else:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    image, gain, pad = letterbox(image, size)
+    tensor = image.transpose(2, 0, 1).astype(np.float32) / 255.0
+    return tensor, gain, pad
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    max_keep: Optional[int] = None
+) -> np.ndarray:
+    """
+    Indices of the boxes kept by greedy NMS, highest score first. Stops
+    after `max_keep` boxes, which gives the same boxes as running NMS to
+    the end and truncating.
+    """
+    order = np.argsort(-scores, kind="stable")
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size and (max_keep is None or len(keep) < max_keep):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        x1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(
+    output: np.ndarray,
+    gain: float,
+    pad: Tuple[float, float],
+    image_shape: Tuple[int, int],
+) -> Detections:
+    """
+    Decode one raw YOLOv8 head output (4 + classes, anchors) into
+    Detections in original image coordinates: confidence filter,
+    class-aware NMS, then undo the letterbox.
+    """
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+    cls = class_scores.argmax(axis=1)
+    conf = class_scores[np.arange(len(cls)), cls]
+    candidates = conf > DETECTOR_CONF_THRESHOLD
+    if not candidates.any():
+        return Detections.empty()
+
+    xywh = predictions[candidates, :4]
+    conf, cls = conf[candidates], cls[candidates]
+    xyxy = np.empty_like(xywh)
+    xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+    # Offsetting boxes by class keeps NMS from suppressing across classes
+    keep = non_max_suppression(xyxy + (cls * MAX_WH)[:, None], conf, DETECTOR_IOU_THRESHOLD, DETECTOR_MAX_DETECTIONS)
+    xyxy, conf, cls = xyxy[keep], conf[keep], cls[keep]
+
+    pad_x, pad_y = pad
+    xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / gain).clip(0, image_shape[1])
+    xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / gain).clip(0, image_shape[0])
+    return Detections(xyxy.astype(np.float32), conf.astype(np.float32), cls.astype(np.int64))
+
+
+class ExportedDetector(Detector):
+    """
+    Shared pre- and post-processing for exported YOLOv8 graphs, which
+    take a letterboxed RGB batch and return the raw detection head.
+    """
+
+    input_size: Tuple[int, int] = (640, 640)
+    batch_size: Optional[int] = None  # None: any batch size
+
+    def _infer(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def predict(self, images: List[np.ndarray]) -> List[Detections]:
+        inputs = [to_input(image, self.input_size) for image in images]
+        tensors = np.stack([tensor for tensor, _, _ in inputs])
+
+        if self.batch_size is None:
+            outputs = self._infer(tensors)
+        else:
+            # Fixed-batch exports: run in chunks, padding the last one
+            chunks = []
+            for i in range(0, len(tensors), self.batch_size):
+                chunk = tensors[i:i + self.batch_size]
+                if len(chunk) < self.batch_size:
+                    padding = np.zeros((self.batch_size - len(chunk),) + chunk.shape[1:], chunk.dtype)
+                    chunks.append(self._infer(np.concatenate([chunk, padding]))[:len(chunk)])
+                else:
+                    chunks.append(self._infer(chunk))
+            outputs = np.concatenate(chunks)
+
+        return [
+            postprocess(output, gain, pad, image.shape[:2])
+            for output, (_, gain, pad), image in zip(outputs, inputs, images)
+        ]
+
+
+class OnnxDetector(ExportedDetector):
+    """
+    An ONNX export run with ONNX Runtime on the CPU. Also loads INT8
+    models produced by `python -m app.model_tools quantize`.
+    """
+
+    backend = "onnxruntime"
+
+    def __init__(
+        self,
+        path: str,
+        intra_op_threads: int = DETECTOR_INTRA_OP_THREADS,
+        inter_op_threads: int = DETECTOR_INTER_OP_THREADS,
+    ):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = max(0, intra_op_threads)
+        options.inter_op_num_threads = max(0, inter_op_threads)
+        if inter_op_threads > 1:
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        self.batch_size = batch if isinstance(batch, int) else None
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if isinstance(height, int) and isinstance(width, int):
+            self.input_size = (height, width)
+        elif "imgsz" in metadata:
+            self.input_size = tuple(ast.literal_eval(metadata["imgsz"]))
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+
+    def _infer(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoDetector(ExportedDetector):
+    """
+    An OpenVINO IR export (the *_openvino_model directory ultralytics
+    writes, or its .xml file) compiled for the CPU.
+    """
+
+    backend = "openvino"
+
+    def __init__(self, path: str, threads: int = DETECTOR_INTRA_OP_THREADS):
+        import openvino as ov
+        import yaml
+
+        directory = path if os.path.isdir(path) else os.path.dirname(path)
+        xml = path if path.endswith(".xml") else next(
+            os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".xml")
+        )
+        core = ov.Core()
+        model = core.read_model(xml)
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads > 0:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.request = self.compiled.create_infer_request()
+
+        shape = model.input(0).get_partial_shape()
+        self.batch_size = shape[0].get_length() if shape[0].is_static else None
+        if shape[2].is_static and shape[3].is_static:
+            self.input_size = (shape[2].get_length(), shape[3].get_length())
+
+        metadata_path = os.path.join(directory, "metadata.yaml")
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                metadata = yaml.safe_load(f)
+            self.names = {int(k): v for k, v in metadata.get("names", {}).items()}
+            if "imgsz" in metadata and not (shape[2].is_static and shape[3].is_static):
+                self.input_size = tuple(metadata["imgsz"])
+
+    def _infer(self, batch: np.ndarray) -> np.ndarray:
+        return self.request.infer({0: batch})[self.compiled.output(0)]
+
+
+def detect_backend(path: str) -> str:
+    """
+    Backend for a model path: .onnx files use ONNX Runtime, .xml files and
+    *_openvino_model directories OpenVINO, anything else ultralytics.
+    """
+    if path.endswith(".onnx"):
+        return "onnxruntime"
+    if path.endswith(".xml") or path.rstrip("/").endswith("_openvino_model"):
+        return "openvino"
+    return "ultralytics"
+
+
+def load_detector(path: str, backend: str = DETECTOR_BACKEND, strict: bool = False) -> Optional[Detector]:
+    """
+    Load the detection model at `path` with the given backend ("auto"
+    picks one from the path). Returns None when it can't be loaded, or
+    re-raises the error with `strict`.
+    """
+    if backend == "auto":
+        backend = detect_backend(path)
+    try:
+        if backend == "onnxruntime":
+            detector = OnnxDetector(path)
+        elif backend == "openvino":
+            detector = OpenVinoDetector(path)
+        elif backend == "ultralytics":
+            detector = UltralyticsDetector(path)
+        else:
+            raise ValueError(f"Unknown detector backend: {backend}")
+    except Exception as e:
+        logger.error(f"Failed to load YOLO model: {path} ({backend}): {str(e)}")
+        if strict:
+            raise
+        return None
+    logger.info(f"Loaded detection model {path} with {backend} ({len(detector.names)} classes)")
+    return detector
@@ -0,0 +1,429 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .components import ComponentBatch
+from .cost_calc import calculate_costs_chunked, COST_RATES, REGIONAL_FACTORS, INDIRECT_RATES
+from .metrics import timed_stage
+
+logger = logging.getLogger(__name__)
+
+# Export configuration
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "export-cache"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))  # breakdown entries priced and written at a time
+EXPORT_SYNC_MAX_ROWS = int(os.getenv("EXPORT_SYNC_MAX_ROWS", "20000"))  # larger exports run as background jobs
+
+# Bump whenever the layout of the rendered files changes
+EXPORT_VERSION = "1"
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Breakdown columns: header, width in the PDF (points), width in Excel (characters)
+COLUMNS = [
+    ("Component", 110, 16),
+    ("Unit", 40, 8),
+    ("Width (m)", 62, 11),
+    ("Height (m)", 62, 11),
+    ("Quantity", 62, 11),
+    ("Material", 80, 14),
+    ("Labor", 80, 14),
+    ("Equipment", 80, 14),
+    ("Total", 86, 15),
+    ("Includes", 0, 36),
+]
+
+Chunks = Iterator[List[Dict[str, Any]]]
+
+
+def rates_fingerprint() -> str:
+    """
+    Hash of the cost rates calculate_costs() prices with, so rendered
+    files are never served for rates that changed since.
+    """
+    rates = json.dumps([COST_RATES, REGIONAL_FACTORS, INDIRECT_RATES], sort_keys=True)
+    return hashlib.sha256(rates.encode()).hexdigest()[:12]
+
+
+def row_values(entry: Dict[str, Any]) -> List[Any]:
+    dimensions = entry["dimensions"]
+    return [
+        entry["component"],
+        entry["unit"],
+        dimensions["width"],
+        dimensions["height"],
+        dimensions["area"],
+        entry["material_cost"],
+        entry["labor_cost"],
+        entry["equipment_cost"],
+        entry["total"],
+        ", ".join(entry["includes"]),
+    ]
+
+
+def summary_lines(summary: Dict[str, Any], region: str) -> List[Tuple[str, Any]]:
+    """
+    (label, amount) lines of the cost summary; a None amount is a heading.
+    """
+    direct = summary["direct_costs"]
+    indirect = summary["indirect_costs"]
+    lines = [
+        ("Region", f"{region} (factor {summary['region_factor']})"),
+        ("Direct costs", None),
+        ("Material", direct["material_total"]),
+        ("Labor", direct["labor_total"]),
+        ("Equipment", direct["equipment_total"]),
+        ("Total direct costs", direct["total"]),
+        ("Indirect costs", None),
+    ]
+    lines += [
+        (name.replace("_", " ").capitalize(), amount)
+        for name, amount in indirect.items()
+        if name not in ("total", "total_percentage")
+    ]
+    lines += [
+        ("Total indirect costs", indirect["total"]),
+        ("Total cost", summary["total_cost"]),
+    ]
+    return lines
+
+
+def write_xlsx(f, title: str, region: str, summary: Dict[str, Any], chunks: Chunks) -> None:
+    """
+    Write the breakdown as an Excel workbook with a Summary and a
+    Breakdown sheet. Uses openpyxl's write-only mode, which streams rows
+    to a temporary file instead of keeping every cell in memory.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    workbook.properties.title = title
+    bold = Font(bold=True)
+
+    def heading(sheet, text: str):
+        cell = WriteOnlyCell(sheet, value=text)
+        cell.font = bold
+        return cell
+
+    sheet = workbook.create_sheet("Summary")
+    sheet.column_dimensions["A"].width = 28
+    sheet.column_dimensions["B"].width = 24
+    sheet.append([heading(sheet, title)])
+    for label, amount in summary_lines(summary, region):
+        if amount is None:
+            sheet.append([heading(sheet, label)])
+        else:
+            sheet.append([label, round(amount, 2) if isinstance(amount, float) else amount])
+
+    sheet = workbook.create_sheet("Breakdown")
+    for n, (_, _, width) in enumerate(COLUMNS):
+        sheet.column_dimensions[chr(ord("A") + n)].width = width
+    sheet.freeze_panes = "A2"
+    sheet.append([heading(sheet, header) for header, _, _ in COLUMNS])
+    for chunk in chunks:
+        for entry in chunk:
+            sheet.append(row_values(entry))
+
+    workbook.save(f)
+
+
+def _amount(value: Any) -> str:
+    return f"{value:,.2f}" if isinstance(value, (int, float)) else str(value)
+
+
+def write_pdf(f, title: str, region: str, summary: Dict[str, Any], chunks: Chunks) -> None:
+    """
+    Write the breakdown as a landscape A4 PDF: the summary, then the
+    breakdown table over as many pages as it takes. Draws on the canvas
+    directly rather than through a platypus Table, which lays out the
+    whole table in memory first.
+    """
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    page_width, page_height = landscape(A4)
+    margin = 36
+    row_height = 11
+    font_size = 7
+
+    pdf = canvas.Canvas(f, pagesize=(page_width, page_height), pageCompression=1)
+    pdf.setTitle(title)
+    pdf.setCreator("AI Construction Cost Estimator")
+
+    # Left edge of each column; numeric columns are right-aligned at the next edge
+    edges = [margin]
+    for _, width, _ in COLUMNS:
+        edges.append(edges[-1] + width)
+    page = 1
+
+    def footer():
+        pdf.setFont("Helvetica", font_size)
+        pdf.drawString(margin, margin / 2, title)
+        pdf.drawRightString(page_width - margin, margin / 2, f"Page {page}")
+
+    def table_header(y: float) -> float:
+        pdf.setFont("Helvetica-Bold", font_size)
+        for n, (header, _, _) in enumerate(COLUMNS):
+            if n < 2 or n == len(COLUMNS) - 1:
+                pdf.drawString(edges[n] + 2, y, header)
+            else:
+                pdf.drawRightString(edges[n + 1] - 2, y, header)
+        pdf.line(margin, y - 3, page_width - margin, y - 3)
+        pdf.setFont("Helvetica", font_size)
+        return y - row_height - 2
+
+    def new_page() -> float:
+        nonlocal page
+        footer()
+        pdf.showPage()
+        page += 1
+        return table_header(page_height - margin)
+
+    y = page_height - margin - 4
+    pdf.setFont("Helvetica-Bold", 14)
+    pdf.drawString(margin, y, title)
+    y -= 24
+    for label, amount in summary_lines(summary, region):
+        if amount is None:
+            y -= 4
+            pdf.setFont("Helvetica-Bold", 9)
+            pdf.drawString(margin, y, label)
+        else:
+            pdf.setFont("Helvetica-Bold" if label.startswith("Total") else "Helvetica", 9)
+            pdf.drawString(margin + 8, y, label)
+            pdf.drawRightString(margin + 260, y, _amount(amount))
+        y -= 13
+
+    y = table_header(y - 16)
+    for chunk in chunks:
+        for entry in chunk:
+            if y < margin:
+                y = new_page()
+            values = row_values(entry)
+            pdf.drawString(edges[0] + 2, y, values[0])
+            pdf.drawString(edges[1] + 2, y, values[1])
+            for n in range(2, len(COLUMNS) - 1):
+                pdf.drawRightString(edges[n + 1] - 2, y, _amount(values[n]))
+            pdf.drawString(edges[-2] + 2, y, values[-1])
+            y -= row_height
+    footer()
+    pdf.save()
+
+
+WRITERS: Dict[str, Callable[..., None]] = {
+    "pdf": write_pdf,
+    "xlsx": write_xlsx,
+}
+
+
+def render(
+    components: ComponentBatch,
+    region: str,
+    export_format: str,
+    f,
+    title: str = "Cost estimate",
+    chunk_size: int = EXPORT_CHUNK_ROWS
+) -> int:
+    """
+    Price `components` for `region` and write the breakdown to the binary
+    file `f` as PDF or XLSX, a chunk of entries at a time. Returns the
+    number of breakdown entries.
+    """
+    summary, rows, chunks = calculate_costs_chunked(components, region, chunk_size)
+    with timed_stage("export", format=export_format, rows=rows):
+        WRITERS[export_format](f, title, region, summary, chunks)
+    return rows
+
+
+def count_rows(components: ComponentBatch) -> int:
+    """
+    Upper bound on the breakdown entries of `components`, without pricing
+    them: only detections have one, and not those of unknown types.
+    """
+    return len(components.cls)
+
+
+def safe_filename(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", name).strip("-.") or "export"
+
+
+class ExportCache:
+    """
+    Rendered exports on disk, so repeat downloads are served straight from
+    the file.
+
+    A file is keyed by project, a hash of the project's stored components
+    and the region, under a directory per EXPORT_VERSION and fingerprint of
+    the rates exports are priced with; re-attaching a project or changing
+    the rates therefore misses, and replaces the project's older files.
+    Least recently served files are removed once the directory exceeds
+    `max_bytes`. Concurrent requests for the same file render it once.
+    """
+
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = f"{EXPORT_VERSION}-{rates_fingerprint()}"
+
+        self._lock = threading.Lock()
+        self._rendering: Dict[str, threading.Lock] = {}
+
+        self.hits = 0
+        self.renders = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(project_id: int, components: bytes, region: str) -> str:
+        """
+        Key of an export within the current version directory, which
+        accounts for the rates (see rates_fingerprint()).
+        """
+        return f"{project_id}-{hashlib.sha256(components).hexdigest()[:16]}-{region}"
+
+    def path(self, key: str, export_format: str) -> str:
+        return os.path.join(self.directory, self.version, f"{key}.{export_format}")
+
+    def get(self, key: str, export_format: str) -> Optional[str]:
+        """
+        Path of the rendered file, or None when it isn't cached.
+        """
+        path = self.path(key, export_format)
+        try:
+            os.utime(path)  # least recently served goes first
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def render(self, key: str, export_format: str, write: Callable[[Any], Any]) -> str:
+        """
+        The cached file for `key`, rendered with `write(f)` first when
+        missing. Returns its path.
+        """
+        path = self.path(key, export_format)
+        with self._lock:
+            rendering = self._rendering.setdefault(path, threading.Lock())
+        with rendering:
+            if os.path.exists(path):
+                with self._lock:
+                    self.hits += 1
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Render to a temp file and rename so other workers never serve a partial file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    write(f)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+            finally:
+                with self._lock:
+                    self._rendering.pop(path, None)
+            with self._lock:
+                self.renders += 1
+        self._remove_stale(key, export_format)
+        self._evict()
+        return path
+
+    def _remove_stale(self, key: str, export_format: str) -> None:
+        """
+        Remove the project's files of the same format and region rendered
+        from older components.
+        """
+        project_id, _, region = key.split("-", 2)
+        directory = os.path.dirname(self.path(key, export_format))
+        for name in os.listdir(directory):
+            if not name.endswith(f".{export_format}") or name == f"{key}.{export_format}":
+                continue
+            parts = name[:-len(export_format) - 1].split("-", 2)
+            if len(parts) == 3 and parts[0] == project_id and parts[2] == region:
+                try:
+                    os.unlink(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self) -> None:
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue  # still being rendered
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # Older versions go first, then the least recently served
+                files.append((not root.endswith(self.version), st.st_mtime, path, st.st_size))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        files.sort(key=lambda file: (not file[0], file[1]))
+        for _, _, path, size in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": self.version,
+                "hits": self.hits,
+                "renders": self.renders,
+                "evictions": self.evictions,
+                "rendering": len(self._rendering),
+            }
+
+
+cache = ExportCache()
+
+
+def export(
+    project_id: int,
+    components: bytes,
+    region: str,
+    export_format: str,
+    title: str
+) -> Dict[str, Any]:
+    """
+    Render (or find in the cache) the export of a project's stored
+    components. Blocking; run it in a thread.
+    """
+    key = cache.key(project_id, components, region)
+    path = cache.get(key, export_format)
+    cached = path is not None
+    start = time.perf_counter()
+    if path is None:
+        batch = ComponentBatch.from_bytes(components)
+        path = cache.render(key, export_format, lambda f: render(batch, region, export_format, f, title))
+        logger.info(f"Rendered {export_format} export of project {project_id} in {time.perf_counter() - start:.2f}s")
+    return {
+        "path": path,
+        "key": key,
+        "format": export_format,
+        "media_type": MEDIA_TYPES[export_format],
+        "cached": cached,
+        "bytes": os.path.getsize(path),
+    }
@@ -0,0 +1,457 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import metrics, profiler, tracing
+
+logger = logging.getLogger(__name__)
+
+# Inference pool configuration
+INFERENCE_POOL_MODE = os.getenv("INFERENCE_POOL_MODE", "process")  # "process" or "thread"
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", str(INFERENCE_WORKERS * 2)))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "120"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))
+INFERENCE_THREADS_PER_WORKER = int(
+    os.getenv("INFERENCE_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // max(1, INFERENCE_WORKERS))))
+)
+# Load and warm the model in every worker at startup instead of on the
+# first request
+INFERENCE_PRELOAD = os.getenv("INFERENCE_PRELOAD", "true").lower() == "true"
+
+
+class PoolSaturated(Exception):
+    """
+    Raised when the admission queue is full and a request is rejected.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference pool is saturated")
+        self.retry_after = retry_after
+
+
+class WorkerLost(Exception):
+    """
+    Raised when the worker running a request died (killed for running out
+    of memory, crashed in native code). The pool starts new workers, so
+    the request can be retried.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference worker died")
+        self.retry_after = retry_after
+
+
+class InferenceTimeout(Exception):
+    """
+    Raised when a request did not finish within the configured timeout.
+    """
+
+
+class ModelUnavailable(Exception):
+    """
+    Raised by the analysis when the detection model is required but could
+    not be loaded (see ai_module.load_model).
+    """
+
+
+# Where workers send (token, stage, data) progress messages; set by
+# InferencePool.start() in thread mode and by _init_worker() in processes.
+_progress_queue = None
+
+
+def limit_threads(threads: int) -> None:
+    """
+    Limit the intra-op threads of OpenCV and PyTorch (when loaded) so
+    parallel workers don't oversubscribe the CPU.
+    """
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except Exception:
+        pass
+    if "torch" in sys.modules:
+        try:
+            sys.modules["torch"].set_num_threads(threads)
+        except Exception:
+            pass
+
+
+def _preload() -> None:
+    """
+    Load and warm up the detection model in this worker and report its
+    state to the pool over the progress queue.
+    """
+    from . import ai_module
+    status = ai_module.model_status(load=True)
+    if _progress_queue is not None:
+        _progress_queue.put((None, "model", status))
+
+
+def _init_worker(threads: int, progress_queue=None) -> None:
+    """
+    Initializer for inference processes.
+    Limits intra-op threads so the workers don't oversubscribe the CPU
+    and loads the detection model once per process.
+    """
+    global _progress_queue
+    _progress_queue = progress_queue
+
+    limit_threads(threads)
+    # Metrics recorded here are sent to the API process after each run
+    metrics.registry.forward()
+
+    _preload()
+    logger.info(f"Inference worker {os.getpid()} ready ({threads} threads)")
+
+
+class Instrumented:
+    """
+    What _run() returns when the caller traces or profiles the analysis:
+    the function's result plus the spans and the profile (collapsed
+    stacks, only when the run took at least the requested minimum)
+    captured in the worker.
+    """
+
+    def __init__(self, result: Any, seconds: float, spans: List[Dict[str, Any]], profile: Optional[Dict[str, int]]):
+        self.result = result
+        self.seconds = seconds
+        self.spans = spans
+        self.profile = profile
+
+
+def _run(
+    func_name: str,
+    args: tuple,
+    kwargs: dict,
+    progress_token: Optional[int] = None,
+    trace: bool = False,
+    profile_min_seconds: Optional[float] = None,
+) -> Any:
+    """
+    Entry point executed inside the pool. Resolves the function by name so
+    only plain data has to be pickled across the process boundary.
+    With a progress token, the function gets a `progress` callback that
+    forwards to the pool's progress queue. With `trace` or
+    `profile_min_seconds` the result comes back as Instrumented.
+    """
+    from . import ai_module
+    if progress_token is not None and _progress_queue is not None:
+        progress_queue = _progress_queue
+        kwargs = dict(kwargs, progress=lambda stage, data: progress_queue.put((progress_token, stage, data)))
+    func = getattr(ai_module, func_name)
+    try:
+        if not trace and profile_min_seconds is None:
+            return func(*args, **kwargs)
+
+        sampler = profiler.SamplingProfiler() if profile_min_seconds is not None else None
+        if sampler is not None:
+            sampler.start()
+        start = time.perf_counter()
+        try:
+            with tracing.collect(func_name) if trace else nullcontext() as collected:
+                result = func(*args, **kwargs)
+        finally:
+            counts = sampler.stop() if sampler is not None else None
+        seconds = time.perf_counter() - start
+        return Instrumented(
+            result,
+            seconds,
+            collected.spans if collected is not None else [],
+            counts if counts is not None and seconds >= profile_min_seconds else None,
+        )
+    finally:
+        updates = metrics.registry.drain()
+        if updates and _progress_queue is not None:
+            _progress_queue.put((None, "metrics", updates))
+
+
+class InferencePool:
+    """
+    Bounded executor for the blocking drawing analysis.
+
+    At most `workers` analyses run at the same time and at most `max_queue`
+    requests wait for a slot. Anything beyond that is rejected immediately
+    so the event loop (and light endpoints like /health) stay responsive.
+    """
+
+    def __init__(
+        self,
+        workers: int = INFERENCE_WORKERS,
+        max_queue: int = INFERENCE_MAX_QUEUE,
+        timeout: float = INFERENCE_TIMEOUT,
+        mode: str = INFERENCE_POOL_MODE,
+        threads_per_worker: int = INFERENCE_THREADS_PER_WORKER,
+        retry_after: int = INFERENCE_RETRY_AFTER,
+        preload: bool = INFERENCE_PRELOAD,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.mode = mode
+        self.threads_per_worker = threads_per_worker
+        self.retry_after = retry_after
+        self.preload = preload
+
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._context = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._progress = None
+        self._progress_thread: Optional[threading.Thread] = None
+        self._listeners: Dict[int, Tuple[asyncio.AbstractEventLoop, Callable[[str, Dict[str, Any]], None]]] = {}
+        self._tokens = itertools.count(1)
+        self._model: Dict[int, Dict[str, Any]] = {}  # worker pid -> ai_module.model_status()
+        self._running = 0
+        self._waiting = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._failed = 0
+        self._restarts = 0
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+
+        if self.mode != "thread":
+            self._context = multiprocessing.get_context(os.getenv("INFERENCE_START_METHOD", "spawn"))
+        self._open_progress()
+        self._executor = self._create_executor()
+        self._slots = asyncio.Semaphore(self.workers)
+        logger.info(
+            f"Inference pool started: mode={self.mode} workers={self.workers} "
+            f"max_queue={self.max_queue} timeout={self.timeout}s"
+        )
+
+    def _open_progress(self) -> None:
+        global _progress_queue
+        if self.mode == "thread":
+            self._progress = queue.SimpleQueue()
+            _progress_queue = self._progress
+        else:
+            self._progress = self._context.Queue()
+        self._progress_thread = threading.Thread(
+            target=self._dispatch_progress, args=(self._progress,), name="inference-progress", daemon=True
+        )
+        self._progress_thread.start()
+
+    def _create_executor(self) -> Executor:
+        if self.mode == "thread":
+            executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference",
+            )
+        else:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self.threads_per_worker, self._progress),
+            )
+        if self.preload:
+            # Process workers are spawned on demand, one per task that finds
+            # no idle worker, so this also starts all of them up front
+            for _ in range(self.workers if self.mode == "process" else 1):
+                executor.submit(_preload)
+        return executor
+
+    def _restart(self, broken: Executor) -> None:
+        """
+        Replace an executor that a dying worker left broken: a process
+        pool fails every pending and later task once one of its processes
+        exits unexpectedly. Only the first caller to notice replaces it.
+        """
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            logger.error("An inference worker died; starting new workers")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._model.clear()
+            self._restarts += 1
+            if self.mode != "thread":
+                # The dead process may have held the progress queue's lock;
+                # its dispatcher thread is left blocked on the old queue
+                self._open_progress()
+            self._executor = self._create_executor()
+
+    def shutdown(self) -> None:
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._slots = None
+        self._progress.put(None)
+        self._progress = None
+        self._listeners.clear()
+        self._model.clear()
+        logger.info("Inference pool stopped")
+
+    def _dispatch_progress(self, progress_queue) -> None:
+        """
+        Forward progress messages from the workers to the callbacks
+        registered by run(), on their event loops. Messages for runs that
+        already returned are dropped; those without a token are model
+        status reports from _preload() and metrics from _run().
+        """
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            token, stage, data = message
+            if token is None:
+                if stage == "metrics":
+                    metrics.registry.merge(data)
+                else:
+                    self._model[data["pid"]] = data
+                continue
+            listener = self._listeners.get(token)
+            if listener is not None:
+                loop, callback = listener
+                try:
+                    loop.call_soon_threadsafe(callback, stage, data)
+                except RuntimeError:
+                    pass  # Loop closed
+
+    async def run(
+        self,
+        func_name: str,
+        *args,
+        progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Run `ai_module.<func_name>(*args, **kwargs)` in the pool.
+        Raises PoolSaturated when the admission queue is full,
+        InferenceTimeout when the request exceeds the timeout and
+        WorkerLost when its worker died; the workers are replaced then.
+
+        `progress(stage, data)` is called on the event loop for each
+        progress message the function reports, until run() returns.
+        Within a trace, the worker's spans are added to it; while the
+        profiler is armed (see app.profiler), the run is profiled.
+        """
+        if self._executor is None:
+            self.start()
+
+        if self._running + self._waiting >= self.workers + self.max_queue:
+            self._rejected += 1
+            raise PoolSaturated(self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        self._waiting += 1
+        queued = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise InferenceTimeout(f"Timed out after {self.timeout}s waiting for a worker")
+        finally:
+            self._waiting -= 1
+            waited = time.perf_counter() - queued
+            metrics.INFERENCE_QUEUE_SECONDS.observe(waited)
+            tracing.record_span("inference_queue", waited)
+
+        # The slot is released when the work has actually finished, not when
+        # the caller gives up, so a timed-out analysis still counts against
+        # the concurrency limit until its worker is free again.
+        token = None
+        if progress is not None:
+            token = next(self._tokens)
+            self._listeners[token] = (loop, progress)
+
+        self._running += 1
+        profile_min_seconds = profiler.store.claim()
+        task = (_run, func_name, args, kwargs, token, tracing.active(), profile_min_seconds)
+        executor = self._executor
+        try:
+            future = executor.submit(*task)
+        except BrokenExecutor:
+            # A worker died after the last run finished
+            self._restart(executor)
+            executor = self._executor
+            future = executor.submit(*task)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+        try:
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(future),
+                timeout=max(0.0, deadline - loop.time()),
+            )
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise InferenceTimeout(f"Analysis did not finish within {self.timeout}s")
+        except BrokenExecutor as e:
+            self._failed += 1
+            self._restart(executor)
+            raise WorkerLost(self.retry_after) from e
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            if token is not None:
+                self._listeners.pop(token, None)
+
+        if isinstance(result, Instrumented):
+            tracing.attach(result.spans)
+            if result.profile is not None:
+                profiler.store.add(func_name, result.seconds, result.profile)
+            result = result.result
+        return result
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._completed += 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def model_status(self) -> Dict[str, Any]:
+        """
+        Detection model state across the workers. `ready` once every
+        worker has loaded and warmed it up (see ai_module.model_status),
+        or as soon as the pool runs when the model is loaded lazily.
+        """
+        reports = list(self._model.values())
+        expected = self.workers if self.mode == "process" else 1
+        errors = sorted({report["error"] for report in reports if report["error"]})
+        if self.preload:
+            ready = len(reports) >= expected and all(report["ready"] for report in reports)
+        else:
+            ready = True
+        return {
+            "ready": self._executor is not None and ready,
+            "workers_reporting": len(reports),
+            "workers_expected": expected,
+            "loaded": sum(1 for report in reports if report["loaded"]),
+            "warmed": sum(1 for report in reports if report["warmed"]),
+            "backend": next((report["backend"] for report in reports if report["backend"]), None),
+            "errors": errors,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "waiting": self._waiting,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "failed": self._failed,
+            "restarts": self._restarts,
+        }
+
+
+pool = InferencePool()
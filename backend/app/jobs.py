@@ -0,0 +1,493 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from .inference_pool import INFERENCE_WORKERS, INFERENCE_RETRY_AFTER
+
+logger = logging.getLogger(__name__)
+
+# Job configuration
+JOB_STORE = os.getenv("JOB_STORE", "memory")  # "memory" or "sqlite"
+JOB_SQLITE_PATH = os.getenv("JOB_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "estimation-jobs.sqlite3"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(INFERENCE_WORKERS)))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+# Progress stages in the order a job goes through them
+STAGES = ["decoded", "preprocessed", "detected", "ocr", "priced"]
+TERMINAL_STATUSES = ("completed", "failed")
+
+Progress = Callable[[str, Dict[str, Any]], None]
+Pipeline = Callable[[Any, Optional[str], Progress], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when JOB_MAX_PENDING jobs are already queued or running.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Too many pending jobs")
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """
+    Storage for job records and their progress events.
+
+    A job is a dict with at least id, status, stage, created_at,
+    updated_at and expires_at (epoch seconds); events are dicts with a
+    per-job increasing seq. Implementations must be thread-safe.
+    """
+
+    def create(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> None:
+        raise NotImplementedError
+
+    def add_event(self, job_id: str, stage: str, data: Dict[str, Any]) -> int:
+        raise NotImplementedError
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def expire(self, now: float) -> int:
+        """
+        Delete jobs whose expires_at has passed. Returns how many.
+        """
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """
+    In-process store; jobs are only visible to the worker that runs them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            self._events[job["id"]] = []
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def add_event(self, job_id: str, stage: str, data: Dict[str, Any]) -> int:
+        with self._lock:
+            events = self._events.get(job_id)
+            if events is None:
+                return 0
+            seq = len(events) + 1
+            events.append({"seq": seq, "stage": stage, "data": data, "at": time.time()})
+            return seq
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events.get(job_id, [])[after:])
+
+    def expire(self, now: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job["expires_at"] <= now]
+            for job_id in expired:
+                del self._jobs[job_id]
+                del self._events[job_id]
+            return len(expired)
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Store in a local SQLite file, so every API worker on the host can read
+    the status and events of jobs run by the others.
+    """
+
+    # Columns stored as JSON text
+    JSON_FIELDS = ("result",)
+
+    def __init__(self, path: str = JOB_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                filename TEXT,
+                preset TEXT,
+                result TEXT,
+                error TEXT,
+                project_id INTEGER,
+                owner_id INTEGER,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_jobs_expires_at ON jobs (expires_at);
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+                seq INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                data TEXT NOT NULL,
+                at REAL NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+        """)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "owner_id" not in columns:
+            # Files created before jobs had owners
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner_id INTEGER")
+        self._db.execute("PRAGMA foreign_keys=ON")
+
+    def _encode(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            name: json.dumps(value) if name in self.JSON_FIELDS and value is not None else value
+            for name, value in fields.items()
+        }
+
+    def create(self, job: Dict[str, Any]) -> None:
+        fields = self._encode(job)
+        columns = ", ".join(fields)
+        placeholders = ", ".join(f":{name}" for name in fields)
+        with self._lock:
+            self._db.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", fields)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for name in self.JSON_FIELDS:
+            if job[name] is not None:
+                job[name] = json.loads(job[name])
+        return job
+
+    def update(self, job_id: str, **fields) -> None:
+        fields = self._encode(fields)
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = :_id", dict(fields, _id=job_id))
+
+    def add_event(self, job_id: str, stage: str, data: Dict[str, Any]) -> int:
+        payload = json.dumps(data)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is None:
+                    self._db.execute("ROLLBACK")
+                    return 0
+                seq = self._db.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                self._db.execute(
+                    "INSERT INTO job_events (job_id, seq, stage, data, at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, seq, stage, payload, time.time()),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return seq
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, stage, data, at FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [{"seq": seq, "stage": stage, "data": json.loads(data), "at": at} for seq, stage, data, at in rows]
+
+    def expire(self, now: float) -> int:
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,)).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def create_store(kind: str = JOB_STORE) -> JobStore:
+    if kind == "sqlite":
+        return SQLiteJobStore()
+    if kind == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown JOB_STORE: {kind}")
+
+
+def describe(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Public view of a job record, with ISO timestamps.
+    """
+    described = dict(job)
+    for name in ("created_at", "updated_at", "expires_at"):
+        described[name] = datetime.utcfromtimestamp(job[name]).isoformat() + "Z"
+    return described
+
+
+class JobManager:
+    """
+    Runs estimation jobs (and other background work, such as large
+    exports) in the background and records their progress.
+
+    At most `workers` jobs run at once in this process (each one still goes
+    through the inference pool's own admission control) and at most
+    `max_pending` are accepted. Stage events are written in order: a stage
+    that is reported late is dropped, and stages skipped (e.g. on an
+    analysis cache hit) are filled in without data.
+    """
+
+    def __init__(
+        self,
+        store: Optional[JobStore] = None,
+        workers: int = JOB_WORKERS,
+        max_pending: int = JOB_MAX_PENDING,
+        ttl: float = JOB_TTL_SECONDS,
+    ):
+        self.store = store if store is not None else create_store()
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.ttl = ttl
+
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._subscribers: Dict[str, int] = {}
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def submit(
+        self, upload, preset: Optional[str], pipeline: Pipeline, owner_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Create a job for `upload` and start `pipeline(upload, preset,
+        progress)` in the background; the pipeline returns the result
+        with its "components" and "cost_breakdown". The job takes
+        ownership of the upload and closes it when done.
+        """
+        return await self.start(
+            lambda progress: pipeline(upload, preset, progress),
+            cleanup=upload.close,
+            filename=upload.filename,
+            preset=preset,
+            owner_id=owner_id,
+        )
+
+    async def start(
+        self,
+        work: Callable[[Progress], Awaitable[Dict[str, Any]]],
+        cleanup: Optional[Callable[[], None]] = None,
+        **fields
+    ) -> Dict[str, Any]:
+        """
+        Create a job and start `work(progress)` in the background; its
+        return value becomes the job's result. `fields` set job record
+        fields such as filename, project_id or owner_id (the id of the user
+        the job belongs to), and `cleanup` runs once the job is done (or
+        rejected).
+        """
+        if len(self._tasks) >= self.max_pending:
+            self.rejected += 1
+            if cleanup is not None:
+                cleanup()
+            raise JobQueueFull(INFERENCE_RETRY_AFTER)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "stage": None,
+            "filename": None,
+            "preset": None,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + self.ttl,
+            "result": None,
+            "error": None,
+            "project_id": None,
+            "owner_id": None,
+        }
+        job.update(fields)
+        await run_in_threadpool(self.store.create, job)
+        self._tasks[job["id"]] = asyncio.create_task(self._run(job["id"], work, cleanup))
+        return job
+
+    async def _run(
+        self,
+        job_id: str,
+        work: Callable[[Progress], Awaitable[Dict[str, Any]]],
+        cleanup: Optional[Callable[[], None]]
+    ) -> None:
+        events: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(self._write_events(job_id, events))
+        result = None
+        error = None
+        try:
+            async with self._slots:
+                await self._update(job_id, status="running")
+                result = await work(lambda stage, data: events.put_nowait((stage, data)))
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e) or type(e).__name__
+        finally:
+            events.put_nowait(None)
+            # Awaited once, here: a failed event write fails the job but
+            # must not skip recording its final status
+            (written,) = await asyncio.gather(writer, return_exceptions=True)
+            if error is None and isinstance(written, Exception):
+                error = f"Recording progress failed: {str(written) or type(written).__name__}"
+            try:
+                await self._finish(job_id, result, error)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+                self._tasks.pop(job_id, None)
+                self._notify(job_id)
+
+    async def _finish(self, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        try:
+            if error is None:
+                await self._update(job_id, status="completed", result=result)
+                await run_in_threadpool(self.store.add_event, job_id, "completed", {})
+                self.completed += 1
+            else:
+                logger.error(f"Job {job_id} failed: {error}")
+                await self._update(job_id, status="failed", error=error)
+                await run_in_threadpool(self.store.add_event, job_id, "failed", {"error": error})
+                self.failed += 1
+        except Exception as e:
+            logger.error(f"Could not record the outcome of job {job_id}: {str(e)}")
+
+    async def _write_events(self, job_id: str, events: asyncio.Queue) -> None:
+        reached = -1
+        while True:
+            message = await events.get()
+            if message is None:
+                return
+            stage, data = message
+            if stage in STAGES:
+                index = STAGES.index(stage)
+                if index <= reached:
+                    continue
+                for skipped in STAGES[reached + 1:index]:
+                    await run_in_threadpool(self.store.add_event, job_id, skipped, {})
+                reached = index
+                await self._update(job_id, stage=stage)
+            await run_in_threadpool(self.store.add_event, job_id, stage, data)
+            self._notify(job_id)
+
+    async def _update(self, job_id: str, **fields) -> None:
+        now = time.time()
+        # Any activity pushes expiry out; finished jobs are kept for a full TTL
+        await run_in_threadpool(self.store.update, job_id, updated_at=now, expires_at=now + self.ttl, **fields)
+        self._notify(job_id)
+
+    def _notify(self, job_id: str) -> None:
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    def watch(self, job_id: str) -> asyncio.Event:
+        """
+        Event set on the next change to the job made in this process. Take
+        it before reading the job so no change is missed in between.
+        """
+        return self._changed.setdefault(job_id, asyncio.Event())
+
+    def subscribe(self, job_id: str) -> None:
+        """
+        Register a subscriber that watch()es the job until it calls
+        unsubscribe(). The job's event is dropped after the last one leaves:
+        a job run by another worker is never _notify()'d in this process.
+        """
+        self._subscribers[job_id] = self._subscribers.get(job_id, 0) + 1
+
+    def unsubscribe(self, job_id: str) -> None:
+        remaining = self._subscribers.pop(job_id, 1) - 1
+        if remaining > 0:
+            self._subscribers[job_id] = remaining
+        else:
+            self._changed.pop(job_id, None)
+
+    @staticmethod
+    async def wait(changed: asyncio.Event, timeout: float = JOB_POLL_INTERVAL) -> None:
+        """
+        Wait for a watch() event, or `timeout` seconds so changes made by
+        other workers are picked up by polling the store.
+        """
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self.store.get, job_id)
+
+    async def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        return await run_in_threadpool(self.store.events, job_id, after)
+
+    async def update(self, job_id: str, **fields) -> None:
+        await self._update(job_id, **fields)
+
+    async def expire(self) -> int:
+        expired = await run_in_threadpool(self.store.expire, time.time())
+        if expired:
+            logger.info(f"Expired {expired} estimation jobs")
+        return expired
+
+    async def stats(self) -> Dict[str, Any]:
+        counts = await run_in_threadpool(self.store.counts)
+        return {
+            "store": type(self.store).__name__,
+            "active": len(self._tasks),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "jobs": counts,
+        }
+
+
+manager = JobManager()
@@ -1,15 +1,31 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional, Union
+from datetime import datetime
+import asyncio
+import json
 import logging
+import sys
 from sqlalchemy import text
-from app.database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal, get_async_db, pool_status
 
-from .auth import get_current_user, verify_api_key
-from .models import User
-from .ai_module import analyze_drawing
-from .cost_calc import calculate_costs
+from .auth import get_current_user, get_optional_user, verify_api_key, principal_cache
+from .models import User, Project
+from .cost_calc import calculate_costs, calculate_scenarios, REGIONAL_FACTORS
+from .inference_pool import pool as inference_pool, PoolSaturated, InferenceTimeout, ModelUnavailable, WorkerLost
+from .analysis_cache import cache as analysis_cache
+from .analysis_config import preset_name
+from .price_catalog import catalog as price_catalog, PRICE_CATALOG_REFRESH_SECONDS, COST_DATA_MAX_AGE, COST_DATA_BATCH_MAX
+from .uploads import SpooledUpload, receive_upload, UploadTooLarge, UnsupportedUpload, InvalidUpload
+from .jobs import manager as job_manager, describe as describe_job, JobQueueFull, TERMINAL_STATUSES, JOB_TTL_SECONDS
+from .components import ComponentBatch, split_components, page_text
+from .responses import ORJSONResponse, negotiate, weak_etag, validator_headers, not_modified
+from .repricing import reprice_projects
+from .revisions import RevisionState, diff_components, store as revision_store
+from . import exports, metrics, profiler, tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,7 +34,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="AI Construction Cost Estimator API",
     description="API for analyzing construction drawings and estimating costs",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware configuration
@@ -29,26 +46,203 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency, DB queries per request and tracing; see app.metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.on_event("startup")
+async def start_inference_pool():
+    inference_pool.start()
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    inference_pool.shutdown()
+
+async def price_catalog_refresher():
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await price_catalog.refresh_async(db)
+        except Exception as e:
+            logger.error(f"Price catalog refresh failed: {str(e)}")
+        await asyncio.sleep(PRICE_CATALOG_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def start_price_catalog():
+    # First pass loads the whole catalog, later passes are incremental
+    app.state.price_catalog_task = asyncio.create_task(price_catalog_refresher())
+
+@app.on_event("shutdown")
+async def stop_price_catalog():
+    app.state.price_catalog_task.cancel()
+
+async def job_expirer():
+    while True:
+        await asyncio.sleep(min(JOB_TTL_SECONDS / 4, 60))
+        try:
+            await job_manager.expire()
+        except Exception as e:
+            logger.error(f"Job expiry failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_job_expirer():
+    app.state.job_expirer_task = asyncio.create_task(job_expirer())
+
+@app.on_event("shutdown")
+async def stop_job_expirer():
+    app.state.job_expirer_task.cancel()
+
+HEALTH_CHECK_TIMEOUT = 2.0
+
+PRESET_PATTERN = "^(auto|fast|balanced|quality|clean)$"
+
+# Documents the multipart body read by upload_body(), which FastAPI can't
+# infer now that the file isn't an UploadFile parameter.
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+def text_options(
+    include_text: bool = Query(True, description="Include text_annotation components"),
+    text_offset: int = Query(0, ge=0, description="Index of the first text annotation to return"),
+    text_limit: Optional[int] = Query(None, ge=1, description="Maximum number of text annotations to return"),
+) -> Dict[str, Any]:
+    """
+    Query parameters that omit or paginate the text annotations in a
+    component list. Detections are always returned in full.
+    """
+    return {"include": include_text, "offset": text_offset, "limit": text_limit}
+
+def component_view(components: Union[ComponentBatch, List[Dict[str, Any]]], options: Dict[str, Any]):
+    """
+    The components to return per text_options(), and the summary of the
+    text annotations for the "text_annotations" field.
+    """
+    if isinstance(components, ComponentBatch):
+        detected, texts = components.detection_components(), components.texts
+    else:
+        detected, texts = split_components(components)
+    page, summary = page_text(texts, **options)
+    return detected + page, summary
+
+async def receive_drawing(request: Request) -> SpooledUpload:
+    """
+    Stream the "file" field into a SpooledUpload, mapping rejected
+    uploads to HTTP errors. The caller must close the upload.
+    """
+    try:
+        return await receive_upload(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"The file is too large (maximum {e.max_bytes} bytes).")
+    except UnsupportedUpload as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def upload_body(request: Request):
+    """
+    Dependency that streams the "file" field into a SpooledUpload and
+    removes it once the response has been sent.
+    """
+    upload = await receive_drawing(request)
+    try:
+        yield upload
+    finally:
+        upload.close()
+
+async def run_analysis(upload: SpooledUpload, preset: Optional[str] = None, progress=None):
+    """
+    Run the drawing analysis in the inference pool, serving repeated
+    uploads of the same file from the analysis cache. Returns the
+    components as a ComponentBatch.
+    Maps pool backpressure and timeouts to HTTP errors.
+    `progress(stage, data)` receives the analysis stage events.
+    """
+    # Keyed by the preset the analysis will use, so requests without one
+    # share entries with requests naming the PREPROCESS_PRESET default
+    key = analysis_cache.key_for_digest(upload.sha256, preset_name(preset))
+    components = await run_in_threadpool(analysis_cache.get, key)
+    if components is not None:
+        return components
+
+    components = await run_in_pool(upload, "analyze_drawing", "analyze_file", preset=preset, progress=progress)
+    await run_in_threadpool(analysis_cache.put, key, components)
+    return components
+
+async def run_in_pool(upload: SpooledUpload, in_memory: str, on_disk: str, *args, **kwargs):
+    """
+    Run an ai_module analysis function on the upload in the inference
+    pool: `on_disk` gets the path of a spooled upload, `in_memory` the
+    bytes. Maps pool backpressure and timeouts to HTTP errors.
+    """
+    if upload.path is not None:
+        # Spooled to disk: workers map the file themselves
+        call = (on_disk, upload.path)
+    elif inference_pool.mode == "thread":
+        call = (in_memory, upload.view())
+    else:
+        # Small uploads are pickled to the worker process
+        call = (in_memory, upload.view().tobytes())
+
+    try:
+        return await inference_pool.run(*call, *args, **kwargs)
+    except PoolSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="The analysis service is busy. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except WorkerLost as e:
+        logger.error(f"AI processing failed: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="The analysis worker failed. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except InferenceTimeout as e:
+        logger.error(f"AI processing timed out: {str(e)}")
+        raise HTTPException(
+            status_code=504,
+            detail="Analyzing the drawing took too long."
+        )
+    except ModelUnavailable as e:
+        logger.error(f"Detection model unavailable: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="The detection model is not available."
+        )
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the AI Construction Cost Estimator API"}
 
-@app.post("/upload-drawing")
+@app.post("/upload-drawing", openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_drawing(
-    file: UploadFile = File(...),
+    request: Request,
+    upload: SpooledUpload = Depends(upload_body),
+    preset: Optional[str] = Query(None, pattern=PRESET_PATTERN),
 ):
     """
     Upload and analyze a construction drawing.
-    Returns cost breakdown based on detected elements.
+    Returns cost breakdown based on detected elements, as JSON or
+    MessagePack (see app.responses).
     """
     try:
-        # Read file content
-        content = await file.read()
-        
         # Analyze drawing with AI
         try:
-            components = analyze_drawing(content)
+            components = await run_analysis(upload, preset)
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"AI processing failed: {str(e)}")
             raise HTTPException(
@@ -59,8 +253,10 @@ async def upload_drawing(
         # Calculate costs
         cost_breakdown = calculate_costs(components)
 
-        return cost_breakdown
+        return await negotiate(request, cost_breakdown)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing upload: {str(e)}")
         raise HTTPException(
@@ -68,21 +264,26 @@ async def upload_drawing(
             detail="An error occurred while processing your request."
         )
 
-@app.post("/floor-plans/analyze")
+@app.post("/floor-plans/analyze", openapi_extra=UPLOAD_REQUEST_BODY)
 async def analyze_floor_plan(
-    file: UploadFile = File(...),
+    request: Request,
+    upload: SpooledUpload = Depends(upload_body),
+    preset: Optional[str] = Query(None, pattern=PRESET_PATTERN),
+    text: Dict[str, Any] = Depends(text_options),
 ):
     """
     Upload and analyze a floor plan.
-    Returns analysis of the floor plan.
+    Returns analysis of the floor plan, as JSON or MessagePack. Text
+    annotations can be omitted or paged with include_text, text_offset
+    and text_limit; other pages are served from the analysis cache when
+    the same drawing is uploaded again.
     """
     try:
-        # Read file content
-        content = await file.read()
-        
         # Analyze drawing with AI
         try:
-            components = analyze_drawing(content)
+            components = await run_analysis(upload, preset)
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"AI processing failed: {str(e)}")
             raise HTTPException(
@@ -92,13 +293,17 @@ async def analyze_floor_plan(
 
         # Calculate costs
         cost_breakdown = calculate_costs(components)
+        selected, text_summary = component_view(components, text)
 
-        return {
+        return await negotiate(request, {
             "status": "success",
-            "components": components,
+            "components": selected,
+            "text_annotations": text_summary,
             "cost_breakdown": cost_breakdown
-        }
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing upload: {str(e)}")
         raise HTTPException(
@@ -106,38 +311,773 @@ async def analyze_floor_plan(
             detail="An error occurred while processing your request."
         )
 
+async def analyze_revision_upload(
+    request: Request,
+    upload: SpooledUpload,
+    preset: Optional[str],
+    text: Dict[str, Any],
+    previous: Optional[RevisionState] = None,
+    previous_id: Optional[str] = None,
+):
+    """
+    Analyze an uploaded revision (incrementally against `previous` when
+    given), store its state and build the response.
+    """
+    try:
+        components, state, tiles = await run_in_pool(
+            upload, "analyze_revision", "analyze_revision_file", previous, preset
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"AI processing failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process the drawing. Please ensure it's a valid construction plan."
+        )
+    revision_id = await run_in_threadpool(revision_store.put, state)
+
+    cost_breakdown = calculate_costs(components)
+    selected, text_summary = component_view(components, text)
+    result = {
+        "revision_id": revision_id,
+        "previous_revision_id": previous_id,
+        "components": selected,
+        "text_annotations": text_summary,
+        "cost_breakdown": cost_breakdown,
+        "tiles": tiles,
+    }
+    if previous is not None:
+        # The previous revision is priced again with today's rates, so the
+        # delta only reflects what changed in the drawing
+        previous_total = calculate_costs(previous.components)["total_cost"]
+        result["diff"] = diff_components(previous.components, components, previous.offset, state.offset)
+        result["cost_delta"] = {
+            "previous_total_cost": previous_total,
+            "total_cost": cost_breakdown["total_cost"],
+            "delta": round(cost_breakdown["total_cost"] - previous_total, 2),
+        }
+    return await negotiate(request, result)
+
+@app.post("/revisions", openapi_extra=UPLOAD_REQUEST_BODY)
+async def analyze_first_revision(
+    request: Request,
+    upload: SpooledUpload = Depends(upload_body),
+    preset: Optional[str] = Query(None, pattern=PRESET_PATTERN),
+    text: Dict[str, Any] = Depends(text_options),
+):
+    """
+    Analyze the first revision of a drawing and keep what later revisions
+    need to be analyzed incrementally. Returns its revision_id along with
+    the components and cost breakdown.
+    """
+    return await analyze_revision_upload(request, upload, preset, text)
+
+async def previous_revision(revision_id: str) -> RevisionState:
+    # A dependency ahead of upload_body, so unknown ids fail before the upload is read
+    previous = await run_in_threadpool(revision_store.get, revision_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Revision not found or expired")
+    return previous
+
+@app.post("/revisions/{revision_id}", openapi_extra=UPLOAD_REQUEST_BODY)
+async def analyze_next_revision(
+    revision_id: str,
+    request: Request,
+    previous: RevisionState = Depends(previous_revision),
+    upload: SpooledUpload = Depends(upload_body),
+    preset: Optional[str] = Query(None, pattern=PRESET_PATTERN),
+    text: Dict[str, Any] = Depends(text_options),
+):
+    """
+    Analyze a new revision of the drawing analyzed as `revision_id`,
+    re-running the analysis only where the page changed. Adds the
+    component diff against that revision and the change in total cost.
+    """
+    return await analyze_revision_upload(request, upload, preset, text, previous, revision_id)
+
+async def estimate(upload: SpooledUpload, preset: Optional[str], progress) -> dict:
+    """
+    Job pipeline: analysis followed by costing.
+    """
+    components = await run_analysis(upload, preset, progress)
+    cost_breakdown = calculate_costs(components)
+    progress("priced", {"total_cost": cost_breakdown["total_cost"]})
+    return {"components": components.to_components(), "cost_breakdown": cost_breakdown}
+
+@app.post("/jobs", status_code=202, openapi_extra=UPLOAD_REQUEST_BODY)
+async def submit_job(
+    request: Request,
+    preset: Optional[str] = Query(None, pattern=PRESET_PATTERN),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Upload a drawing for background analysis and costing.
+    Returns the job id immediately; follow it with GET /jobs/{job_id}
+    or stream its progress from GET /jobs/{job_id}/events. Jobs are only
+    visible to the user who submitted them.
+    """
+    upload = await receive_drawing(request)
+    try:
+        job = await job_manager.submit(upload, preset, estimate, owner_id=current_user.id)
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many pending jobs. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events",
+    }
+
+async def get_job_or_404(job_id: str, user: User) -> dict:
+    job = await job_manager.get(job_id)
+    if job is None or job.get("owner_id") != user.id:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+def estimation_result(job: dict) -> dict:
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, not completed")
+    if "components" not in job["result"]:
+        raise HTTPException(status_code=409, detail="Job is not an estimation job")
+    return job["result"]
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    request: Request,
+    text: Dict[str, Any] = Depends(text_options),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Status of a job, with its result once completed. The text
+    annotations in the result can be omitted or paged like those of
+    /floor-plans/analyze.
+    """
+    job = describe_job(await get_job_or_404(job_id, current_user))
+    if job["result"] is not None and "components" in job["result"]:
+        selected, text_summary = component_view(job["result"]["components"], text)
+        job["result"] = dict(job["result"], components=selected, text_annotations=text_summary)
+    return await negotiate(request, job)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(sse|ndjson)$"),
+    after: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Stream a job's progress events until it completes or fails, as
+    Server-Sent Events or NDJSON (by `format` or the Accept header).
+    Resumes after `after` or the Last-Event-ID header.
+    """
+    await get_job_or_404(job_id, current_user)
+    # Authenticating may have checked out a connection; don't hold it for
+    # the life of the stream
+    await db.close()
+    if format is None:
+        format = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id is not None and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+
+    async def stream():
+        seq = after
+        job_manager.subscribe(job_id)
+        try:
+            while True:
+                changed = job_manager.watch(job_id)
+                job = await job_manager.get(job_id)
+                events = await job_manager.events(job_id, seq)
+                for event in events:
+                    seq = event["seq"]
+                    if format == "sse":
+                        yield f"id: {seq}\nevent: {event['stage']}\ndata: {json.dumps(event['data'])}\n\n"
+                    else:
+                        yield json.dumps(event) + "\n"
+                    if event["stage"] in TERMINAL_STATUSES:
+                        return
+                if job is None:
+                    expired = {"seq": seq, "stage": "expired", "data": {}}
+                    yield "event: expired\ndata: {}\n\n" if format == "sse" else json.dumps(expired) + "\n"
+                    return
+                if job["status"] in TERMINAL_STATUSES and not events and seq > 0:
+                    # Resumed after the final event
+                    previous = await job_manager.events(job_id, seq - 1)
+                    if previous and previous[0]["stage"] in TERMINAL_STATUSES:
+                        return
+                if await request.is_disconnected():
+                    return
+                await job_manager.wait(changed)
+        finally:
+            job_manager.unsubscribe(job_id)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.post("/jobs/{job_id}/project")
+async def attach_job_to_project(
+    job_id: str,
+    project_id: Optional[int] = None,
+    name: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Store a completed job's total cost and detected components on one of
+    the user's projects, or on a new project when no project_id is given.
+    The project can then be re-priced without re-running the analysis.
+    Both the job and the project must belong to the user.
+    """
+    # The job's owner is checked before anything is read from it or any
+    # project is touched
+    job = await get_job_or_404(job_id, current_user)
+    result = estimation_result(job)
+    total_cost = result["cost_breakdown"]["total_cost"]
+    components = ComponentBatch.from_components(result["components"]).to_bytes()
+    fields = {"total_cost": total_cost, "components": components, "region": "default", "priced_at": datetime.utcnow()}
+
+    if project_id is None:
+        project = Project(user_id=current_user.id, name=name or job["filename"], **fields)
+        db.add(project)
+    else:
+        project = await get_project_or_404(db, project_id, current_user)
+        for field, value in fields.items():
+            setattr(project, field, value)
+        if name:
+            project.name = name
+    await db.commit()
+
+    await job_manager.update(job_id, project_id=project.id)
+    return {"job_id": job_id, "project_id": project.id, "total_cost": total_cost}
+
+async def get_project_or_404(db: AsyncSession, project_id: int, user: User) -> Project:
+    project = await db.get(Project, project_id)
+    if project is None or project.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+def stored_components(project: Project) -> bytes:
+    if project.components is None:
+        raise HTTPException(
+            status_code=409,
+            detail="The project has no stored components; attach an estimation job to it first."
+        )
+    return project.components
+
+def check_region(region: str) -> str:
+    if region.lower() not in REGIONAL_FACTORS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown region '{region}'. Known regions: {', '.join(REGIONAL_FACTORS)}"
+        )
+    return region.lower()
+
+@app.post("/projects/{project_id}/estimate")
+async def reestimate_project(
+    project_id: int,
+    request: Request,
+    region: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Re-price a project from its stored components with the current rates,
+    for `region` or the region it was last priced for. Only the costing
+    stage runs; the drawing is not analyzed again.
+    """
+    project = await get_project_or_404(db, project_id, current_user)
+    components = ComponentBatch.from_bytes(stored_components(project))
+    region = check_region(region or project.region or "default")
+
+    cost_breakdown = calculate_costs(components, region)
+    project.total_cost = cost_breakdown["total_cost"]
+    project.region = region
+    project.priced_at = datetime.utcnow()
+    await db.commit()
+
+    return await negotiate(request, {
+        "project_id": project.id,
+        "region": region,
+        "priced_at": project.priced_at.isoformat() + "Z",
+        "total_cost": project.total_cost,
+        "cost_breakdown": cost_breakdown,
+    })
+
+@app.post("/projects/reprice")
+async def reprice_user_projects(
+    region: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Re-price all of the user's projects that have stored components, for
+    `region` or each project's own region. See app.repricing for the
+    table-wide version run after a catalog update.
+    """
+    if region is not None:
+        region = check_region(region)
+    return await run_in_threadpool(reprice_projects, region=region, user_id=current_user.id)
+
+async def sweep_scenarios(request: Request, components: Union[ComponentBatch, List[Dict[str, Any]]], grid: Dict[str, Any]):
+    try:
+        table = calculate_scenarios(
+            components,
+            grid.get("regions"),
+            grid.get("rate_scenarios"),
+            grid.get("indirect_scenarios"),
+        )
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid scenario grid: {str(e)}")
+    return await negotiate(request, table)
+
+@app.post("/scenarios")
+async def cost_scenarios(
+    request: Request,
+    grid: Dict[str, Any] = Body(...),
+    current_user: Optional[User] = Depends(get_optional_user),
+):
+    """
+    What-if cost table for one drawing across regions, rate scenarios and
+    indirect cost scenarios. The drawing is given as "components" (the
+    list an analysis returns) or as the "job_id" of a completed job of the
+    authenticated user; see cost_calc.calculate_scenarios for the grid and
+    the table layout.
+    """
+    if grid.get("job_id") is not None:
+        if current_user is None:
+            raise HTTPException(
+                status_code=401,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        job = await get_job_or_404(str(grid["job_id"]), current_user)
+        components = estimation_result(job)["components"]
+    elif isinstance(grid.get("components"), list):
+        components = grid["components"]
+    else:
+        raise HTTPException(status_code=400, detail="Give the drawing as 'components' or 'job_id'")
+    return await sweep_scenarios(request, components, grid)
+
+@app.post("/projects/{project_id}/scenarios")
+async def project_cost_scenarios(
+    project_id: int,
+    request: Request,
+    grid: Dict[str, Any] = Body(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    What-if cost table for a project's stored components; see /scenarios.
+    """
+    project = await get_project_or_404(db, project_id, current_user)
+    return await sweep_scenarios(request, ComponentBatch.from_bytes(stored_components(project)), grid)
+
+EXPORT_FORMAT_PATTERN = "^(pdf|xlsx)$"
+
+def export_file_response(project: Project, region: str, rendered: Dict[str, Any]) -> FileResponse:
+    filename = exports.safe_filename(f"{project.name or 'project'}-{region}") + f".{rendered['format']}"
+    return FileResponse(
+        rendered["path"],
+        media_type=rendered["media_type"],
+        filename=filename,
+        headers={"X-Export-Cache": "hit" if rendered["cached"] else "miss", "Cache-Control": "private"},
+    )
+
+async def queue_export(project: Project, region: str, export_format: str) -> JSONResponse:
+    """
+    Render a project export as a background job. The job's result links
+    to GET /jobs/{job_id}/export.
+    """
+    components = stored_components(project)
+    project_id, title = project.id, project.name or f"Project {project.id}"
+    filename = exports.safe_filename(f"{title}-{region}") + f".{export_format}"
+
+    async def work(progress):
+        progress("rendering", {"format": export_format, "region": region})
+        rendered = await run_in_threadpool(
+            exports.export, project_id, components, region, export_format, title
+        )
+        return {"export": {
+            "project_id": project_id,
+            "region": region,
+            "format": export_format,
+            "filename": filename,
+            "bytes": rendered["bytes"],
+            "key": rendered["key"],
+        }}
+
+    try:
+        job = await job_manager.start(work, filename=filename, project_id=project_id, owner_id=project.user_id)
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many pending jobs. Please retry shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    return JSONResponse(status_code=202, content={
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events",
+        "download_url": f"/jobs/{job['id']}/export",
+    })
+
+@app.get("/projects/{project_id}/export")
+async def export_project(
+    project_id: int,
+    format: str = Query("pdf", pattern=EXPORT_FORMAT_PATTERN),
+    region: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Download a project's cost breakdown, priced like POST
+    /projects/{project_id}/estimate, as a PDF or Excel file. Rendered
+    files are cached per project components, region and cost rates, so
+    repeat downloads are served from disk. Breakdowns of more than
+    EXPORT_SYNC_MAX_ROWS components that aren't cached yet are rendered
+    as a background job instead: the response is then 202 with the job.
+    """
+    project = await get_project_or_404(db, project_id, current_user)
+    components = stored_components(project)
+    region = check_region(region or project.region or "default")
+
+    key = exports.cache.key(project.id, components, region)
+    if exports.cache.get(key, format) is None:
+        rows = exports.count_rows(ComponentBatch.from_bytes(components))
+        if rows > exports.EXPORT_SYNC_MAX_ROWS:
+            return await queue_export(project, region, format)
+
+    rendered = await run_in_threadpool(
+        exports.export, project.id, components, region, format, project.name or f"Project {project.id}"
+    )
+    return export_file_response(project, region, rendered)
+
+@app.post("/projects/{project_id}/exports", status_code=202)
+async def submit_project_export(
+    project_id: int,
+    format: str = Query("pdf", pattern=EXPORT_FORMAT_PATTERN),
+    region: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Render a project export (see GET /projects/{project_id}/export) as a
+    background job, whatever its size. Follow the job like an estimation
+    job and download the file from GET /jobs/{job_id}/export.
+    """
+    project = await get_project_or_404(db, project_id, current_user)
+    region = check_region(region or project.region or "default")
+    return await queue_export(project, region, format)
+
+@app.get("/jobs/{job_id}/export")
+async def download_job_export(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Download the file rendered by an export job.
+    """
+    job = await get_job_or_404(job_id, current_user)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, not completed")
+    export = job["result"].get("export")
+    if export is None:
+        raise HTTPException(status_code=409, detail="Job is not an export job")
+    project = await get_project_or_404(db, export["project_id"], current_user)
+    path = exports.cache.get(export["key"], export["format"])
+    if path is None:
+        raise HTTPException(status_code=410, detail="The export was evicted from the cache; request it again")
+    return export_file_response(project, export["region"], {
+        "path": path,
+        "format": export["format"],
+        "media_type": exports.MEDIA_TYPES[export["format"]],
+        "cached": True,
+    })
+
+async def cost_data_response(
+    request: Request,
+    db: AsyncSession,
+    lookups: List[Any],
+    single: bool = False,
+):
+    """
+    Look up (item, region) pairs in the price catalog snapshot and return
+    them with an ETag and Last-Modified derived from the rows'
+    last_updated, or 304 when the client's copy is still current.
+    """
+    await price_catalog.ensure_loaded_async(db)
+    entries = []
+    missing = []
+    for item, region in lookups:
+        entry = price_catalog.cost_data(item, region)
+        if entry is None:
+            missing.append({"item": item, "region": region})
+        else:
+            entries.append(entry)
+    if single and not entries:
+        item, region = lookups[0]
+        raise HTTPException(status_code=404, detail=f"No cost data for '{item}' in region '{region}'")
+
+    stamps = [entry["last_updated"] for entry in entries if entry["last_updated"] is not None]
+    last_modified = max(stamps) if stamps else None
+    # The rates are part of the tag too: deleting one of an item's rows
+    # doesn't move its last_updated
+    etag = weak_etag(*lookups, *entries)
+    headers = validator_headers(etag, last_modified, COST_DATA_MAX_AGE)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    for entry in entries:
+        if entry["last_updated"] is not None:
+            entry["last_updated"] = entry["last_updated"].isoformat() + "Z"
+    if single:
+        content = entries[0]
+    else:
+        content = {
+            "items": entries,
+            "missing": missing,
+            "last_updated": last_modified.isoformat() + "Z" if last_modified is not None else None,
+        }
+    return await negotiate(request, content, headers=headers)
+
+def cost_data_lookups(items: List[str], regions: List[str]) -> List[Any]:
+    """
+    Every (item, region) pair of `items` x `regions`, in order and without
+    duplicates. Entries may also be comma-separated lists.
+    """
+    items = list(dict.fromkeys(name.strip() for value in items for name in value.split(",") if name.strip()))
+    regions = list(dict.fromkeys(name.strip() for value in regions for name in value.split(",") if name.strip()))
+    if not items:
+        raise HTTPException(status_code=400, detail="Give at least one item")
+    regions = regions or ["default"]
+    if len(items) * len(regions) > COST_DATA_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(items)} items x {len(regions)} regions exceeds the limit of {COST_DATA_BATCH_MAX} lookups"
+        )
+    return [(item, region) for item in items for region in regions]
+
+@app.get("/cost-data")
+async def get_cost_batch(
+    request: Request,
+    item: List[str] = Query([]),
+    region: List[str] = Query([]),
+    api_key: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Cost data for many items in many regions at once: every combination
+    of the `item` and `region` parameters (repeated or comma-separated;
+    region defaults to "default"). Pairs with no data are listed under
+    "missing". Revalidate with If-None-Match or If-Modified-Since.
+    """
+    return await cost_data_response(request, db, cost_data_lookups(item, region))
+
+@app.post("/cost-data/batch")
+async def post_cost_batch(
+    request: Request,
+    lookup: Dict[str, Any] = Body(...),
+    api_key: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    GET /cost-data for lists too long for a URL, given as
+    {"items": [...], "regions": [...]}.
+    """
+    items, regions = lookup.get("items"), lookup.get("regions") or []
+    if not isinstance(items, list) or not isinstance(regions, list):
+        raise HTTPException(status_code=400, detail="'items' and 'regions' must be lists of names")
+    return await cost_data_response(request, db, cost_data_lookups([str(i) for i in items], [str(r) for r in regions]))
+
 @app.get("/cost-data/{item_name}")
 async def get_cost(
     item_name: str,
+    request: Request,
+    region: str = "default",
     api_key: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Get cost data for a specific construction item.
-    DEMO version that returns mock data.
+    Get cost data for a specific construction item in a region: its unit
+    cost, labor rate and equipment rate from the material, labor and
+    equipment tables, served from the in-memory price catalog. Carries an
+    ETag and Last-Modified; revalidate with If-None-Match or
+    If-Modified-Since.
     """
-    # Demo cost data
-    cost_data = {
-        "wall": {"unit_cost": 95, "labor_rate": 45, "equipment_rate": 0},
-        "floor": {"unit_cost": 65, "labor_rate": 30, "equipment_rate": 5},
-        "window": {"unit_cost": 350, "labor_rate": 120, "equipment_rate": 0},
-        "door": {"unit_cost": 250, "labor_rate": 85, "equipment_rate": 0},
+    return await cost_data_response(request, db, [(item_name, region)], single=True)
+
+@app.get("/stats")
+async def stats():
+    result = {
+        "inference_pool": inference_pool.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "price_catalog": price_catalog.stats(),
+        "database_pool": pool_status(),
+        "principal_cache": principal_cache.stats(),
+        "jobs": await job_manager.stats(),
+        "exports": exports.cache.stats(),
+        "model": inference_pool.model_status(),
     }
-    
-    if item_name not in cost_data:
-        return {"item": item_name, "unit_cost": 100, "labor_rate": 50, "equipment_rate": 10}
-    
-    return {"item": item_name, **cost_data[item_name]}
+    # Batching and preprocessing only happen in this process when the pool
+    # runs in thread mode
+    ai_module = sys.modules.get("app.ai_module")
+    if ai_module is not None:
+        result["batching"] = ai_module.batcher.stats()
+    preprocessing = sys.modules.get("app.preprocessing")
+    if preprocessing is not None:
+        result["preprocessing"] = preprocessing.timings.stats()
+    return result
 
-@app.get("/health")
-async def health_check():
+@metrics.registry.collector
+def collect_service_state():
+    pool_stats = inference_pool.stats()
+    for state in ("running", "waiting"):
+        metrics.INFERENCE_QUEUE.set(pool_stats[state], state=state)
+    for outcome in ("completed", "rejected", "timed_out", "failed"):
+        metrics.INFERENCE_REQUESTS.set_total(pool_stats[outcome], outcome=outcome)
+    metrics.INFERENCE_RESTARTS.set_total(pool_stats["restarts"])
+    jobs = job_manager.store.counts()
+    for status in ("queued", "running") + TERMINAL_STATUSES:
+        metrics.JOBS.set(jobs.get(status, 0), status=status)
+    export_stats = exports.cache.stats()
+    metrics.EXPORTS.set_total(export_stats["hits"], outcome="cached")
+    metrics.EXPORTS.set_total(export_stats["renders"], outcome="rendered")
+
+    model = inference_pool.model_status()
+    metrics.MODEL_READY.set(1 if model["ready"] else 0)
+    metrics.MODEL_WORKERS.set(model["workers_expected"], state="expected")
+    metrics.MODEL_WORKERS.set(model["workers_reporting"], state="reporting")
+    metrics.MODEL_WORKERS.set(model["loaded"], state="loaded")
+    metrics.MODEL_WORKERS.set(model["warmed"], state="warmed")
+    metrics.MODEL_LOAD_ERRORS.set(len(model["errors"]))
+
+    for engine, stats in pool_status().items():
+        for state in ("size", "checkedout"):
+            if state in stats:
+                metrics.DB_POOL_CONNECTIONS.set(stats[state], engine=engine, state=state)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Metrics in the Prometheus text format: analysis stage latencies,
+    component counts, request latency and DB queries per route, the
+    inference queue and the detection model state.
+    """
+    if not metrics.registry.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    # The collectors query the job store, which may be SQLite
+    text = await run_in_threadpool(metrics.registry.render)
+    return PlainTextResponse(text, media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def list_traces(
+    limit: int = Query(20, ge=1, le=200),
+    min_ms: float = Query(0.0, ge=0),
+    api_user: User = Depends(verify_api_key),
+):
+    """
+    The most recent request traces (TRACING_ENABLED), newest first,
+    optionally only those slower than `min_ms`.
+    """
+    return {"enabled": tracing.TRACING_ENABLED, "traces": tracing.store.recent(limit, min_ms)}
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str, api_user: User = Depends(verify_api_key)):
+    """
+    The spans of one trace: the request, the inference queue, the
+    analysis stages in the worker, costing, serialization and every
+    database query. Traced responses carry their id in X-Trace-Id.
+    """
+    trace = tracing.store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+@app.post("/debug/profiler")
+async def arm_profiler(
+    requests: int = Query(1, ge=1, le=100),
+    min_seconds: float = Query(0.0, ge=0),
+    expires_in: float = Query(profiler.PROFILER_ARM_SECONDS, gt=0),
+    api_user: User = Depends(verify_api_key),
+):
+    """
+    Profile the next `requests` analyses that take at least `min_seconds`,
+    in whichever inference worker runs them. Fetch the results from
+    GET /debug/profiles.
+    """
+    return profiler.store.arm(requests, min_seconds, expires_in)
+
+@app.get("/debug/profiles")
+async def list_profiles(api_user: User = Depends(verify_api_key)):
+    return {"profiler": profiler.store.status(), "profiles": profiler.store.list()}
+
+@app.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: str, api_user: User = Depends(verify_api_key)):
+    """
+    A captured profile as collapsed stacks, for flamegraph.pl or speedscope.
+    """
+    profile = profiler.store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profiler.folded(profile["counts"]))
+
+@app.post("/debug/profile")
+async def profile_api_process(
+    seconds: float = Query(5.0, gt=0, le=profiler.PROFILER_MAX_SECONDS),
+    include_idle: bool = False,
+    api_user: User = Depends(verify_api_key),
+):
+    """
+    Sample this API process for `seconds` and return its collapsed stacks:
+    the event loop, costing and serialization, and the analyses too when
+    the inference pool runs in thread mode.
+    """
+    counts = await run_in_threadpool(profiler.profile, seconds, include_idle=include_idle)
+    return PlainTextResponse(profiler.folded(counts))
+
+async def database_status() -> str:
     try:
-        return {
-            "status": "healthy",
-            "database": "healthy",
-            "version": "demo"
-        }
+        async with AsyncSessionLocal() as db:
+            await asyncio.wait_for(db.execute(text("SELECT 1")), timeout=HEALTH_CHECK_TIMEOUT)
+        return "healthy"
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.warning(f"Database health check failed: {str(e)}")
+        return "unhealthy"
+
+@app.get("/health")
+async def health_check():
+    """
+    Liveness: answers as long as the process serves requests, and reports
+    the state of the database and the detection model.
+    """
+    database = await database_status()
+    model = inference_pool.model_status()
+    return {
+        "status": "healthy" if database == "healthy" and model["ready"] else "degraded",
+        "database": database,
+        "model": model,
+        "version": "demo"
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness: 503 until the detection model is loaded and warmed up in
+    every inference worker.
+    """
+    model = inference_pool.model_status()
+    if not model["ready"]:
+        return JSONResponse(status_code=503, content={"status": "not ready", "model": model})
+    return {"status": "ready", "model": model}
 
 # Import and include your other routers here
 # ... existing code ... 
\ No newline at end of file
@@ -0,0 +1,434 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Metrics configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette adds the charset
+
+Key = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    A named metric with a fixed set of label names, holding one value per
+    combination of label values. Updates go through the registry, so a
+    worker process can buffer them for the API process (see
+    Registry.forward()).
+    """
+
+    kind = "untyped"
+
+    def __init__(self, registry: "Registry", name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Key, Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Key:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _apply(self, key: Key, value: float) -> None:
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        self.registry.update(self, self._key(labels), amount)
+
+    def set_total(self, value: float, **labels) -> None:
+        """
+        Set the total from a count kept elsewhere (for collectors).
+        """
+        with self.registry.lock:
+            self._values[self._key(labels)] = value
+
+    def _apply(self, key: Key, value: float) -> None:
+        self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self.registry.lock:
+            self._values[self._key(labels)] = value
+
+    def _apply(self, key: Key, value: float) -> None:
+        self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        self.registry.update(self, self._key(labels), value)
+
+    def _apply(self, key: Key, value: float) -> None:
+        # Per-bucket counts (not cumulative), then sum and count
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, entry in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{labels} {entry[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+
+    Inference worker processes call forward(): their updates are then
+    buffered instead of applied, drained after every analysis and merged
+    into the API process's registry (see app.inference_pool).
+    Collectors are called before rendering to set gauges from state kept
+    elsewhere, like the inference pool's queue.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._buffer: Optional[List[Tuple[str, Key, float]]] = None
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def collector(self, func: Callable[[], None]) -> Callable[[], None]:
+        self._collectors.append(func)
+        return func
+
+    def update(self, metric: Metric, key: Key, value: float) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            if self._buffer is not None:
+                self._buffer.append((metric.name, key, value))
+            else:
+                metric._apply(key, value)
+
+    def forward(self) -> None:
+        self._buffer = []
+
+    def drain(self) -> List[Tuple[str, Key, float]]:
+        with self.lock:
+            if not self._buffer:
+                return []
+            updates, self._buffer = self._buffer, []
+            return updates
+
+    def merge(self, updates: List[Tuple[str, Key, float]]) -> None:
+        """
+        Apply updates drained from another process's registry.
+        """
+        with self.lock:
+            for name, key, value in updates:
+                metric = self._metrics.get(name)
+                if metric is not None:
+                    metric._apply(tuple(key), value)
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        lines = []
+        with self.lock:
+            for metric in self._metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(metric._samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "analysis_stage_seconds",
+    "Time spent per analysis stage: decode, preprocess, detection, ocr, postprocess, costing, serialization, export",
+    ["stage"],
+)
+DRAWING_COMPONENTS = registry.histogram(
+    "analysis_components",
+    "Components found per analyzed drawing, by kind (detection or text)",
+    ["kind"],
+    COUNT_BUCKETS,
+)
+COMPONENTS_DETECTED = registry.counter(
+    "analysis_components_detected_total",
+    "Detections in analyzed drawings, by component type",
+    ["type"],
+)
+INFERENCE_QUEUE_SECONDS = registry.histogram(
+    "inference_queue_wait_seconds",
+    "Time analyses waited for a free inference worker",
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries",
+    "Database queries executed per HTTP request",
+    ["route"],
+    COUNT_BUCKETS,
+)
+HTTP_REQUEST_DB_SECONDS = registry.histogram(
+    "http_request_db_seconds",
+    "Time spent in database queries per HTTP request",
+    ["route"],
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_seconds",
+    "Database query latency by statement type",
+    ["operation"],
+)
+
+# Set from the services' own stats when /metrics is scraped
+INFERENCE_QUEUE = registry.gauge(
+    "inference_queue_depth",
+    "Analyses running in or waiting for the inference pool",
+    ["state"],
+)
+INFERENCE_REQUESTS = registry.counter(
+    "inference_requests_total",
+    "Analyses submitted to the inference pool, by outcome",
+    ["outcome"],
+)
+INFERENCE_RESTARTS = registry.counter(
+    "inference_pool_restarts_total",
+    "Times the inference workers were replaced after one of them died",
+)
+JOBS = registry.gauge("jobs", "Estimation jobs in the job store, by status", ["status"])
+EXPORTS = registry.counter(
+    "exports_total",
+    "PDF and Excel exports served, by whether they came from the export cache",
+    ["outcome"],
+)
+MODEL_READY = registry.gauge("model_ready", "1 when every inference worker has the detection model loaded and warm")
+MODEL_WORKERS = registry.gauge(
+    "model_workers",
+    "Inference workers by detection model state (expected, reporting, loaded, warmed)",
+    ["state"],
+)
+MODEL_LOAD_ERRORS = registry.gauge("model_load_errors", "Distinct errors reported while loading the detection model")
+DB_POOL_CONNECTIONS = registry.gauge(
+    "db_pool_connections",
+    "Database connection pool usage by engine (sync or async)",
+    ["engine", "state"],
+)
+
+
+def observe_stage(stage: str, seconds: float, start: Optional[float] = None) -> None:
+    """
+    Record a finished analysis stage, and a span for it when traced.
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    tracing.record_span(stage, seconds, start)
+
+
+@contextmanager
+def timed_stage(stage: str, **attributes):
+    """
+    Time the enclosed block as an analysis stage, traced as a span.
+    """
+    start = time.perf_counter()
+    with tracing.span(stage, **attributes):
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_components(batch) -> None:
+    """
+    Component counts of one analyzed drawing (a ComponentBatch).
+    """
+    DRAWING_COMPONENTS.observe(len(batch.cls), kind="detection")
+    DRAWING_COMPONENTS.observe(len(batch.texts), kind="text")
+    counts: Dict[str, int] = {}
+    for class_id in batch.cls.tolist():
+        counts[batch.names[class_id]] = counts.get(batch.names[class_id], 0) + 1
+    for component_type, count in counts.items():
+        COMPONENTS_DETECTED.inc(count, type=component_type)
+
+
+class RequestStats:
+    """
+    Database work done on behalf of the current HTTP request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set by MetricsMiddleware; the object is shared with the threads and tasks
+# the request spawns, which see a copy of its context
+_request: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = (time.perf_counter(), time.time())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_start", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started[0]
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if operation not in SQL_OPERATIONS:
+        operation = "OTHER"
+    DB_QUERY_SECONDS.observe(elapsed, operation=operation)
+    stats = _request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    tracing.record_span("db.query", elapsed, started[1], operation=operation, statement=statement[:200])
+
+
+def instrument_engine(engine) -> None:
+    """
+    Count and time every statement run on a (sync) SQLAlchemy engine; for
+    an async engine pass its sync_engine.
+    """
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+def route_name(scope: Dict[str, Any]) -> str:
+    """
+    The route template ("/jobs/{job_id}") rather than the path, so label
+    values stay bounded.
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request and counts the database
+    queries it runs, and traces it when tracing is on (see app.tracing).
+    Traced responses carry the trace id in an X-Trace-Id header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (registry.enabled or tracing.TRACING_ENABLED):
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request.set(stats)
+        status = 500
+        start = time.perf_counter()
+        try:
+            with tracing.request_trace(f"{scope['method']} {scope['path']}") as trace:
+
+                async def send_with_status(message):
+                    nonlocal status
+                    if message["type"] == "http.response.start":
+                        status = message["status"]
+                        if trace is not None:
+                            headers = list(message.get("headers", []))
+                            headers.append((b"x-trace-id", trace.id.encode()))
+                            message = dict(message, headers=headers)
+                    await send(message)
+
+                try:
+                    await self.app(scope, receive, send_with_status)
+                finally:
+                    if trace is not None:
+                        trace.name = f"{scope['method']} {route_name(scope)}"
+                        trace.root["attributes"].update(
+                            status=status, path=scope["path"], db_queries=stats.queries
+                        )
+        finally:
+            _request.reset(token)
+            route = route_name(scope)
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, method=scope["method"], route=route, status=status
+            )
+            HTTP_REQUEST_DB_QUERIES.observe(stats.queries, route=route)
+            HTTP_REQUEST_DB_SECONDS.observe(stats.db_seconds, route=route)
@@ -0,0 +1,335 @@
+"""
+Export, quantize and check the detection model for the CPU backends.
+
+    python -m app.model_tools export --weights best_floorplan_model.pt --format onnx
+    python -m app.model_tools quantize --model best_floorplan_model.onnx --calibration samples/
+    python -m app.model_tools parity --baseline best_floorplan_model.pt \\
+        --candidate best_floorplan_model.int8.onnx --images samples/
+
+Calibration and parity inputs go through the same preprocessing (and
+tiling, for large drawings) as analyze_drawing, so the quantizer sees
+the images the model will see in production.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import statistics
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .detectors import Detections, Detector, UltralyticsDetector, load_detector, to_input
+from .preprocessing import select_preset
+from .tiling import tile_grid
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def list_images(directory: str, limit: Optional[int] = None) -> List[str]:
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def model_inputs(paths: List[str], preset: Optional[str] = None) -> Iterator[np.ndarray]:
+    """
+    Preprocessed images as analyze_drawing feeds them to the detector:
+    whole drawings, or tiles for drawings above TILED_THRESHOLD.
+    """
+    from .ai_module import TILE_OVERLAP, TILE_SIZE, TILED_THRESHOLD
+
+    for path in paths:
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+        pipeline = select_preset(file_bytes, preset)
+        image = pipeline.decode(file_bytes, grayscale=True)
+        if image is None:
+            logger.warning(f"Skipping {path}: not a decodable image")
+            continue
+        height, width = image.shape[:2]
+        if max(height, width) > TILED_THRESHOLD:
+            for x0, y0, x1, y1 in tile_grid(width, height, TILE_SIZE, TILE_OVERLAP):
+                yield pipeline.run(image[y0:y1, x0:x1])
+        else:
+            yield pipeline.run(image)
+
+
+def export(weights: str, fmt: str, imgsz: int, dynamic: bool) -> str:
+    """
+    Export PyTorch weights to ONNX or OpenVINO IR with ultralytics.
+    """
+    from ultralytics import YOLO
+
+    options: Dict[str, Any] = {"format": fmt, "imgsz": imgsz, "dynamic": dynamic}
+    if fmt == "onnx":
+        options["simplify"] = True
+    return str(YOLO(weights).export(**options))
+
+
+def _head_nodes(model) -> List[str]:
+    """
+    Nodes of the detection head (the last "/model.N/" block), whose box
+    decoding loses too much accuracy when quantized.
+    """
+    blocks = [re.match(r"^/model\.(\d+)/", node.name) for node in model.graph.node]
+    last = max((int(match.group(1)) for match in blocks if match), default=None)
+    if last is None:
+        return []
+    prefix = f"/model.{last}/"
+    return [node.name for node in model.graph.node if node.name.startswith(prefix)]
+
+
+def quantize_onnx(model_path: str, output: str, samples: List[np.ndarray], exclude_head: bool = True) -> str:
+    """
+    INT8 static quantization (QDQ, per-channel weights) with ONNX Runtime,
+    calibrated on `samples`.
+    """
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static,
+    )
+
+    session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    size = tuple(model_input.shape[2:]) if all(isinstance(d, int) for d in model_input.shape[2:]) else (640, 640)
+    del session
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._inputs = iter(samples)
+
+        def get_next(self):
+            image = next(self._inputs, None)
+            if image is None:
+                return None
+            tensor, _, _ = to_input(image, size)
+            return {model_input.name: tensor[None]}
+
+    excluded = _head_nodes(onnx.load(model_path)) if exclude_head else []
+    quantize_static(
+        model_path,
+        output,
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded,
+    )
+
+    # Keep the class names and input size ultralytics stored on the export
+    source, quantized = onnx.load(model_path), onnx.load(output)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, output)
+    return output
+
+
+def quantize_openvino(model_path: str, output: str, samples: List[np.ndarray]) -> str:
+    """
+    INT8 post-training quantization of an OpenVINO IR with NNCF. `output`
+    is the directory for the quantized model.
+    """
+    import nncf
+    import openvino as ov
+
+    directory = model_path if os.path.isdir(model_path) else os.path.dirname(model_path)
+    xml = model_path if model_path.endswith(".xml") else next(
+        os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".xml")
+    )
+    model = ov.Core().read_model(xml)
+    shape = model.input(0).get_partial_shape()
+    size = (shape[2].get_length(), shape[3].get_length()) if shape[2].is_static and shape[3].is_static else (640, 640)
+
+    dataset = nncf.Dataset(samples, lambda image: to_input(image, size)[0][None])
+    quantized = nncf.quantize(
+        model,
+        dataset,
+        subset_size=len(samples),
+        preset=nncf.QuantizationPreset.MIXED,
+        # Same head exclusions as ultralytics' own INT8 OpenVINO export
+        ignored_scope=nncf.IgnoredScope(types=["Multiply", "Subtract", "Sigmoid"]),
+    )
+
+    os.makedirs(output, exist_ok=True)
+    ov.save_model(quantized, os.path.join(output, os.path.basename(xml)))
+    metadata = os.path.join(directory, "metadata.yaml")
+    if os.path.exists(metadata):
+        shutil.copy(metadata, output)
+    return output
+
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_detections(baseline: Detections, candidate: Detections, iou_threshold: float) -> List[tuple]:
+    """
+    Greedy one-to-one matching of boxes by IoU, regardless of class.
+    Returns (baseline index, candidate index, iou) triples.
+    """
+    if not len(baseline) or not len(candidate):
+        return []
+    ious = _iou_matrix(baseline.xyxy, candidate.xyxy)
+    pairs = np.argwhere(ious >= iou_threshold)
+    pairs = pairs[np.argsort(-ious[pairs[:, 0], pairs[:, 1]], kind="stable")]
+    used_baseline, used_candidate, matches = set(), set(), []
+    for i, j in pairs.tolist():
+        if i not in used_baseline and j not in used_candidate:
+            used_baseline.add(i)
+            used_candidate.add(j)
+            matches.append((i, j, float(ious[i, j])))
+    return matches
+
+
+def _timed_predict(detector: Detector, image: np.ndarray, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        detections = detector.predict([image])[0]
+        times.append(time.perf_counter() - start)
+    return detections, min(times)
+
+
+def parity(
+    baseline: Detector,
+    candidate: Detector,
+    inputs: Iterator[np.ndarray],
+    iou_threshold: float = 0.5,
+    repeat: int = 3,
+) -> Dict[str, Any]:
+    """
+    Compare a candidate detector against the baseline on the same inputs:
+    box recall/precision, class agreement of matched boxes, mean IoU and
+    confidence drift, and per-image latency of both.
+    """
+    totals = {"images": 0, "baseline_boxes": 0, "candidate_boxes": 0, "matched": 0, "same_class": 0}
+    ious, conf_deltas, baseline_times, candidate_times = [], [], [], []
+
+    warmed = False
+    for image in inputs:
+        if not warmed:
+            baseline.predict([image])
+            candidate.predict([image])
+            warmed = True
+        expected, baseline_time = _timed_predict(baseline, image, repeat)
+        actual, candidate_time = _timed_predict(candidate, image, repeat)
+        baseline_times.append(baseline_time)
+        candidate_times.append(candidate_time)
+
+        matches = match_detections(expected, actual, iou_threshold)
+        totals["images"] += 1
+        totals["baseline_boxes"] += len(expected)
+        totals["candidate_boxes"] += len(actual)
+        totals["matched"] += len(matches)
+        for i, j, iou in matches:
+            ious.append(iou)
+            conf_deltas.append(abs(float(expected.conf[i]) - float(actual.conf[j])))
+            if baseline.names.get(int(expected.cls[i])) == candidate.names.get(int(actual.cls[j])):
+                totals["same_class"] += 1
+
+    def ratio(numerator: int, denominator: int) -> float:
+        return round(numerator / denominator, 4) if denominator else 1.0
+
+    baseline_ms = statistics.median(baseline_times) * 1000 if baseline_times else 0.0
+    candidate_ms = statistics.median(candidate_times) * 1000 if candidate_times else 0.0
+    return {
+        "baseline": baseline.backend,
+        "candidate": candidate.backend,
+        **totals,
+        "box_recall": ratio(totals["matched"], totals["baseline_boxes"]),
+        "box_precision": ratio(totals["matched"], totals["candidate_boxes"]),
+        "class_agreement": ratio(totals["same_class"], totals["matched"]),
+        "mean_iou": round(statistics.fmean(ious), 4) if ious else None,
+        "mean_conf_delta": round(statistics.fmean(conf_deltas), 4) if conf_deltas else None,
+        "baseline_ms": round(baseline_ms, 2),
+        "candidate_ms": round(candidate_ms, 2),
+        "speedup": round(baseline_ms / candidate_ms, 2) if candidate_ms else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.model_tools", description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export PyTorch weights to ONNX or OpenVINO")
+    export_parser.add_argument("--weights", required=True)
+    export_parser.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    export_parser.add_argument("--imgsz", type=int, default=640)
+    export_parser.add_argument("--dynamic", action="store_true", help="dynamic batch and image size")
+
+    quantize_parser = commands.add_parser("quantize", help="INT8 static quantization calibrated on sample drawings")
+    quantize_parser.add_argument("--model", required=True, help=".onnx file or OpenVINO export")
+    quantize_parser.add_argument("--calibration", required=True, help="directory of sample drawings")
+    quantize_parser.add_argument("--output", help="output path (default: next to the model)")
+    quantize_parser.add_argument("--samples", type=int, default=300, help="maximum calibration inputs")
+    quantize_parser.add_argument("--preset", help="preprocessing preset (default: PREPROCESS_PRESET)")
+    quantize_parser.add_argument("--quantize-head", action="store_true", help="also quantize the detection head")
+
+    parity_parser = commands.add_parser("parity", help="compare a model against the PyTorch baseline")
+    parity_parser.add_argument("--baseline", required=True, help="PyTorch weights")
+    parity_parser.add_argument("--candidate", required=True, help="model to check, any backend")
+    parity_parser.add_argument("--images", required=True, help="directory of sample drawings")
+    parity_parser.add_argument("--limit", type=int, help="maximum number of drawings")
+    parity_parser.add_argument("--preset", help="preprocessing preset (default: PREPROCESS_PRESET)")
+    parity_parser.add_argument("--iou", type=float, default=0.5, help="IoU for two boxes to match")
+    parity_parser.add_argument("--repeat", type=int, default=3, help="timed runs per input (best is kept)")
+    parity_parser.add_argument("--min-agreement", type=float, default=0.0,
+                               help="exit with status 1 if recall, precision or class agreement is lower")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "export":
+        print(export(args.weights, args.format, args.imgsz, args.dynamic))
+        return 0
+
+    if args.command == "quantize":
+        samples = []
+        for image in model_inputs(list_images(args.calibration), args.preset):
+            samples.append(image)
+            if len(samples) >= args.samples:
+                break
+        if not samples:
+            parser.error(f"No calibration images in {args.calibration}")
+        logger.info(f"Calibrating on {len(samples)} inputs")
+        if args.model.endswith(".onnx"):
+            output = args.output or args.model[:-len(".onnx")] + ".int8.onnx"
+            print(quantize_onnx(args.model, output, samples, exclude_head=not args.quantize_head))
+        else:
+            output = args.output or args.model.rstrip("/").replace("_openvino_model", "") + "_int8_openvino_model"
+            print(quantize_openvino(args.model, output, samples))
+        return 0
+
+    baseline = UltralyticsDetector(args.baseline)
+    candidate = load_detector(args.candidate)
+    if candidate is None:
+        parser.error(f"Could not load {args.candidate}")
+    report = parity(
+        baseline, candidate, model_inputs(list_images(args.images, args.limit), args.preset), args.iou, args.repeat
+    )
+    print(json.dumps(report, indent=2))
+    agreement = min(report["box_recall"], report["box_precision"], report["class_agreement"])
+    return 0 if agreement >= args.min_agreement else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -21,7 +21,8 @@ class User(Base):
     region = Column(String)
     monthly_project_limit = Column(Integer, default=2)
     monthly_projects_used = Column(Integer, default=0)
-    api_key = Column(String, unique=True, nullable=True)
+    api_key = Column(String, unique=True, nullable=True)  # Legacy plain-text keys
+    api_key_hash = Column(String(64), unique=True, index=True, nullable=True)  # SHA-256 of the API key
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -36,6 +37,8 @@ class MaterialCost(Base):
     category = Column(String)  # e.g., "Afwerking", "Bouwschil", "Ruwbouw"
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (Index("ix_material_costs_name_region", "name", "region"),)
+
 class LaborCost(Base):
     __tablename__ = "labor_costs"
 
@@ -45,6 +48,8 @@ class LaborCost(Base):
     region = Column(String)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (Index("ix_labor_costs_trade_region", "trade", "region"),)
+
 class EquipmentCost(Base):
     __tablename__ = "equipment_costs"
 
@@ -54,6 +59,8 @@ class EquipmentCost(Base):
     region = Column(String)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (Index("ix_equipment_costs_name_region", "name", "region"),)
+
 class IndirectCost(Base):
     __tablename__ = "indirect_costs"
 
@@ -63,6 +70,9 @@ class IndirectCost(Base):
     region = Column(String)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Region first: indirect costs are looked up per region
+    __table_args__ = (Index("ix_indirect_costs_region_name", "region", "name"),)
+
 class Project(Base):
     __tablename__ = "projects"
 
@@ -70,6 +80,9 @@ class Project(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     name = Column(String)
     total_cost = Column(Float)
+    components = Column(LargeBinary, nullable=True)  # ComponentBatch.to_bytes() of the detections
+    region = Column(String, nullable=True)  # Region total_cost was priced for
+    priced_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
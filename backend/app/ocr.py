@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+from .analysis_config import (
+    OCR_MAX_CHAR_HEIGHT,
+    OCR_MAX_REGIONS,
+    OCR_MIN_CHAR_HEIGHT,
+    OCR_REGION_PADDING,
+    OCR_TESSERACT_CONFIG,
+)
+from .inference_pool import INFERENCE_THREADS_PER_WORKER
+from .metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# OCR configuration; every inference worker has its own OCR threads, so by
+# default they share the CPU like the detector's
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(INFERENCE_THREADS_PER_WORKER)))
+
+Region = Tuple[int, int, int, int]  # x, y, width, height
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Created lazily so forked inference workers start their own threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+        return _executor
+
+
+def find_text_regions(processed_image: np.ndarray) -> List[Region]:
+    """
+    Find candidate text regions in a binarized drawing (dark ink on white).
+
+    Connected components of character size are kept, which drops walls and
+    other long strokes, then joined horizontally into words and lines.
+    """
+    ink = cv2.bitwise_not(processed_image)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    if count <= 1:
+        return []
+
+    widths = stats[:, cv2.CC_STAT_WIDTH]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    is_char = (
+        (heights >= OCR_MIN_CHAR_HEIGHT)
+        & (heights <= OCR_MAX_CHAR_HEIGHT)
+        & (widths <= OCR_MAX_CHAR_HEIGHT * 2)
+    )
+    is_char[0] = False  # background
+    if not is_char.any():
+        return []
+
+    mask = is_char[labels].astype(np.uint8) * 255
+    gap = max(3, int(np.median(heights[is_char]) * 1.5))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (gap, 3))
+    joined = cv2.dilate(mask, kernel)
+
+    contours, _ = cv2.findContours(joined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    height, width = processed_image.shape[:2]
+    pad = OCR_REGION_PADDING
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+
+    # Reading order, so merged output is stable
+    regions.sort(key=lambda r: (r[1], r[0]))
+    return regions
+
+
+def _ocr_region(processed_image: np.ndarray, region: Region, config: str) -> List[Dict[str, Any]]:
+    """
+    OCR one region and return its words in region-local coordinates.
+    """
+    x, y, w, h = region
+    crop = processed_image[y:y + h, x:x + w]
+    text_results = pytesseract.image_to_data(crop, output_type=pytesseract.Output.DICT, config=config)
+
+    words = []
+    for i in range(len(text_results["text"])):
+        if int(text_results["conf"][i]) > 60:  # Filter low confidence text
+            words.append({
+                "text": text_results["text"][i],
+                "conf": text_results["conf"][i],
+                "left": text_results["left"][i] + x,
+                "top": text_results["top"][i] + y,
+                "width": text_results["width"][i],
+                "height": text_results["height"][i],
+            })
+    return words
+
+
+class PendingText:
+    """
+    OCR that is running in the background. Call result() to collect the
+    text annotations in page coordinates.
+    """
+
+    def __init__(self, futures: List[Future], offset: Tuple[int, int], scale: float, started: Tuple[float, float]):
+        self.futures = futures
+        self.offset = offset
+        self.scale = scale
+        # (perf_counter, wall clock) at the start, and when each region finished,
+        # so the OCR stage isn't timed as lasting until result() is called
+        self.started = started
+        self.finished: List[float] = []
+        for future in futures:
+            future.add_done_callback(lambda _: self.finished.append(time.perf_counter()))
+
+    def result(self) -> List[Dict[str, Any]]:
+        dx, dy = self.offset
+        scale = self.scale
+        components = []
+        for future in self.futures:
+            for word in future.result():
+                components.append({
+                    "type": "text_annotation",
+                    "text": word["text"],
+                    "confidence": float(word["conf"]) / 100,
+                    "dimensions": {
+                        "x": (word["left"] + dx) * scale,
+                        "y": (word["top"] + dy) * scale,
+                        "width": word["width"] * scale,
+                        "height": word["height"] * scale
+                    }
+                })
+        # Done callbacks run just after result() returns, so one may be missing
+        end = max(self.finished) if len(self.finished) == len(self.futures) and self.futures else time.perf_counter()
+        observe_stage("ocr", end - self.started[0], self.started[1])
+        return components
+
+
+def start_text_extraction(
+    processed_image: np.ndarray,
+    offset: Tuple[int, int] = (0, 0),
+    scale: float = 1.0
+) -> PendingText:
+    """
+    Find text regions and OCR them in parallel on the OCR pool without
+    waiting for the results, so detection can run at the same time.
+
+    Falls back to a single full-image pass when the region detector finds
+    more than OCR_MAX_REGIONS candidates, where per-region overhead would
+    outweigh the savings.
+    """
+    started = (time.perf_counter(), time.time())
+    regions = find_text_regions(processed_image)
+    config = OCR_TESSERACT_CONFIG
+    if len(regions) > OCR_MAX_REGIONS:
+        height, width = processed_image.shape[:2]
+        regions = [(0, 0, width, height)]
+        config = ""
+
+    executor = _get_executor()
+    futures = [executor.submit(_ocr_region, processed_image, region, config) for region in regions]
+    return PendingText(futures, offset, scale, started)
@@ -0,0 +1,219 @@
+import logging
+import re
+from typing import Dict, List
+
+import numpy as np
+
+from .analysis_config import (
+    MEASUREMENT_LINK_DISTANCE,
+    POSTPROCESS_DUPLICATE_IOU,
+    POSTPROCESS_ENABLED,
+    WALL_MERGE_ALIGNMENT,
+    WALL_MERGE_GAP,
+)
+from .components import ComponentBatch, MEASURED_FIELDS
+from .tiling import GridIndex, merge_groups
+
+logger = logging.getLogger(__name__)
+
+WALL_TYPE = "wall"
+
+# "5m", "3,5 m", "4500mm", "20m²", "20 m2", optionally labelled ("area: 20m2")
+# or as width x length ("4x3.5m")
+MEASUREMENT_PATTERN = re.compile(
+    r"^\s*(?:(?P<label>width|height|length|area|breedte|hoogte|lengte|oppervlakte)\s*[:=]?\s*)?"
+    r"(?P<first>\d+(?:[.,]\d+)?)\s*(?:[x×*]\s*(?P<second>\d+(?:[.,]\d+)?)\s*)?"
+    r"(?P<unit>mm|cm|m)(?P<square>²|2|\^2)?\s*$",
+    re.IGNORECASE,
+)
+UNIT_TO_M = {"mm": 0.001, "cm": 0.01, "m": 1.0}
+DUTCH_LABELS = {"breedte": "width", "hoogte": "height", "lengte": "length", "oppervlakte": "area"}
+
+
+def extract_measurements(text: str) -> Dict[str, float]:
+    """
+    Parse a measurement from OCR text, in metres and square metres.
+
+    "5m" and "length: 5000mm" give {"length": 5.0}; "width 3,5m" gives
+    {"width": 3.5}; "20m²" and "area: 20 m2" give {"area": 20.0}; "4x3m"
+    gives {"width": 4.0, "length": 3.0, "area": 12.0}. Returns {} when
+    the text isn't a measurement.
+    """
+    match = MEASUREMENT_PATTERN.match(text)
+    if match is None:
+        return {}
+    label = match.group("label")
+    label = DUTCH_LABELS.get(label.lower(), label.lower()) if label else None
+    scale = UNIT_TO_M[match.group("unit").lower()]
+    first = float(match.group("first").replace(",", ".")) * scale
+    second = match.group("second")
+
+    if match.group("square"):
+        if second is not None:
+            return {}
+        # mm² etc. scale by the unit squared
+        return {"area": first * scale}
+    if second is not None:
+        second = float(second.replace(",", ".")) * scale
+        return {"width": first, "length": second, "area": first * second}
+    if label == "area":
+        return {}
+    return {label or "length": first}
+
+
+def pair_iou(xyxy: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    a = xyxy[pairs[:, 0]]
+    b = xyxy[pairs[:, 1]]
+    w = np.maximum(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0)
+    h = np.maximum(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0)
+    inter = w * h
+    union = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def _interval_iou(a0: np.ndarray, a1: np.ndarray, b0: np.ndarray, b1: np.ndarray) -> np.ndarray:
+    inter = np.maximum(np.minimum(a1, b1) - np.maximum(a0, b0), 0)
+    union = np.maximum(a1, b1) - np.minimum(a0, b0)
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def suppress_duplicates(batch: ComponentBatch, iou_threshold: float = POSTPROCESS_DUPLICATE_IOU) -> ComponentBatch:
+    """
+    Drop detections that overlap a more confident detection of any class
+    by at least `iou_threshold`, so the same wall found as "wall" and as
+    "floor" (or twice) is priced once. Greedy, most confident first, like
+    NMS; only pairs that share a grid cell are compared.
+    """
+    if len(batch.cls) < 2:
+        return batch
+    pairs = GridIndex(batch.xyxy).pairs()
+    pairs = pairs[pair_iou(batch.xyxy, pairs) >= iou_threshold]
+    if len(pairs) == 0:
+        return batch
+
+    order = np.lexsort((np.arange(len(batch.cls)), -batch.conf))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    neighbours: Dict[int, List[int]] = {}
+    for i, j in pairs.tolist():
+        # Only the more confident box of a pair can suppress the other
+        weaker, stronger = (i, j) if rank[i] > rank[j] else (j, i)
+        neighbours.setdefault(weaker, []).append(stronger)
+
+    keep = np.ones(len(batch.cls), dtype=bool)
+    for i in order.tolist():
+        if i in neighbours and any(keep[j] for j in neighbours[i]):
+            keep[i] = False
+    logger.debug(f"Suppressed {int((~keep).sum())} duplicate detections")
+    return batch.take(np.flatnonzero(keep))
+
+
+def merge_walls(
+    batch: ComponentBatch,
+    gap: float = WALL_MERGE_GAP,
+    alignment: float = WALL_MERGE_ALIGNMENT
+) -> ComponentBatch:
+    """
+    Join wall segments that continue one another: same orientation,
+    aligned across the wall (1-D IoU of their thickness >= `alignment`)
+    and overlapping or at most `gap` pixels apart along it. Fragments of
+    one wall become a single detection covering all of them.
+    """
+    if WALL_TYPE not in batch.names:
+        return batch
+    walls = np.flatnonzero(batch.cls == batch.names.index(WALL_TYPE))
+    if len(walls) < 2:
+        return batch
+
+    boxes = batch.xyxy[walls]
+    reach = boxes + np.array([-gap, -gap, gap, gap]) / 2
+    pairs = GridIndex(reach).pairs()
+    if len(pairs) == 0:
+        return batch
+    a, b = boxes[pairs[:, 0]], boxes[pairs[:, 1]]
+
+    horizontal_a = (a[:, 2] - a[:, 0]) >= (a[:, 3] - a[:, 1])
+    horizontal_b = (b[:, 2] - b[:, 0]) >= (b[:, 3] - b[:, 1])
+    # Along-axis interval (start, end) and across-axis interval per box
+    along = np.where(horizontal_a[:, None], [0, 2], [1, 3])
+    across = np.where(horizontal_a[:, None], [1, 3], [0, 2])
+    rows = np.arange(len(pairs))[:, None]
+    a_along, b_along = a[rows, along], b[rows, along]
+    a_across, b_across = a[rows, across], b[rows, across]
+    distance = np.maximum(a_along[:, 0], b_along[:, 0]) - np.minimum(a_along[:, 1], b_along[:, 1])
+    aligned = _interval_iou(a_across[:, 0], a_across[:, 1], b_across[:, 0], b_across[:, 1]) >= alignment
+    joined = pairs[(horizontal_a == horizontal_b) & aligned & (distance <= gap)]
+    if len(joined) == 0:
+        return batch
+
+    parent = np.arange(len(batch.cls))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in walls[joined].tolist():
+        parent[find(j)] = find(i)
+    roots = np.array([find(i) for i in range(len(parent))])
+    merged = merge_groups(batch, roots)
+    logger.debug(f"Merged {len(batch.cls) - len(merged.cls)} wall segments")
+    return merged
+
+
+def link_measurements(batch: ComponentBatch, max_distance: float = MEASUREMENT_LINK_DISTANCE) -> ComponentBatch:
+    """
+    Attach each measurement text ("5m", "20m²", ...) to the nearest
+    detection within `max_distance` pixels of the text's centre (0 when
+    the centre is inside the box). The text annotation gets the parsed
+    "measurement" and the index of its detection as "component"; the
+    detection's `measured` fields are set from it. The cost engine uses
+    a measured length or area instead of the box size.
+    """
+    if len(batch.cls) == 0 or not batch.texts:
+        return batch
+    index = GridIndex(batch.xyxy)
+    measured = batch.measured.copy()
+    texts = []
+
+    for text in batch.texts:
+        measurement = extract_measurements(str(text.get("text", "")))
+        if not measurement:
+            texts.append(text)
+            continue
+        dims = text["dimensions"]
+        cx = dims["x"] + dims["width"] / 2
+        cy = dims["y"] + dims["height"] / 2
+        candidates = index.query(np.array([cx, cy, cx, cy]) + np.array([-1, -1, 1, 1]) * max_distance)
+        text = dict(text, measurement=measurement)
+        if len(candidates):
+            boxes = batch.xyxy[candidates]
+            dx = np.maximum(np.maximum(boxes[:, 0] - cx, cx - boxes[:, 2]), 0)
+            dy = np.maximum(np.maximum(boxes[:, 1] - cy, cy - boxes[:, 3]), 0)
+            distance = np.hypot(dx, dy)
+            nearest = int(np.argmin(distance))
+            if distance[nearest] <= max_distance:
+                component = int(candidates[nearest])
+                text["component"] = component
+                for field, value in measurement.items():
+                    measured[component, MEASURED_FIELDS.index(field)] = value
+        texts.append(text)
+
+    return ComponentBatch(batch.names, batch.cls, batch.conf, batch.xyxy, texts, measured)
+
+
+def postprocess(batch: ComponentBatch) -> ComponentBatch:
+    """
+    Clean up raw detections before costing: suppress duplicates across
+    classes, merge collinear wall segments, then link measurement texts
+    to the components they measure.
+    """
+    if not POSTPROCESS_ENABLED:
+        return batch
+    count = len(batch.cls)
+    batch = merge_walls(suppress_duplicates(batch))
+    batch = link_measurements(batch)
+    linked = sum(1 for text in batch.texts if "component" in text)
+    logger.info(f"Post-processing: {count} -> {len(batch.cls)} detections, {linked} measurements linked")
+    return batch
@@ -0,0 +1,234 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+import os
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import MaterialCost, LaborCost, EquipmentCost, IndirectCost
+
+logger = logging.getLogger(__name__)
+
+# Catalog configuration
+PRICE_CATALOG_REFRESH_SECONDS = float(os.getenv("PRICE_CATALOG_REFRESH_SECONDS", "60"))
+PRICE_CATALOG_FULL_RELOAD_EVERY = int(os.getenv("PRICE_CATALOG_FULL_RELOAD_EVERY", "60"))
+COST_DATA_MAX_AGE = int(os.getenv("COST_DATA_MAX_AGE", str(int(PRICE_CATALOG_REFRESH_SECONDS))))  # Cache-Control max-age
+COST_DATA_BATCH_MAX = int(os.getenv("COST_DATA_BATCH_MAX", "5000"))  # item x region lookups per batch request
+
+# /cost-data fields -> table kind; an item is looked up by name in each table
+COST_DATA_FIELDS = {
+    "unit_cost": "material",
+    "labor_rate": "labor",
+    "equipment_rate": "equipment",
+}
+
+# table kind -> (model, name column, value column)
+TABLES = {
+    "material": (MaterialCost, MaterialCost.name, MaterialCost.unit_cost),
+    "labor": (LaborCost, LaborCost.trade, LaborCost.hourly_rate),
+    "equipment": (EquipmentCost, EquipmentCost.name, EquipmentCost.daily_rate),
+    "indirect": (IndirectCost, IndirectCost.name, IndirectCost.percentage),
+}
+
+Key = Tuple[str, str]  # (name, region)
+
+
+class PriceCatalog:
+    """
+    In-memory snapshot of the material, labor, equipment and indirect cost
+    tables, keyed by (name, region).
+
+    load() bulk-reads all four tables; refresh() only fetches rows whose
+    last_updated moved past the newest timestamp seen so far, with a full
+    reload every PRICE_CATALOG_FULL_RELOAD_EVERY refreshes to pick up
+    deleted rows. Lookups are plain dict gets. The last_updated of every
+    entry is kept alongside, for the validators of /cost-data responses.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prices: Dict[str, Dict[Key, float]] = {kind: {} for kind in TABLES}
+        self._stamps: Dict[str, Dict[Key, Optional[datetime]]] = {kind: {} for kind in TABLES}
+        self._indirect_by_region: Dict[str, List[Tuple[str, float]]] = {}
+        self._watermarks: Dict[str, Optional[datetime]] = {kind: None for kind in TABLES}
+        self._refreshes = 0
+        self.loaded = False
+
+    @property
+    def version(self) -> Optional[datetime]:
+        """
+        Newest last_updated across all tables; changes whenever a price does.
+        """
+        stamps = [stamp for stamp in self._watermarks.values() if stamp is not None]
+        return max(stamps) if stamps else None
+
+    @staticmethod
+    def _query(kind: str, since: Optional[datetime]):
+        model, name_column, value_column = TABLES[kind]
+        query = select(name_column, model.region, value_column, model.last_updated)
+        if since is not None:
+            query = query.where(model.last_updated > since)
+        return query
+
+    def load(self, db: Session) -> None:
+        """
+        Replace the whole catalog with the current table contents.
+        """
+        self._apply_load({kind: db.execute(self._query(kind, None)).all() for kind in TABLES})
+
+    async def load_async(self, db: AsyncSession) -> None:
+        """
+        load() for an async session.
+        """
+        rows = {}
+        for kind in TABLES:
+            rows[kind] = (await db.execute(self._query(kind, None))).all()
+        self._apply_load(rows)
+
+    def refresh(self, db: Session) -> int:
+        """
+        Apply rows changed since the last load/refresh. Returns the number
+        of updated entries.
+        """
+        if self._needs_full_load():
+            self.load(db)
+            return self.size
+        return self._apply_refresh({
+            kind: db.execute(self._query(kind, self._watermarks[kind])).all() for kind in TABLES
+        })
+
+    async def refresh_async(self, db: AsyncSession) -> int:
+        """
+        refresh() for an async session.
+        """
+        if self._needs_full_load():
+            await self.load_async(db)
+            return self.size
+        rows = {}
+        for kind in TABLES:
+            rows[kind] = (await db.execute(self._query(kind, self._watermarks[kind]))).all()
+        return self._apply_refresh(rows)
+
+    @property
+    def size(self) -> int:
+        return sum(len(entries) for entries in self._prices.values())
+
+    def _needs_full_load(self) -> bool:
+        if not self.loaded:
+            return True
+        self._refreshes += 1
+        return bool(PRICE_CATALOG_FULL_RELOAD_EVERY) and self._refreshes % PRICE_CATALOG_FULL_RELOAD_EVERY == 0
+
+    def _apply_load(self, rows_by_kind) -> None:
+        prices = {}
+        stamps = {}
+        watermarks = {}
+        for kind, rows in rows_by_kind.items():
+            prices[kind] = {(name, region): value for name, region, value, _ in rows}
+            stamps[kind] = {(name, region): stamp for name, region, _, stamp in rows}
+            watermarks[kind] = max((stamp for *_, stamp in rows if stamp is not None), default=None)
+
+        with self._lock:
+            self._prices = prices
+            self._stamps = stamps
+            self._watermarks = watermarks
+            self._rebuild_indirect()
+            self.loaded = True
+
+        logger.info(
+            "Price catalog loaded: "
+            + ", ".join(f"{kind}={len(entries)}" for kind, entries in prices.items())
+        )
+
+    def _apply_refresh(self, rows_by_kind) -> int:
+        updated = 0
+        for kind, rows in rows_by_kind.items():
+            if not rows:
+                continue
+            with self._lock:
+                entries = dict(self._prices[kind])
+                stamps = dict(self._stamps[kind])
+                for name, region, value, stamp in rows:
+                    entries[(name, region)] = value
+                    stamps[(name, region)] = stamp
+                    if stamp is not None and (self._watermarks[kind] is None or stamp > self._watermarks[kind]):
+                        self._watermarks[kind] = stamp
+                self._prices[kind] = entries
+                self._stamps[kind] = stamps
+                if kind == "indirect":
+                    self._rebuild_indirect()
+            updated += len(rows)
+
+        if updated:
+            logger.info(f"Price catalog refreshed: {updated} updated entries")
+        return updated
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self.loaded:
+            self.load(db)
+
+    async def ensure_loaded_async(self, db: AsyncSession) -> None:
+        if not self.loaded:
+            await self.load_async(db)
+
+    def _rebuild_indirect(self) -> None:
+        by_region: Dict[str, List[Tuple[str, float]]] = {}
+        for (name, region), percentage in self._prices["indirect"].items():
+            by_region.setdefault(region, []).append((name, percentage))
+        self._indirect_by_region = by_region
+
+    def get(self, kind: str, name: str, region: str) -> Optional[float]:
+        return self._prices[kind].get((name, region))
+
+    def get_many(self, kind: str, pairs: Iterable[Key]) -> List[Optional[float]]:
+        """
+        Batch lookup of many (name, region) pairs in one call.
+        """
+        entries = self._prices[kind]
+        return [entries.get(pair) for pair in pairs]
+
+    def indirect(self, region: str) -> List[Tuple[str, float]]:
+        """
+        (name, percentage) pairs configured for a region.
+        """
+        return self._indirect_by_region.get(region, [])
+
+    def cost_data(self, name: str, region: str) -> Optional[Dict[str, Any]]:
+        """
+        The /cost-data entry of an item in a region: its unit cost, labor
+        rate and equipment rate (None where a table has no row for it) and
+        the newest last_updated of those rows. None when no table has it.
+        """
+        prices, stamps = self._prices, self._stamps
+        key = (name, region)
+        entry: Dict[str, Any] = {"item": name, "region": region}
+        found = False
+        last_updated = None
+        for field, kind in COST_DATA_FIELDS.items():
+            value = prices[kind].get(key)
+            entry[field] = value
+            if value is None:
+                continue
+            found = True
+            stamp = stamps[kind].get(key)
+            if stamp is not None and (last_updated is None or stamp > last_updated):
+                last_updated = stamp
+        if not found:
+            return None
+        entry["last_updated"] = last_updated
+        return entry
+
+    def stats(self) -> Dict[str, object]:
+        version = self.version
+        return {
+            "loaded": self.loaded,
+            "entries": {kind: len(entries) for kind, entries in self._prices.items()},
+            "version": version.isoformat() if version else None,
+            "refreshes": self._refreshes,
+        }
+
+
+catalog = PriceCatalog()
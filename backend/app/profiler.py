@@ -0,0 +1,183 @@
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Profiler configuration
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_BUFFER = int(os.getenv("PROFILER_BUFFER", "20"))  # captured profiles kept
+PROFILER_ARM_SECONDS = float(os.getenv("PROFILER_ARM_SECONDS", "900"))  # how long an armed profiler waits
+
+# Leaf frames of threads that are blocked rather than working: idle pool
+# workers, the event loop's select(), lock or condition waits and the
+# inference pool's progress dispatcher
+IDLE_FRAMES = {
+    ("_dispatch_progress", "inference_pool.py"),
+    ("_worker", "thread.py"),
+    ("select", "selectors.py"),
+    ("wait", "threading.py"),
+    ("get", "queue.py"),
+    ("_recv", "connection.py"),
+    ("_poll", "connection.py"),
+    ("accept", "socket.py"),
+}
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the running process: a background thread
+    takes the Python stack of every other thread each `interval` seconds
+    (sys._current_frames()) and counts identical stacks. Results are in
+    the collapsed-stack format of flamegraph.pl and speedscope
+    ("thread;outer (file:line);...;inner (file:line)" -> samples).
+
+    Time spent in C code (OpenCV, NumPy, ONNX Runtime) is attributed to
+    the Python frame that called it.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL_MS / 1000, include_idle: bool = False):
+        self.interval = max(interval, 0.001)
+        self.include_idle = include_idle
+        self.samples = 0
+        self._counts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return dict(self._counts)
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (code.co_name, os.path.basename(code.co_filename)) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self._counts[key] = self._counts.get(key, 0) + 1
+            self.samples += 1
+
+
+def profile(seconds: float, interval: float = PROFILER_INTERVAL_MS / 1000, include_idle: bool = False) -> Dict[str, int]:
+    """
+    Sample this process for `seconds` (capped at PROFILER_MAX_SECONDS).
+    Blocks the calling thread.
+    """
+    profiler = SamplingProfiler(interval, include_idle)
+    profiler.start()
+    time.sleep(min(seconds, PROFILER_MAX_SECONDS))
+    return profiler.stop()
+
+
+def folded(counts: Dict[str, int]) -> str:
+    """
+    Collapsed stacks, one "stack count" line each, most sampled first.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda item: -item[1]))
+
+
+class ProfileStore:
+    """
+    Profiles of slow analyses, captured on demand.
+
+    arm() asks for the next `requests` analyses that take at least
+    `min_seconds`: while armed, every analysis runs under a
+    SamplingProfiler in its inference worker (see app.inference_pool),
+    and those slow enough are kept here. Arming expires after
+    `expires_in` seconds. In thread mode the samples cover every thread
+    of the API process, including concurrent requests.
+    """
+
+    def __init__(self, size: int = PROFILER_BUFFER):
+        self.size = size
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._remaining = 0
+        self._min_seconds = 0.0
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def arm(self, requests: int = 1, min_seconds: float = 0.0, expires_in: float = PROFILER_ARM_SECONDS) -> Dict[str, Any]:
+        with self._lock:
+            self._remaining = max(0, requests)
+            self._min_seconds = max(0.0, min_seconds)
+            self._expires = time.monotonic() + expires_in
+        logger.info(f"Profiler armed for {requests} analyses of at least {min_seconds}s")
+        return self.status()
+
+    def claim(self) -> Optional[float]:
+        """
+        The minimum duration to keep when the next analysis should be
+        profiled, None when the profiler isn't armed.
+        """
+        with self._lock:
+            if self._remaining > 0 and time.monotonic() < self._expires:
+                return self._min_seconds
+            return None
+
+    def add(self, name: str, seconds: float, counts: Dict[str, int]) -> Optional[str]:
+        with self._lock:
+            if self._remaining <= 0:
+                return None
+            self._remaining -= 1
+            profile_id = str(next(self._ids))
+            self._profiles[profile_id] = {
+                "id": profile_id,
+                "name": name,
+                "seconds": round(seconds, 3),
+                "captured_at": time.time(),
+                "samples": sum(counts.values()),
+                "counts": counts,
+            }
+            while len(self._profiles) > self.size:
+                self._profiles.popitem(last=False)
+        logger.info(f"Captured profile {profile_id} of {name} ({seconds:.1f}s)")
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {key: value for key, value in profile.items() if key != "counts"}
+                for profile in reversed(self._profiles.values())
+            ]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            armed = self._remaining > 0 and time.monotonic() < self._expires
+            return {
+                "armed": armed,
+                "remaining": self._remaining if armed else 0,
+                "min_seconds": self._min_seconds,
+                "expires_in": round(max(0.0, self._expires - time.monotonic()), 1) if armed else 0,
+                "captured": len(self._profiles),
+            }
+
+
+store = ProfileStore()
@@ -0,0 +1,111 @@
+"""
+Re-price stored projects from their saved components.
+
+Runs only the costing stage: the detections saved with each project
+(Project.components) are priced again with the current rates, so a
+catalog update or a region change doesn't need the drawing re-analyzed.
+
+    python -m app.repricing [--region amsterdam] [--user-id 42] [--batch-size 500]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .components import ComponentBatch
+from .cost_calc import calculate_totals_batch
+from .database import SessionLocal
+from .models import Project
+
+logger = logging.getLogger(__name__)
+
+REPRICE_BATCH_SIZE = int(os.getenv("REPRICE_BATCH_SIZE", "500"))
+
+
+def reprice_projects(
+    session_factory: Callable[[], Session] = SessionLocal,
+    region: Optional[str] = None,
+    user_id: Optional[int] = None,
+    batch_size: int = REPRICE_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Re-price every project with stored components (optionally only those
+    of `user_id`) in one pass over the table, in primary key order.
+
+    Each chunk of `batch_size` rows is read with a keyset query, priced in
+    a single vectorized call and written back with one bulk UPDATE, then
+    committed, so no long transaction or server-side cursor is held and an
+    interrupted run keeps the chunks it finished. Projects keep their own
+    region unless `region` is given.
+    """
+    stats = {"projects": 0, "changed": 0, "failed": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    last_id = 0
+
+    with session_factory() as db:
+        while True:
+            query = (
+                select(Project.id, Project.components, Project.region, Project.total_cost)
+                .where(Project.components.isnot(None), Project.id > last_id)
+                .order_by(Project.id)
+                .limit(batch_size)
+            )
+            if user_id is not None:
+                query = query.where(Project.user_id == user_id)
+            rows = db.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            ids, drawings, regions, previous = [], [], [], []
+            for row in rows:
+                try:
+                    drawings.append(ComponentBatch.from_bytes(row.components))
+                except Exception as e:
+                    logger.warning(f"Skipping project {row.id}: unreadable components ({str(e)})")
+                    stats["failed"] += 1
+                    continue
+                ids.append(row.id)
+                regions.append(region or row.region or "default")
+                previous.append(row.total_cost)
+
+            totals = calculate_totals_batch(drawings, regions) if drawings else []
+            now = datetime.utcnow()
+            if ids:
+                db.execute(update(Project), [
+                    {"id": project_id, "total_cost": total, "region": project_region, "priced_at": now}
+                    for project_id, total, project_region in zip(ids, totals, regions)
+                ])
+                db.commit()
+
+            stats["projects"] += len(ids)
+            stats["changed"] += sum(1 for old, new in zip(previous, totals) if old != new)
+            logger.info(f"Re-priced {stats['projects']} projects (up to id {last_id})")
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.repricing", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--region", help="Price every project for this region instead of its own")
+    parser.add_argument("--user-id", type=int, help="Only re-price this user's projects")
+    parser.add_argument("--batch-size", type=int, default=REPRICE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    stats = reprice_projects(region=args.region, user_id=args.user_id, batch_size=max(1, args.batch_size))
+    print(json.dumps(stats))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .metrics import timed_stage
+
+try:
+    import msgpack
+except ImportError:  # Optional: MessagePack responses
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Optional: brotli compression
+    brotli = None
+
+# Response encoding configuration
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "16384"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _orjson_default(value: Any) -> Any:
+    # NumPy scalars other than the ones orjson handles natively
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Type is not MessagePack serializable: {type(value).__name__}")
+
+
+def encode_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_orjson_default, option=ORJSON_OPTIONS)
+
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+
+class ORJSONResponse(Response):
+    """
+    JSON response encoded with orjson. NumPy arrays and scalars are
+    serialized natively, so payloads need no conversion beforehand.
+    """
+
+    media_type = JSON_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def parse_quality_header(value: str) -> Dict[str, float]:
+    """
+    Map each entry of an Accept or Accept-Encoding header to its q value.
+    """
+    preferences: Dict[str, float] = {}
+    for entry in value.split(","):
+        name, _, params = entry.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, number = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        preferences[name] = max(quality, preferences.get(name, 0.0))
+    return preferences
+
+
+def wants_msgpack(request: Request) -> bool:
+    """
+    True when the client prefers MessagePack to JSON and it's available.
+    """
+    accept = request.headers.get("accept")
+    if msgpack is None or not accept:
+        return False
+    preferences = parse_quality_header(accept)
+    packed = max(preferences.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    plain = max(preferences.get(name, 0.0) for name in (JSON_MEDIA_TYPE, "application/*", "*/*"))
+    return packed > 0 and packed >= plain
+
+
+def choose_encoding(request: Request) -> Optional[str]:
+    """
+    Content coding for the response: brotli (when installed) or gzip,
+    whichever the client accepts with the higher q value, else None.
+    """
+    preferences = parse_quality_header(request.headers.get("accept-encoding", ""))
+    wildcard = preferences.get("*", 0.0)
+    candidates = []
+    if brotli is not None:
+        candidates.append((preferences.get("br", wildcard), 1, "br"))
+    candidates.append((preferences.get("gzip", wildcard), 0, "gzip"))
+    quality, _, coding = max(candidates)
+    return coding if quality > 0 else None
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+
+
+async def negotiate(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Encode `content` as JSON (with orjson) or as MessagePack when the
+    Accept header prefers it, and compress bodies of at least
+    RESPONSE_COMPRESS_MIN_BYTES with brotli or gzip per Accept-Encoding.
+
+    Returning the Response directly skips FastAPI's jsonable_encoder walk,
+    which dominates the cost of large component lists; `content` must be
+    plain data (NumPy values are fine).
+    """
+    with timed_stage("serialization"):
+        if wants_msgpack(request):
+            body = encode_msgpack(content)
+            media_type = MSGPACK_MEDIA_TYPES[0]
+        else:
+            body = encode_json(content)
+            media_type = JSON_MEDIA_TYPE
+
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept, Accept-Encoding"
+        if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+            coding = choose_encoding(request)
+            if coding is not None:
+                # Compressing megabytes takes long enough to stall the loop
+                body = await run_in_threadpool(compress, body, coding)
+                headers["Content-Encoding"] = coding
+    return Response(body, status_code=status_code, headers=headers, media_type=media_type)
+
+
+def weak_etag(*parts: Any) -> str:
+    """
+    Weak entity tag over `parts`: the same for every encoding and
+    compression of one representation.
+    """
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def http_date(value: datetime) -> str:
+    """
+    IMF-fixdate for a Last-Modified header; naive datetimes are UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime], max_age: int) -> Dict[str, str]:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    True when a GET or HEAD request's If-None-Match (weak comparison) or,
+    without one, its If-Modified-Since shows the client already has the
+    current representation.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        opaque = etag[2:] if etag.startswith("W/") else etag
+        return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds
+    return last_modified.replace(microsecond=0) <= since
@@ -0,0 +1,331 @@
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .analysis_cache import cache as analysis_cache
+from .components import ComponentBatch
+from .postprocess import GridIndex, pair_iou
+from .tiling import Tile
+
+logger = logging.getLogger(__name__)
+
+# Incremental revision analysis configuration
+REVISION_DIR = os.getenv("REVISION_DIR", os.path.join(tempfile.gettempdir(), "drawing-revisions"))
+REVISION_TTL_SECONDS = int(os.getenv("REVISION_TTL_SECONDS", str(14 * 24 * 3600)))
+REVISION_SIGNATURE_SIZE = int(os.getenv("REVISION_SIGNATURE_SIZE", "32"))  # blocks per tile side
+REVISION_TILE_TOLERANCE = int(os.getenv("REVISION_TILE_TOLERANCE", "6"))  # grey levels per block
+REVISION_THUMBNAIL_SIZE = int(os.getenv("REVISION_THUMBNAIL_SIZE", "1024"))  # longest side, for alignment
+REVISION_MIN_ALIGNMENT = float(os.getenv("REVISION_MIN_ALIGNMENT", "0.2"))  # phase correlation response
+REVISION_MATCH_IOU = float(os.getenv("REVISION_MATCH_IOU", "0.5"))
+REVISION_MOVE_TOLERANCE = float(os.getenv("REVISION_MOVE_TOLERANCE", "2"))  # pixels
+
+REVISION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+Offset = Tuple[float, float]
+
+
+def tile_signatures(image: np.ndarray, tiles: List[Tile], size: int = REVISION_SIGNATURE_SIZE) -> np.ndarray:
+    """
+    Perceptual hash of every tile: its mean grey level over a size x size
+    grid of blocks, as a (tiles, size, size) uint8 array. Re-encoding
+    noise barely moves a block mean, while a line added, removed or moved
+    within the tile shifts the blocks it crosses by many grey levels.
+    """
+    import cv2
+
+    signatures = np.empty((len(tiles), size, size), np.uint8)
+    for i, (x0, y0, x1, y1) in enumerate(tiles):
+        signatures[i] = cv2.resize(image[y0:y1, x0:x1], (size, size), interpolation=cv2.INTER_AREA)
+    return signatures
+
+
+def changed_tiles(
+    before: np.ndarray,
+    after: np.ndarray,
+    tolerance: int = REVISION_TILE_TOLERANCE
+) -> np.ndarray:
+    """
+    Mask of the tiles whose signatures differ by more than `tolerance`
+    grey levels in any block.
+    """
+    difference = np.abs(before.astype(np.int16) - after.astype(np.int16))
+    return difference.reshape(len(after), -1).max(axis=1) > tolerance
+
+
+def thumbnail(image: np.ndarray, longest_side: int = REVISION_THUMBNAIL_SIZE) -> Tuple[np.ndarray, float]:
+    """
+    Downscaled copy of the page for alignment, and its scale (thumbnail
+    pixels per image pixel).
+    """
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(1.0, longest_side / max(width, height))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+def estimate_shift(reference: np.ndarray, image: np.ndarray, scale: float) -> Tuple[Tuple[int, int], float]:
+    """
+    Translation (dx, dy) in image pixels such that image[y + dy, x + dx]
+    shows what reference (a thumbnail at `scale`) shows at (x, y), and the
+    phase correlation response. Below REVISION_MIN_ALIGNMENT, or under a
+    thumbnail pixel, the pages are taken to be aligned already.
+    """
+    import cv2
+
+    small, _ = thumbnail(image, max(reference.shape))
+    if small.shape != reference.shape:
+        return (0, 0), 0.0
+    window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+    (sx, sy), response = cv2.phaseCorrelate(reference.astype(np.float32), small.astype(np.float32), window)
+    if response < REVISION_MIN_ALIGNMENT or max(abs(sx), abs(sy)) < 0.5:
+        return (0, 0), float(response)
+    return (int(round(sx / scale)), int(round(sy / scale))), float(response)
+
+
+def align(image: np.ndarray, dx: int, dy: int, fill: int = 255) -> np.ndarray:
+    """
+    The image moved by (-dx, -dy): aligned[y, x] = image[y + dy, x + dx],
+    with `fill` (white paper) where that falls outside the image.
+    """
+    if not dx and not dy:
+        return image
+    height, width = image.shape[:2]
+    aligned = np.full_like(image, fill)
+    xs, xd = max(dx, 0), max(-dx, 0)
+    ys, yd = max(dy, 0), max(-dy, 0)
+    w, h = width - abs(dx), height - abs(dy)
+    if w > 0 and h > 0:
+        aligned[yd:yd + h, xd:xd + w] = image[ys:ys + h, xs:xs + w]
+    return aligned
+
+
+class RevisionState:
+    """
+    What the next revision of a drawing needs to be analyzed incrementally:
+    the per-tile detections and text annotations (before tile merging),
+    the tile signatures and an alignment thumbnail.
+
+    Tile results are kept in the coordinates of the first revision's page
+    (the "frame"); later revisions are aligned to it before tiling, and
+    `offset` (page pixels) maps the frame onto this revision's page.
+    `components` is this revision's final result, in its own page
+    coordinates, without text annotations.
+    """
+
+    def __init__(
+        self,
+        size: Tuple[int, int],
+        tile_size: int,
+        overlap: int,
+        preset: str,
+        scale: float,
+        offset: Offset,
+        signatures: np.ndarray,
+        thumbnail: np.ndarray,
+        thumbnail_scale: float,
+        tile_detections: List[ComponentBatch],
+        tile_texts: List[List[Dict[str, Any]]],
+        components: ComponentBatch,
+    ):
+        self.size = tuple(size)
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.preset = preset
+        self.scale = scale
+        self.offset = tuple(offset)
+        self.signatures = signatures
+        self.thumbnail = thumbnail
+        self.thumbnail_scale = thumbnail_scale
+        self.tile_detections = tile_detections
+        self.tile_texts = tile_texts
+        self.components = components
+
+    def compatible(self, size: Tuple[int, int], tile_size: int, overlap: int, preset: str) -> bool:
+        """
+        True when a revision decoded to `size` and tiled the same way can
+        reuse these tile results.
+        """
+        return (
+            tuple(size) == self.size
+            and tile_size == self.tile_size
+            and overlap == self.overlap
+            and preset == self.preset
+        )
+
+    def to_bytes(self) -> bytes:
+        meta = {
+            "size": self.size,
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "preset": self.preset,
+            "scale": self.scale,
+            "offset": self.offset,
+            "thumbnail_scale": self.thumbnail_scale,
+            "tile_detections": [batch.to_dict() for batch in self.tile_detections],
+            "tile_texts": self.tile_texts,
+            "components": self.components.to_dict(),
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            signatures=self.signatures,
+            thumbnail=self.thumbnail,
+            meta=np.frombuffer(json.dumps(meta, separators=(",", ":")).encode(), np.uint8),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RevisionState":
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            meta = json.loads(arrays["meta"].tobytes())
+            signatures = arrays["signatures"]
+            thumbnail = arrays["thumbnail"]
+        return cls(
+            meta["size"],
+            meta["tile_size"],
+            meta["overlap"],
+            meta["preset"],
+            meta["scale"],
+            meta["offset"],
+            signatures,
+            thumbnail,
+            meta["thumbnail_scale"],
+            [ComponentBatch.from_dict(batch) for batch in meta["tile_detections"]],
+            meta["tile_texts"],
+            ComponentBatch.from_dict(meta["components"]),
+        )
+
+
+def diff_components(
+    before: ComponentBatch,
+    after: ComponentBatch,
+    before_offset: Offset = (0, 0),
+    after_offset: Offset = (0, 0)
+) -> Dict[str, Any]:
+    """
+    Component-level diff between two revisions' detections.
+
+    Boxes are compared in the shared frame (each page's coordinates minus
+    its offset). A detection in `after` matches one in `before` of the
+    same type with IoU >= REVISION_MATCH_IOU, best matches first; matched
+    pairs whose box moved more than REVISION_MOVE_TOLERANCE pixels or
+    whose measurement changed are "changed". Returns the "added",
+    "removed" and "changed" components (as dicts in their own page
+    coordinates) and the number left "unchanged".
+    """
+    old_boxes = before.xyxy - np.array(before_offset * 2, np.float64)
+    new_boxes = after.xyxy - np.array(after_offset * 2, np.float64)
+    count = len(old_boxes)
+    boxes = np.concatenate([old_boxes, new_boxes])
+    types = np.concatenate([before.types, after.types])
+
+    matches: List[Tuple[int, int]] = []
+    if count and len(new_boxes):
+        pairs = GridIndex(boxes).pairs()
+        # One box from each revision, of the same type
+        pairs = pairs[(pairs[:, 0] < count) & (pairs[:, 1] >= count)]
+        pairs = pairs[types[pairs[:, 0]] == types[pairs[:, 1]]]
+        iou = pair_iou(boxes, pairs)
+        candidates = pairs[iou >= REVISION_MATCH_IOU]
+        order = np.argsort(-iou[iou >= REVISION_MATCH_IOU], kind="stable")
+        taken_old, taken_new = set(), set()
+        for i, j in candidates[order].tolist():
+            if i not in taken_old and j not in taken_new:
+                taken_old.add(i)
+                taken_new.add(j)
+                matches.append((i, j - count))
+
+    old_components = before.detection_components()
+    new_components = after.detection_components()
+    matched_old = {i for i, _ in matches}
+    matched_new = {j for _, j in matches}
+    changed = []
+    for i, j in sorted(matches, key=lambda match: match[1]):
+        moved = np.abs(old_boxes[i] - new_boxes[j]).max() > REVISION_MOVE_TOLERANCE
+        remeasured = not np.array_equal(before.measured[i], after.measured[j], equal_nan=True)
+        if moved or remeasured:
+            changed.append({"before": old_components[i], "after": new_components[j]})
+
+    return {
+        "added": [c for j, c in enumerate(new_components) if j not in matched_new],
+        "removed": [c for i, c in enumerate(old_components) if i not in matched_old],
+        "changed": changed,
+        "unchanged": len(matches) - len(changed),
+    }
+
+
+class RevisionStore:
+    """
+    Revision states on disk, one file per revision id, under a directory
+    per analysis version (see app.analysis_cache): states made with other
+    weights or post-processing are never reused. Files older than
+    REVISION_TTL_SECONDS are removed now and then on put().
+    """
+
+    def __init__(
+        self,
+        directory: str = REVISION_DIR,
+        version: Optional[Callable[[], str]] = None,
+        ttl: int = REVISION_TTL_SECONDS,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self._version = version
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def _path(self, revision_id: str) -> str:
+        version = self._version() if self._version is not None else "default"
+        return os.path.join(self.directory, version, f"{revision_id}.npz")
+
+    def get(self, revision_id: str) -> Optional[RevisionState]:
+        if not REVISION_ID_PATTERN.match(revision_id):
+            return None
+        try:
+            with open(self._path(revision_id), "rb") as f:
+                return RevisionState.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable revision {revision_id}: {str(e)}")
+            return None
+
+    def put(self, state: RevisionState) -> str:
+        revision_id = uuid.uuid4().hex
+        path = self._path(revision_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(state.to_bytes())
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._puts += 1
+            expire = self._puts % 100 == 1
+        if expire:
+            self.expire(os.path.dirname(path))
+        return revision_id
+
+    def expire(self, directory: str) -> None:
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+store = RevisionStore(version=lambda: analysis_cache.version)
@@ -0,0 +1,189 @@
+"""
+Preforking server for production.
+
+Loads and warms up the detection model once, then forks the uvicorn
+workers so they share the weights (and everything else imported so far)
+copy-on-write instead of each loading its own copy:
+
+    python -m app.serve --workers 4 --host 0.0.0.0 --port 8000
+
+The workers run the inference pool in thread mode on the inherited model;
+spawning pool processes would load a copy per process again. Each worker
+admits a few analyses at once (--analyses-per-worker), so their detections
+share forward passes through the YOLO batch scheduler. Workers that
+die are forked again from the preloaded parent. With more than one worker,
+estimation jobs are kept in the SQLite job store so any worker can answer
+for a job another one runs.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Set
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger("app.serve")
+
+SERVE_RESTART_DELAY = 1.0
+
+
+def configure(workers: int, analyses_per_worker: int = 2) -> None:
+    """
+    Environment defaults for forked workers. Must run before any app module
+    is imported, as they read their configuration at import time. Raises
+    ValueError when the configuration can't work with `workers` workers.
+    """
+    if workers > 1:
+        # A job runs in the worker that accepted it, but its status, events
+        # and results are requested from whichever worker the socket picks
+        if os.getenv("JOB_STORE", "sqlite") != "sqlite":
+            raise ValueError(
+                f"JOB_STORE={os.environ['JOB_STORE']} can't be shared by {workers} workers; "
+                "use JOB_STORE=sqlite or --workers 1"
+            )
+        os.environ["JOB_STORE"] = "sqlite"
+    if os.getenv("INFERENCE_POOL_MODE", "thread") != "thread":
+        logger.warning("INFERENCE_POOL_MODE is ignored by app.serve; forked workers use thread mode")
+    os.environ["INFERENCE_POOL_MODE"] = "thread"
+    # A few analyses at a time per worker, sharing its share of the cores;
+    # with one, concurrent requests would never be batched together
+    os.environ.setdefault("INFERENCE_WORKERS", str(max(1, analyses_per_worker)))
+    os.environ.setdefault("INFERENCE_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // workers)))
+
+
+def preload():
+    """
+    Import the application and load and warm up the model in the parent.
+    Raises ModelUnavailable when the model is required but can't be loaded,
+    so a broken deployment fails at startup rather than per request.
+    """
+    from . import ai_module
+    from .inference_pool import INFERENCE_THREADS_PER_WORKER, limit_threads
+    from .main import app
+
+    limit_threads(INFERENCE_THREADS_PER_WORKER)
+    start = time.perf_counter()
+    ai_module.load_model()
+    logger.info(f"Preloaded the application in {time.perf_counter() - start:.1f}s: {ai_module.model_status()}")
+    return app
+
+
+class Supervisor:
+    """
+    Forks `workers` uvicorn servers on a shared listening socket, restarts
+    the ones that exit and stops them all on SIGTERM or SIGINT.
+    """
+
+    def __init__(self, config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.socket = config.bind_socket()
+        self.children: Set[int] = set()
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self.children.add(pid)
+        logger.info(f"Started worker {pid}")
+
+    def _run_worker(self) -> None:
+        import uvicorn
+        from .inference_pool import INFERENCE_THREADS_PER_WORKER, limit_threads
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        # Thread pools don't survive fork; have OpenCV/PyTorch rebuild theirs
+        limit_threads(INFERENCE_THREADS_PER_WORKER)
+        code = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=[self.socket])
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def stop(self, signum, frame) -> None:
+        if not self.stopping:
+            logger.info(f"Received signal {signum}, stopping {len(self.children)} workers")
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        # Move everything loaded so far out of the collector's reach, so
+        # collections in the workers don't write to (and copy) shared pages
+        gc.collect()
+        gc.freeze()
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            self.children.discard(pid)
+            if self.stopping:
+                continue
+            logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            time.sleep(SERVE_RESTART_DELAY)
+            if not self.stopping:
+                self.spawn()
+
+        self.socket.close()
+        logger.info("All workers stopped")
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="python -m app.serve", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("SERVE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    )
+    parser.add_argument(
+        "--analyses-per-worker", type=int, default=int(os.getenv("SERVE_ANALYSES_PER_WORKER", "2"))
+    )
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+    workers = max(1, args.workers)
+    try:
+        configure(workers, args.analyses_per_worker)
+    except ValueError as e:
+        logger.error(f"Not starting: {str(e)}")
+        return 1
+
+    import uvicorn
+    from .inference_pool import ModelUnavailable
+
+    try:
+        app = preload()
+    except ModelUnavailable as e:
+        logger.error(f"Not starting: {str(e)}")
+        return 1
+
+    config = uvicorn.Config(app, host=args.host, port=args.port, log_level=args.log_level)
+    Supervisor(config, workers).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import struct
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from .components import ComponentBatch
+
+Tile = Tuple[int, int, int, int]  # x0, y0, x1, y1
+
+
+def image_size(file_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from the PNG, JPEG or BMP header without decoding.
+    Returns None for formats that aren't recognised.
+    """
+    head = bytes(file_bytes[:32])
+
+    # PNG: dimensions are in the IHDR chunk right after the signature
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", head[16:24])
+        return width, height
+
+    # BMP: BITMAPINFOHEADER width/height at offset 18
+    if head.startswith(b"BM") and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return abs(width), abs(height)
+
+    # JPEG: walk the markers until a start-of-frame segment
+    if head.startswith(b"\xff\xd8"):
+        view = memoryview(file_bytes)
+        i = 2
+        while i + 9 < len(view):
+            if view[i] != 0xFF:
+                i += 1
+                continue
+            marker = view[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            length = struct.unpack(">H", view[i + 2:i + 4])[0]
+            if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                height, width = struct.unpack(">HH", view[i + 5:i + 9])
+                return width, height
+            i += 2 + length
+
+    return None
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: int) -> List[Tile]:
+    """
+    Cover the image with tiles of at most tile_size pixels that overlap
+    their neighbours by `overlap` pixels. The last row/column is shifted
+    back so every tile is full size where the image allows it.
+    """
+    stride = max(1, tile_size - overlap)
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def core_region(tile: Tile, width: int, height: int, overlap: int) -> Tile:
+    """
+    Part of a tile that it is responsible for: the tile minus half the
+    overlap on every side that borders another tile. Core regions of a grid
+    are disjoint-ish, so items can be assigned to exactly one tile by
+    their centre point.
+    """
+    x0, y0, x1, y1 = tile
+    half = overlap // 2
+    return (
+        x0 + half if x0 > 0 else 0,
+        y0 + half if y0 > 0 else 0,
+        x1 - half if x1 < width else width,
+        y1 - half if y1 < height else height,
+    )
+
+
+class GridIndex:
+    """
+    Uniform grid over a set of xyxy boxes: every box is registered in each
+    cell it touches, so boxes near each other are found by looking at a
+    few cells instead of comparing every pair.
+
+    The cell size defaults to twice the median box size, which keeps the
+    number of boxes per cell (and cells per box) small for drawings.
+    """
+
+    def __init__(self, xyxy: np.ndarray, cell_size: Optional[float] = None):
+        self.xyxy = xyxy
+        if cell_size is None:
+            sides = np.maximum(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]) if len(xyxy) else np.ones(1)
+            cell_size = 2.0 * float(np.median(sides))
+        self.cell_size = max(cell_size, 1.0)
+
+        x0, y0, x1, y1 = self._cells(xyxy)
+        columns = x1 - x0 + 1
+        counts = columns * (y1 - y0 + 1)
+        ids = np.repeat(np.arange(len(xyxy)), counts)
+        # Position of each registration within its box's block of cells
+        local = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = np.repeat(x0, counts) + local % np.repeat(columns, counts)
+        cy = np.repeat(y0, counts) + local // np.repeat(columns, counts)
+        keys = self._key(cx, cy)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.ids = ids[order]
+
+    def _cells(self, xyxy: np.ndarray) -> Tuple[np.ndarray, ...]:
+        cells = np.floor(xyxy / self.cell_size).astype(np.int64)
+        return cells[:, 0], cells[:, 1], cells[:, 2], cells[:, 3]
+
+    @staticmethod
+    def _key(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        # Cells are far below 2**31 in either direction for any page size
+        return (cx << 32) + cy
+
+    def pairs(self) -> np.ndarray:
+        """
+        Candidate pairs (i, j), i < j, of boxes sharing at least one cell,
+        as an (n, 2) array without repeats.
+        """
+        if len(self.keys) == 0:
+            return np.zeros((0, 2), np.int64)
+        starts = np.flatnonzero(np.r_[True, self.keys[1:] != self.keys[:-1]])
+        stops = np.r_[starts[1:], len(self.keys)]
+        # End of the cell each registration belongs to
+        cell_stop = np.repeat(stops, stops - starts)
+        positions = np.arange(len(self.keys))
+        found = []
+        # Pair every registration with the ones `step` places after it in
+        # the same cell; cells hold few boxes, so this loop is short
+        for step in range(1, int((stops - starts).max())):
+            first = positions[positions + step < cell_stop]
+            found.append(np.stack([self.ids[first], self.ids[first + step]], axis=1))
+        if not found:
+            return np.zeros((0, 2), np.int64)
+        pairs = np.sort(np.concatenate(found), axis=1)
+        # Boxes sharing several cells are paired once per cell
+        count = len(self.xyxy)
+        unique = np.unique(pairs[:, 0] * count + pairs[:, 1])
+        return np.stack([unique // count, unique % count], axis=1)
+
+    def query(self, box: np.ndarray) -> np.ndarray:
+        """
+        Ids of the boxes registered in any cell that `box` touches.
+        """
+        x0, y0, x1, y1 = (int(c) for c in np.floor(np.asarray(box) / self.cell_size))
+        found = []
+        for cx in range(x0, x1 + 1):
+            keys = self._key(np.full(y1 - y0 + 1, cx, np.int64), np.arange(y0, y1 + 1, dtype=np.int64))
+            lo = np.searchsorted(self.keys, keys, side="left")
+            hi = np.searchsorted(self.keys, keys, side="right")
+            found.extend(self.ids[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a)
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, np.int64)
+
+
+def merge_detections(tile_detections: List[ComponentBatch], threshold: float = 0.6) -> ComponentBatch:
+    """
+    Merge per-tile detections into one batch.
+
+    Two detections of the same class from different tiles are taken to be
+    the same object when they overlap and line up across the seam: their
+    extents along one axis agree (1-D IoU >= threshold) while they overlap
+    along the other. That joins a wall cut in two by a tile edge and
+    collapses a door seen by both neighbouring tiles, while leaving
+    perpendicular walls that meet in a corner alone. Merged detections
+    take the union box and the highest confidence.
+    """
+    batch = ComponentBatch.concatenate(tile_detections)
+    if len(batch.cls) == 0:
+        return batch
+
+    boxes = batch.xyxy
+    tiles = np.repeat(np.arange(len(tile_detections)), [len(b.cls) for b in tile_detections])
+
+    # Boxes that overlap share a grid cell, so only neighbours are compared
+    pairs = GridIndex(boxes).pairs()
+    pairs = pairs[(batch.cls[pairs[:, 0]] == batch.cls[pairs[:, 1]]) & (tiles[pairs[:, 0]] != tiles[pairs[:, 1]])]
+    a, b = boxes[pairs[:, 0]], boxes[pairs[:, 1]]
+    x_iou = _axis_iou(a[:, 0], a[:, 2], b[:, 0], b[:, 2])
+    y_iou = _axis_iou(a[:, 1], a[:, 3], b[:, 1], b[:, 3])
+    overlaps = (x_iou > 0) & (y_iou > 0)
+    aligned = (x_iou >= threshold) | (y_iou >= threshold)
+
+    parent = list(range(len(batch.cls)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs[overlaps & aligned].tolist():
+        parent[find(j)] = find(i)
+
+    return merge_groups(batch, np.array([find(i) for i in range(len(parent))]))
+
+
+def merge_groups(batch: ComponentBatch, roots: np.ndarray) -> ComponentBatch:
+    """
+    Collapse the detections that share a root (e.g. a union-find root)
+    into one each: the union box, with the class, confidence and
+    measurements of the most confident member. Groups keep the order of
+    their first member.
+    """
+    if len(np.unique(roots)) == len(roots):
+        return batch
+
+    boxes = batch.xyxy
+
+    # Groups in order of their first member, as the unmerged rows were
+    _, first, group = np.unique(roots, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    group = rank[group]
+
+    count = len(order)
+    xyxy = np.empty((count, 4), np.float64)
+    xyxy[:, :2] = np.inf
+    xyxy[:, 2:] = -np.inf
+    np.minimum.at(xyxy[:, 0], group, boxes[:, 0])
+    np.minimum.at(xyxy[:, 1], group, boxes[:, 1])
+    np.maximum.at(xyxy[:, 2], group, boxes[:, 2])
+    np.maximum.at(xyxy[:, 3], group, boxes[:, 3])
+
+    # Most confident member of each group; the first one on ties
+    by_confidence = np.lexsort((np.arange(len(group)), -batch.conf, group))
+    best = by_confidence[np.searchsorted(group[by_confidence], np.arange(count))]
+
+    return ComponentBatch(batch.names, batch.cls[best], batch.conf[best], xyxy, batch.texts, batch.measured[best])
+
+
+def _axis_iou(a0: np.ndarray, a1: np.ndarray, b0: np.ndarray, b1: np.ndarray) -> np.ndarray:
+    """
+    IoU of each interval [a0, a1] with the matching interval [b0, b1].
+    """
+    inter = np.maximum(np.minimum(a1, b1) - np.maximum(a0, b0), 0)
+    union = np.maximum(a1, b1) - np.minimum(a0, b0)
+    return np.divide(inter, union, out=np.zeros_like(inter, dtype=np.float64), where=union > 0)
@@ -0,0 +1,214 @@
+import contextvars
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Tracing configuration
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "200"))  # finished traces kept for /debug/traces
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "0"))  # log traces slower than this; 0 is off
+
+
+def _new_id() -> str:
+    return os.urandom(8).hex()
+
+
+class Trace:
+    """
+    The spans of one request (or of one analysis in an inference worker),
+    as plain dicts: {"id", "parent", "name", "start" (epoch seconds),
+    "duration_ms", "attributes"}. Spans are appended as they finish, from
+    any thread that carries the trace's context.
+    """
+
+    def __init__(self, name: str):
+        self.id = _new_id()
+        self.name = name
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.root: Optional[Dict[str, Any]] = None  # set by collect()
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "spans": spans,
+        }
+
+
+# (trace, id of the enclosing span) for the code running now
+_current: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record the enclosed block as a span of the current trace, nested under
+    the enclosing span. Does nothing outside a trace.
+    """
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    trace, parent = current
+    record = {"id": _new_id(), "parent": parent, "name": name, "start": time.time(), "attributes": attributes}
+    token = _current.set((trace, record["id"]))
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _current.reset(token)
+        trace.add(record)
+
+
+def record_span(name: str, seconds: float, start: Optional[float] = None, **attributes) -> None:
+    """
+    Add a span that already finished: `seconds` long, starting at `start`
+    (epoch seconds) or ending now.
+    """
+    current = _current.get()
+    if current is None:
+        return
+    trace, parent = current
+    if start is None:
+        start = time.time() - seconds
+    trace.add({
+        "id": _new_id(),
+        "parent": parent,
+        "name": name,
+        "start": start,
+        "duration_ms": round(seconds * 1000, 3),
+        "attributes": attributes,
+    })
+
+
+def attach(spans: List[Dict[str, Any]]) -> None:
+    """
+    Add spans recorded elsewhere (an inference worker, see collect()) to
+    the current trace; their top-level spans go under the current span.
+    """
+    current = _current.get()
+    if current is None or not spans:
+        return
+    trace, parent = current
+    for record in spans:
+        trace.add(dict(record, parent=record["parent"] or parent))
+
+
+@contextmanager
+def collect(name: str, **attributes):
+    """
+    Trace the enclosed block on its own, with `name` as the root span, and
+    yield the Trace. Used where the spans have to be shipped elsewhere,
+    like the inference workers.
+    """
+    trace = Trace(name)
+    token = _current.set((trace, None))
+    try:
+        with span(name, **attributes) as root:
+            trace.root = root
+            yield trace
+    finally:
+        _current.reset(token)
+        trace.duration_ms = round((time.time() - trace.start) * 1000, 3)
+
+
+def propagate(func: Callable) -> Callable:
+    """
+    Wrap `func` to run in a copy of the caller's context, so spans from
+    executor threads end up in the caller's trace.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+class TraceStore:
+    """
+    The most recent finished traces, by id.
+    """
+
+    def __init__(self, size: int = TRACE_BUFFER):
+        self.size = size
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces[trace.id] = trace
+            while len(self._traces) > self.size:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            trace = self._traces.get(trace_id)
+        return trace.to_dict() if trace is not None else None
+
+    def recent(self, limit: int = 20, min_ms: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Summaries of the newest traces first, optionally only the slow ones.
+        """
+        with self._lock:
+            traces = list(reversed(self._traces.values()))
+        return [
+            {
+                "trace_id": trace.id,
+                "name": trace.name,
+                "start": trace.start,
+                "duration_ms": trace.duration_ms,
+                "spans": len(trace.spans),
+            }
+            for trace in traces
+            if (trace.duration_ms or 0.0) >= min_ms
+        ][:limit]
+
+
+store = TraceStore()
+
+
+@contextmanager
+def request_trace(name: str, **attributes):
+    """
+    Trace a request when tracing is on and the request is sampled, keeping
+    the finished trace in `store`. Yields the Trace or None.
+    """
+    if not TRACING_ENABLED or random.random() >= TRACE_SAMPLE_RATE:
+        yield None
+        return
+    trace = None
+    try:
+        with collect(name, **attributes) as trace:
+            yield trace
+    finally:
+        if trace is not None:
+            store.add(trace)
+            if TRACE_SLOW_SECONDS > 0 and trace.duration_ms >= TRACE_SLOW_SECONDS * 1000:
+                logger.warning(f"Slow request {trace.name}: {trace.duration_ms:.0f}ms, trace {trace.id}")
@@ -0,0 +1,256 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+from typing import List, Optional, Union
+
+from fastapi.concurrency import run_in_threadpool
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+# Upload configuration
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None  # None: the system temp directory
+
+# Room for the multipart boundaries, part headers and small form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Leading bytes of the formats OpenCV can decode
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+SNIFF_BYTES = 12
+
+
+class UploadTooLarge(Exception):
+    """
+    Raised as soon as an upload is known to exceed the size limit.
+    """
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class UnsupportedUpload(Exception):
+    """
+    Raised when the uploaded file is not an image format we can decode.
+    """
+
+
+class InvalidUpload(Exception):
+    """
+    Raised for malformed multipart bodies or a missing file field.
+    """
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Media type of an image from its first bytes, or None when it isn't
+    one of the formats in IMAGE_SIGNATURES (or WebP).
+    """
+    for signature, media_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class SpooledUpload:
+    """
+    An uploaded file, kept in memory up to `spool_bytes` and in a temporary
+    file on disk beyond that. The SHA-256 is computed while the data
+    streams in, so nothing has to re-read the file to hash it.
+
+    view() exposes the data without copying it (a memoryview or a read-only
+    mmap); `path` is set once the upload lives on disk, so other processes
+    can map the same file instead of receiving a pickled copy.
+    """
+
+    def __init__(self, filename: Optional[str] = None, spool_bytes: int = UPLOAD_SPOOL_BYTES):
+        self.filename = filename
+        self.spool_bytes = spool_bytes
+        self.media_type: Optional[str] = None
+        self.size = 0
+        self.path: Optional[str] = None
+
+        self._memory: Optional[bytearray] = bytearray()
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._digest = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    async def write(self, data: bytes) -> None:
+        self.size += len(data)
+        self._digest.update(data)
+        if self._file is None and self.size > self.spool_bytes:
+            await run_in_threadpool(self._rollover)
+        if self._file is not None:
+            await run_in_threadpool(self._file.write, data)
+        else:
+            self._memory.extend(data)
+
+    def _rollover(self) -> None:
+        self._file = tempfile.NamedTemporaryFile(prefix="upload-", dir=UPLOAD_DIR, delete=False)
+        self.path = self._file.name
+        self._file.write(self._memory)
+        self._memory = None
+
+    async def finish(self) -> None:
+        if self._file is not None:
+            await run_in_threadpool(self._file.flush)
+
+    def head(self, size: int = SNIFF_BYTES) -> bytes:
+        if self._memory is not None:
+            return bytes(self._memory[:size])
+        self._file.flush()
+        with open(self.path, "rb") as f:
+            return f.read(size)
+
+    def view(self) -> Union[memoryview, mmap.mmap]:
+        if self._memory is not None:
+            return memoryview(self._memory)
+        if self._mmap is None:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # Still referenced by an array; closed when collected
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self._file = None
+        self._memory = None
+
+
+async def receive_upload(
+    request: Request,
+    field: str = "file",
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    spool_bytes: int = UPLOAD_SPOOL_BYTES,
+) -> SpooledUpload:
+    """
+    Stream the `field` file out of a multipart request into a SpooledUpload.
+
+    Unlike UploadFile, the body is checked while it arrives: a declared
+    Content-Length over the limit is refused before reading anything,
+    the file is sniffed from its first bytes, and reading stops as soon
+    as the limit is crossed. Other form fields are skipped, not buffered.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUpload("Expected a multipart/form-data body")
+
+    body_limit = max_bytes + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > body_limit:
+        raise UploadTooLarge(max_bytes)
+
+    upload: Optional[SpooledUpload] = None
+    state = {"headers": [], "header_field": b"", "header_value": b"", "target": False, "done": False}
+    pending: List[bytes] = []
+
+    def on_part_begin():
+        state["headers"] = []
+        state["target"] = False
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"].append((state["header_field"].lower(), state["header_value"]))
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        nonlocal upload
+        disposition = dict(state["headers"]).get(b"content-disposition", b"")
+        _, options = parse_options_header(disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name == field and b"filename" in options and upload is None:
+            upload = SpooledUpload(options[b"filename"].decode("utf-8", "replace"), spool_bytes)
+            state["target"] = True
+
+    def on_part_data(data, start, end):
+        if state["target"]:
+            pending.append(data[start:end])
+
+    def on_part_end():
+        if state["target"]:
+            state["target"] = False
+            state["done"] = True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise UploadTooLarge(max_bytes)
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise InvalidUpload(f"Malformed multipart body: {e}")
+
+            for data in pending:
+                await upload.write(data)
+            pending.clear()
+
+            if upload is not None:
+                if upload.size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                # Sniff as soon as enough of the file has arrived
+                if upload.media_type is None and (upload.size >= SNIFF_BYTES or state["done"]):
+                    upload.media_type = sniff_image_type(upload.head())
+                    if upload.media_type is None:
+                        raise UnsupportedUpload("The uploaded file is not a supported image")
+
+        try:
+            parser.finalize()
+        except MultipartParseError as e:
+            raise InvalidUpload(f"Malformed multipart body: {e}")
+        if upload is None or not state["done"]:
+            raise InvalidUpload(f"Missing file field '{field}'")
+        if upload.size == 0:
+            raise UnsupportedUpload("The uploaded file is empty")
+        await upload.finish()
+    except BaseException:
+        if upload is not None:
+            upload.close()
+        raise
+
+    logger.info(f"Received upload '{upload.filename}' ({upload.media_type}, {upload.size} bytes)")
+    return upload
@@ -0,0 +1,71 @@
+"""
+Stub detector for benchmarking without the trained weights.
+"""
+
+from typing import List
+
+import cv2
+import numpy as np
+
+from app.detectors import Detections, Detector, DETECTOR_MAX_DETECTIONS
+
+STUB_NAMES = {0: "wall", 1: "door", 2: "window", 3: "floor"}
+
+
+class StubDetector(Detector):
+    """
+    Deterministic stand-in for the YOLO model, built from OpenCV
+    morphology so it does real, size-proportional work and returns a
+    realistic number of boxes: long horizontal and vertical strokes are
+    walls, small blobs doors or windows, and enclosed white areas floors.
+    It doesn't try to be accurate.
+    """
+
+    backend = "stub"
+    names = STUB_NAMES
+
+    def __init__(self, max_detections: int = DETECTOR_MAX_DETECTIONS):
+        self.max_detections = max_detections
+
+    def predict(self, images: List[np.ndarray]) -> List[Detections]:
+        return [self._detect(image) for image in images]
+
+    def _detect(self, image: np.ndarray) -> Detections:
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        length = max(15, min(gray.shape) // 40)
+
+        boxes, classes = [], []
+        for kernel in ((length, 1), (1, length)):
+            strokes = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, kernel))
+            for x, y, w, h in self._components(strokes, min_area=length):
+                boxes.append((x, y, x + w, y + h))
+                classes.append(0)
+
+        small = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+        for x, y, w, h in self._components(small, min_area=9):
+            if max(w, h) < length * 3 and min(w, h) > 2:
+                boxes.append((x, y, x + w, y + h))
+                classes.append(1 if w * h > length * length else 2)
+
+        for x, y, w, h in self._components(cv2.bitwise_not(ink), min_area=length * length * 4)[1:]:
+            boxes.append((x, y, x + w, y + h))
+            classes.append(3)
+
+        if not boxes:
+            return Detections.empty()
+        xyxy = np.array(boxes, np.float32)[:self.max_detections]
+        cls = np.array(classes, np.int64)[:self.max_detections]
+        # Larger boxes get higher confidence, so results are stable
+        area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+        conf = (0.5 + 0.5 * area / area.max()).astype(np.float32)
+        return Detections(xyxy, conf, cls)
+
+    @staticmethod
+    def _components(mask: np.ndarray, min_area: int) -> List[tuple]:
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        return [
+            tuple(int(v) for v in stats[i, :4])
+            for i in range(1, count)
+            if stats[i, cv2.CC_STAT_AREA] >= min_area
+        ]
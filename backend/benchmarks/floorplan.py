@@ -0,0 +1,185 @@
+"""
+Deterministic synthetic floor plans for the benchmarks.
+
+A plan is an outer wall split into rooms by partition walls, with door
+openings and swing arcs, windows in the outer walls and dimension text
+("4.5m", "12m2") in every room, drawn in dark ink on white paper. The
+same (width, height, seed, ...) always produces the same pixels.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]  # x0, y0, x1, y1
+
+INK = 0
+PAPER = 255
+PAGE_METRES = 20.0  # the shorter page side covers this many metres
+
+
+def generate_floor_plan(
+    width: int = 2400,
+    height: int = 1800,
+    seed: int = 0,
+    rooms: int = 8,
+    noise: float = 0.0,
+    text: bool = True,
+) -> Dict[str, Any]:
+    """
+    Draw a floor plan of width x height pixels with about `rooms` rooms.
+    `noise` (0 to 1) adds scanner-like grain, speckles and blur.
+
+    Returns {"image": grayscale uint8 page, "walls", "doors", "windows":
+    lists of boxes, "texts": [{"text", "box"}], "pixels_per_metre"}.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width), PAPER, np.uint8)
+    pixels_per_metre = min(width, height) / PAGE_METRES
+    thickness = max(3, min(width, height) // 150)
+    margin = int(min(width, height) * 0.06)
+
+    outer = (margin, margin, width - margin, height - margin)
+    walls: List[Box] = []
+    doors: List[Box] = []
+    windows: List[Box] = []
+    texts: List[Dict[str, Any]] = []
+
+    def wall(x0: int, y0: int, x1: int, y1: int) -> Box:
+        box = (x0, y0, x1, y1)
+        cv2.rectangle(image, (x0, y0), (x1, y1), INK, thickness=-1)
+        walls.append(box)
+        return box
+
+    x0, y0, x1, y1 = outer
+    wall(x0, y0, x1, y0 + thickness)
+    wall(x0, y1 - thickness, x1, y1)
+    wall(x0, y0, x0 + thickness, y1)
+    wall(x1 - thickness, y0, x1, y1)
+
+    # Split the largest room along its longer side until there are enough
+    partitions: List[Tuple[Box, bool]] = []
+    cells = [outer]
+    minimum = int(2.5 * pixels_per_metre)
+    while len(cells) < rooms:
+        cells.sort(key=lambda c: (c[2] - c[0]) * (c[3] - c[1]))
+        cx0, cy0, cx1, cy1 = cells.pop()
+        vertical = (cx1 - cx0) >= (cy1 - cy0)
+        span = (cx1 - cx0) if vertical else (cy1 - cy0)
+        if span < 2 * minimum:
+            cells.append((cx0, cy0, cx1, cy1))
+            break
+        at = int(rng.uniform(0.35, 0.65) * span)
+        if vertical:
+            x = cx0 + at
+            partitions.append((wall(x, cy0, x + thickness, cy1), True))
+            cells += [(cx0, cy0, x, cy1), (x, cy0, cx1, cy1)]
+        else:
+            y = cy0 + at
+            partitions.append((wall(cx0, y, cx1, y + thickness), False))
+            cells += [(cx0, cy0, cx1, y), (cx0, y, cx1, cy1)]
+
+    # A door in every partition: an opening plus its swing arc
+    door_width = int(0.9 * pixels_per_metre)
+    for (px0, py0, px1, py1), vertical in partitions:
+        length = (py1 - py0) if vertical else (px1 - px0)
+        if length < door_width * 3:
+            continue
+        at = int(rng.uniform(door_width, length - 2 * door_width))
+        if vertical:
+            opening = (px0, py0 + at, px1, py0 + at + door_width)
+            cv2.ellipse(image, (px1, opening[1]), (door_width, door_width), 0, 0, 90, INK, max(1, thickness // 3))
+            door = (px0, opening[1], px1 + door_width, opening[3])
+        else:
+            opening = (px0 + at, py0, px0 + at + door_width, py1)
+            cv2.ellipse(image, (opening[0], py1), (door_width, door_width), 0, 0, 90, INK, max(1, thickness // 3))
+            door = (opening[0], py0, opening[2], py1 + door_width)
+        cv2.rectangle(image, opening[:2], opening[2:], PAPER, thickness=-1)
+        doors.append(door)
+
+    # Windows in the outer walls: the wall opened up and three thin lines
+    window_width = int(1.2 * pixels_per_metre)
+    for side in range(4):
+        horizontal = side < 2
+        length = (x1 - x0) if horizontal else (y1 - y0)
+        for _ in range(int(rng.integers(1, 4))):
+            at = int(rng.uniform(window_width, max(window_width + 1, length - 2 * window_width)))
+            if horizontal:
+                wy = y0 if side == 0 else y1 - thickness
+                box = (x0 + at, wy, x0 + at + window_width, wy + thickness)
+            else:
+                wx = x0 if side == 2 else x1 - thickness
+                box = (wx, y0 + at, wx + thickness, y0 + at + window_width)
+            cv2.rectangle(image, box[:2], box[2:], PAPER, thickness=-1)
+            cv2.rectangle(image, box[:2], box[2:], INK, thickness=1)
+            if horizontal:
+                cv2.line(image, (box[0], (box[1] + box[3]) // 2), (box[2], (box[1] + box[3]) // 2), INK, 1)
+            else:
+                cv2.line(image, ((box[0] + box[2]) // 2, box[1]), ((box[0] + box[2]) // 2, box[3]), INK, 1)
+            windows.append(box)
+
+    # Dimension text: the room's width along the top, its area below it
+    if text:
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        font_scale = max(0.4, pixels_per_metre / 60)
+        stroke = max(1, int(font_scale * 2))
+        for cx0, cy0, cx1, cy1 in cells:
+            room_w = (cx1 - cx0) / pixels_per_metre
+            room_h = (cy1 - cy0) / pixels_per_metre
+            for n, label in enumerate((f"{room_w:.1f}m", f"{room_w * room_h:.0f}m2")):
+                (tw, th), baseline = cv2.getTextSize(label, font, font_scale, stroke)
+                tx = (cx0 + cx1 - tw) // 2
+                ty = cy0 + thickness + int((n + 1.5) * (th + baseline) * 1.5)
+                if tx <= cx0 or ty >= cy1:
+                    continue
+                cv2.putText(image, label, (tx, ty), font, font_scale, INK, stroke, cv2.LINE_AA)
+                texts.append({"text": label, "box": (tx, ty - th, tx + tw, ty + baseline)})
+
+    if noise > 0:
+        image = add_noise(image, noise, rng)
+
+    return {
+        "image": image,
+        "walls": walls,
+        "doors": doors,
+        "windows": windows,
+        "texts": texts,
+        "pixels_per_metre": pixels_per_metre,
+    }
+
+
+def add_noise(image: np.ndarray, level: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Scanner-like degradation: Gaussian grain, salt-and-pepper speckles
+    and, above level 0.5, a slight blur.
+    """
+    noisy = image.astype(np.float32) + rng.normal(0, 40 * level, image.shape)
+    speckles = rng.random(image.shape)
+    noisy[speckles < 0.005 * level] = INK
+    noisy[speckles > 1 - 0.005 * level] = PAPER
+    noisy = np.clip(noisy, 0, 255).astype(np.uint8)
+    if level > 0.5:
+        noisy = cv2.GaussianBlur(noisy, (3, 3), 0)
+    return noisy
+
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    """
+    Page sizes from "WxH,WxH,...".
+    """
+    sizes = []
+    for size in value.split(","):
+        width, _, height = size.strip().lower().partition("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    The page as an upload: a colour PNG, like a scanned or exported plan.
+    """
+    ok, buffer = cv2.imencode(".png", cv2.cvtColor(image, cv2.COLOR_GRAY2BGR))
+    if not ok:
+        raise ValueError("Failed to encode the floor plan")
+    return buffer.tobytes()
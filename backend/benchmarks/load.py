@@ -0,0 +1,408 @@
+"""
+HTTP load test for the upload and cost endpoints.
+
+    python -m benchmarks.load                                  # in-process: stub model, SQLite
+    python -m benchmarks.load --concurrency 1,2,4,8,16 --duration 30 --output load.json
+    python -m benchmarks.load --url http://localhost:8000 --mix analyze=3,cost-data=1,health=1
+    python -m benchmarks.load --compare previous.json ...      # print the change per stage
+
+Runs a closed loop of concurrent clients for `--duration` seconds at each
+concurrency level, picking endpoints by the weights in `--mix` and
+drawings from the synthetic floor plans in `--sizes`. Reports throughput,
+p50/p95/p99 latency and error rate per level and endpoint as JSON, and the
+highest concurrency that stayed within `--p99-limit-ms` and
+`--max-error-rate`.
+
+In-process runs serve the app over ASGI in the same event loop, with the
+stub detector and a throwaway SQLite database in place of the model and
+Postgres; the client's own overhead is included in the latencies. Point
+`--url` at a running server for numbers of a real pod.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+# The app is only imported for in-process runs, after the environment
+# points it at the stand-ins
+from .floorplan import encode_png, generate_floor_plan, parse_sizes
+
+logger = logging.getLogger("benchmarks.load")
+
+LOAD_DEFAULT_MIX = "analyze=4,upload=2,cost-data=3,health=1"
+LOAD_DEFAULT_SIZES = "1200x900,2400x1800"
+LOAD_P99_LIMIT_MS = float(os.getenv("LOAD_P99_LIMIT_MS", "10000"))
+LOAD_MAX_ERROR_RATE = float(os.getenv("LOAD_MAX_ERROR_RATE", "0.01"))
+
+COST_ITEMS = ["wall", "floor", "window", "door", "roof"]
+
+# name -> (method, path); uploads send a drawing as the "file" field
+ENDPOINTS = {
+    "analyze": ("POST", "/floor-plans/analyze"),
+    "upload": ("POST", "/upload-drawing"),
+    "cost-data": ("GET", "/cost-data/{item}"),
+    "health": ("GET", "/health"),
+}
+UPLOADS = {"analyze", "upload"}
+
+
+def parse_mix(value: str) -> List[Tuple[str, float]]:
+    mix = []
+    for entry in value.split(","):
+        name, _, weight = entry.strip().partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}'. Known endpoints: {', '.join(ENDPOINTS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def tagged_png(data: bytes, tag: str) -> bytes:
+    """
+    The PNG with a tEXt chunk before IEND. Decoders ignore it, but every
+    tag gives a different file, so uploads aren't served from the
+    analysis cache.
+    """
+    body = b"loadtest\x00" + tag.encode()
+    chunk = struct.pack(">I", len(body)) + b"tEXt" + body + struct.pack(">I", zlib.crc32(b"tEXt" + body))
+    return data[:-12] + chunk + data[-12:]
+
+
+class Sample:
+    __slots__ = ("endpoint", "status", "seconds", "error")
+
+    def __init__(self, endpoint: str, status: int, seconds: float, error: Optional[str] = None):
+        self.endpoint = endpoint
+        self.status = status
+        self.seconds = seconds
+        self.error = error
+
+
+class LoadTest:
+    """
+    Closed-loop load: each client sends its next request as soon as the
+    previous one finished.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        mix: List[Tuple[str, float]],
+        drawings: Dict[str, bytes],
+        seed: int = 0,
+        preset: Optional[str] = None,
+        unique: bool = True,
+    ):
+        self.client = client
+        self.names = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.drawings = drawings
+        self.rng = random.Random(seed)
+        self.preset = preset
+        self.unique = unique
+        self._uploads = 0
+
+    async def request(self, name: str) -> Sample:
+        method, path = ENDPOINTS[name]
+        label = name
+        kwargs: Dict[str, Any] = {}
+        if name in UPLOADS:
+            size = self.rng.choice(list(self.drawings))
+            label = f"{name}@{size}"
+            data = self.drawings[size]
+            if self.unique:
+                self._uploads += 1
+                data = tagged_png(data, str(self._uploads))
+            kwargs["files"] = {"file": ("plan.png", data, "image/png")}
+            if self.preset:
+                kwargs["params"] = {"preset": self.preset}
+        path = path.format(item=self.rng.choice(COST_ITEMS))
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            await response.aread()
+            error = None if response.status_code < 400 else response.text[:200]
+            return Sample(label, response.status_code, time.perf_counter() - start, error)
+        except Exception as e:
+            return Sample(label, 0, time.perf_counter() - start, f"{type(e).__name__}: {str(e)}")
+
+    async def client_loop(self, deadline: float, samples: List[Sample]) -> None:
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(self.names, self.weights)[0]
+            samples.append(await self.request(name))
+
+    async def run(self, concurrency: int, duration: float) -> Tuple[List[Sample], float]:
+        samples: List[Sample] = []
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(self.client_loop(deadline, samples) for _ in range(concurrency)))
+        # Requests in flight at the deadline still finish, so measure to the end
+        return samples, time.perf_counter() - start
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    """
+    Throughput, latency percentiles, error rate and status counts.
+    """
+    if not samples:
+        return {"requests": 0, "throughput_rps": 0.0, "error_rate": 0.0, "latency_ms": {}, "status": {}}
+    latency = np.array([sample.seconds for sample in samples]) * 1000
+    errors = [sample for sample in samples if sample.error is not None]
+    status: Dict[str, int] = {}
+    for sample in samples:
+        status[str(sample.status)] = status.get(str(sample.status), 0) + 1
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99]).tolist()
+    summary = {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 3),
+        "error_rate": round(len(errors) / len(samples), 4),
+        "latency_ms": {
+            "p50": round(p50, 2),
+            "p95": round(p95, 2),
+            "p99": round(p99, 2),
+            "max": round(float(latency.max()), 2),
+            "mean": round(float(latency.mean()), 2),
+        },
+        "status": dict(sorted(status.items())),
+    }
+    if errors:
+        summary["first_error"] = errors[0].error
+    return summary
+
+
+def stage_report(concurrency: int, samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    endpoints: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        endpoints.setdefault(sample.endpoint, []).append(sample)
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        **summarize(samples, elapsed),
+        "endpoints": {name: summarize(group, elapsed) for name, group in sorted(endpoints.items())},
+    }
+
+
+def max_sustained(stages: List[Dict[str, Any]], p99_limit_ms: float, max_error_rate: float) -> Optional[int]:
+    """
+    Highest concurrency level that stayed within the p99 and error limits,
+    among the levels up to the first that didn't.
+    """
+    sustained = None
+    for stage in stages:
+        if not stage["requests"] or stage["error_rate"] > max_error_rate or stage["latency_ms"]["p99"] > p99_limit_ms:
+            break
+        sustained = stage["concurrency"]
+    return sustained
+
+
+def environment(url: Optional[str]) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "target": url or "in-process",
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def seed_prices(engine) -> None:
+    """
+    Material, labor and equipment rows for COST_ITEMS in the default
+    region, so /cost-data finds them in an empty database.
+    """
+    from sqlalchemy.orm import Session
+    from app.cost_calc import COST_RATES
+    from app.models import MaterialCost, LaborCost, EquipmentCost
+
+    with Session(engine) as db:
+        if db.query(MaterialCost).first() is not None:
+            return
+        for item in COST_ITEMS:
+            rates = COST_RATES[item]
+            db.add(MaterialCost(name=item, unit=rates["material"]["unit"], unit_cost=rates["material"]["rate"], region="default"))
+            db.add(LaborCost(trade=item, hourly_rate=rates["labor"]["rate"], region="default"))
+            db.add(EquipmentCost(name=item, daily_rate=rates["equipment"]["rate"], region="default"))
+        db.commit()
+
+
+async def in_process_client(timeout: float, model: Optional[str]) -> Tuple[httpx.AsyncClient, Any]:
+    """
+    The app served over ASGI with SQLite instead of Postgres and the stub
+    detector instead of the trained model (unless `model` is given).
+    Returns the client and the app, whose startup handlers have run.
+    """
+    directory = tempfile.mkdtemp(prefix="loadtest-")
+    database = os.path.join(directory, "loadtest.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{database}")
+    os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{database}")
+    os.environ.setdefault("ANALYSIS_CACHE_DIR", os.path.join(directory, "analysis-cache"))
+    if model:
+        os.environ["YOLO_MODEL_PATH"] = model
+    else:
+        # The stub detector only exists in this process
+        os.environ["INFERENCE_POOL_MODE"] = "thread"
+        os.environ.setdefault("MODEL_WARMUP", "false")
+
+    from app import ai_module, ocr
+    from app.database import engine
+    from app.main import app
+    from app.models import Base
+
+    Base.metadata.create_all(engine)
+    seed_prices(engine)
+    if not model:
+        from .detector import StubDetector
+        ai_module.model = StubDetector()
+        ai_module._model_state.update(loaded=True, backend="stub")
+    try:
+        ocr.pytesseract.get_tesseract_version()
+    except Exception:
+        logger.warning("tesseract not found: text regions are found but not read")
+        ocr._ocr_region = lambda image, region, config: []
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout), app
+
+
+async def run(args) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    sizes = parse_sizes(args.sizes)
+    drawings = {
+        f"{width}x{height}": encode_png(generate_floor_plan(width, height, seed=args.seed, noise=args.noise)["image"])
+        for width, height in sizes
+    }
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        client, app = await in_process_client(args.timeout, args.model)
+
+    stages = []
+    try:
+        load = LoadTest(client, mix, drawings, args.seed, args.preset, unique=not args.repeat_drawings)
+        if args.warmup > 0:
+            await load.run(levels[0], args.warmup)
+        for concurrency in levels:
+            samples, elapsed = await load.run(concurrency, args.duration)
+            stage = stage_report(concurrency, samples, elapsed)
+            stages.append(stage)
+            logger.info(
+                f"concurrency {concurrency}: {stage['throughput_rps']} req/s, "
+                f"p99 {stage['latency_ms'].get('p99')}ms, errors {stage['error_rate']:.1%}"
+            )
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    return {
+        "environment": environment(args.url),
+        "config": {
+            "mix": dict(mix),
+            "sizes": list(drawings),
+            "concurrency": levels,
+            "duration_s": args.duration,
+            "preset": args.preset,
+            "unique_drawings": not args.repeat_drawings,
+            "p99_limit_ms": args.p99_limit_ms,
+            "max_error_rate": args.max_error_rate,
+        },
+        "stages": stages,
+        "max_sustained_concurrency": max_sustained(stages, args.p99_limit_ms, args.max_error_rate),
+    }
+
+
+def print_report(report: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+    before = {}
+    if previous is not None:
+        for stage in previous["stages"]:
+            before[(stage["concurrency"], "all")] = stage
+            for name, endpoint in stage["endpoints"].items():
+                before[(stage["concurrency"], name)] = endpoint
+
+    def change(key, current, field):
+        old = before.get(key)
+        if not old or not old.get("requests"):
+            return ""
+        old_value = old["latency_ms"]["p99"] if field == "p99" else old[field]
+        new_value = current["latency_ms"]["p99"] if field == "p99" else current[field]
+        return f"{(new_value / old_value - 1) * 100:+.0f}%" if old_value else ""
+
+    print(f"{'conc':>5} {'endpoint':<24}{'req':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+          f"{'vs req/s':>10}{'vs p99':>8}")
+    for stage in report["stages"]:
+        rows = [("all", stage)] + list(stage["endpoints"].items())
+        for name, row in rows:
+            if not row["requests"]:
+                continue
+            latency = row["latency_ms"]
+            key = (stage["concurrency"], name)
+            print(
+                f"{stage['concurrency']:>5} {name:<24}{row['requests']:>7}{row['throughput_rps']:>9.2f}"
+                f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}{row['error_rate']:>8.1%}"
+                f"{change(key, row, 'throughput_rps'):>10}{change(key, row, 'p99'):>8}"
+            )
+    print(f"Max sustained concurrency: {report['max_sustained_concurrency']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="Base URL of a running server; in-process when omitted")
+    parser.add_argument("--mix", default=LOAD_DEFAULT_MIX, help=f"Endpoint weights, of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--sizes", default=LOAD_DEFAULT_SIZES, help="Drawing sizes as WxH,WxH,...")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Concurrency levels, run in order")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of untimed load first")
+    parser.add_argument("--preset", help="Preprocessing preset for uploads")
+    parser.add_argument("--repeat-drawings", action="store_true", help="Resend identical files (analysis cache hits)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=0.2, help="Scan noise level of the drawings, 0 to 1")
+    parser.add_argument("--model", help="In-process only: serve these weights instead of the stub detector")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--p99-limit-ms", type=float, default=LOAD_P99_LIMIT_MS)
+    parser.add_argument("--max-error-rate", type=float, default=LOAD_MAX_ERROR_RATE)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="A previous report to compare with")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for name in ("app", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    report = asyncio.run(run(args))
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(report, previous)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
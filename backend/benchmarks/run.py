@@ -0,0 +1,305 @@
+"""
+Stage-level benchmarks on synthetic floor plans.
+
+    python -m benchmarks.run                       # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline       # record a new baseline
+    python -m benchmarks.run --sizes 1200x900 --repeat 3 --stages preprocess,calculate_costs
+
+Times every stage of the analysis (decode, preprocessing, detection, OCR,
+post-processing, costing and the whole analyze_drawing) at several page
+sizes, with a stub detector unless --model points at real weights, and
+exits with 1 when a stage got slower or uses more memory than the
+baseline allows.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Single-image detection: the micro-batching window would be measured as latency
+os.environ.setdefault("YOLO_BATCH_SIZE", "1")
+os.environ.setdefault("MODEL_WARMUP", "false")
+os.environ.setdefault("ANALYSIS_CACHE_DISK", "false")
+
+import cv2
+import numpy as np
+
+from app import ai_module, ocr
+from app.components import ComponentBatch
+from app.cost_calc import calculate_costs, COST_RATES
+from app.detectors import load_detector
+from app.postprocess import postprocess
+from app.preprocessing import PRESETS
+
+from .detector import StubDetector
+from .floorplan import encode_png, generate_floor_plan, parse_sizes
+
+logger = logging.getLogger("benchmarks")
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_BASELINE = os.getenv("BENCHMARK_BASELINE", os.path.join(BENCHMARK_DIR, "baseline.json"))
+BENCHMARK_THRESHOLD = float(os.getenv("BENCHMARK_THRESHOLD", "0.25"))  # allowed relative regression
+BENCHMARK_MIN_DELTA_MS = float(os.getenv("BENCHMARK_MIN_DELTA_MS", "2"))  # ignore smaller slowdowns
+BENCHMARK_MIN_DELTA_MB = float(os.getenv("BENCHMARK_MIN_DELTA_MB", "2"))
+DEFAULT_SIZES = "1200x900,2400x1800,4800x3600"
+COST_COMPONENTS = 10000
+
+STAGES = [
+    "decode", "preprocess", "detect", "ocr_regions", "ocr",
+    "postprocess", "calculate_costs", "analyze_drawing",
+]
+
+
+class Stage:
+    """
+    One benchmarked operation: `run` is timed, `work` is the number of
+    `unit`s it processes per call (for throughput).
+    """
+
+    def __init__(self, name: str, run: Callable[[], Any], work: float, unit: str):
+        self.name = name
+        self.run = run
+        self.work = work
+        self.unit = unit
+
+
+def measure(stage: Stage, repeat: int, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Latency over `repeat` runs after `warmup` runs, and the peak of
+    Python-tracked memory (which includes NumPy and OpenCV arrays) during
+    one more run.
+    """
+    for _ in range(warmup):
+        stage.run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage.run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        stage.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times.sort()
+    median = statistics.median(times)
+    return {
+        "median_ms": round(median * 1000, 3),
+        "p95_ms": round(times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))] * 1000, 3),
+        "min_ms": round(times[0] * 1000, 3),
+        "throughput": round(stage.work / median, 2) if median > 0 else None,
+        "unit": f"{stage.unit}/s",
+        "peak_mb": round(peak / 2**20, 2),
+        "runs": repeat,
+    }
+
+
+def tesseract_available() -> bool:
+    try:
+        ocr.pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def synthetic_components(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    `count` component dicts of the known types with random boxes, for
+    costing at a scale no single drawing reaches.
+    """
+    rng = np.random.default_rng(seed)
+    types = list(COST_RATES)
+    xy = rng.uniform(0, 20000, (count, 2))
+    wh = rng.uniform(100, 4000, (count, 2))
+    batch = ComponentBatch(
+        types,
+        rng.integers(0, len(types), count),
+        rng.uniform(0.3, 1.0, count).astype(np.float32),
+        np.hstack([xy, xy + wh]),
+    )
+    return batch.to_components()
+
+
+def plan_stages(width: int, height: int, seed: int, noise: float, with_ocr: bool) -> List[Stage]:
+    """
+    The stages for one synthetic page, each fed the previous stage's output.
+    """
+    plan = generate_floor_plan(width, height, seed=seed, noise=noise)
+    data = encode_png(plan["image"])
+    megapixels = width * height / 1e6
+    preset = PRESETS["quality"]
+
+    image = preset.decode(data)
+    processed = ai_module.preprocess_image(image)
+    detections = ai_module.detect_components(processed)
+    # Ground-truth dimension text stands in for OCR output when tesseract is missing
+    texts = [
+        {
+            "type": "text_annotation",
+            "text": t["text"],
+            "confidence": 0.9,
+            "dimensions": {"x": t["box"][0], "y": t["box"][1],
+                           "width": t["box"][2] - t["box"][0], "height": t["box"][3] - t["box"][1]},
+        }
+        for t in plan["texts"]
+    ]
+    components = detections.with_texts(texts)
+    processed_components = postprocess(components)
+
+    stages = [
+        Stage("decode", lambda: preset.decode(data), megapixels, "MPx"),
+        Stage("preprocess", lambda: ai_module.preprocess_image(image), megapixels, "MPx"),
+        Stage("detect", lambda: ai_module.detect_components(processed), megapixels, "MPx"),
+        Stage("ocr_regions", lambda: ocr.find_text_regions(processed), megapixels, "MPx"),
+        Stage("postprocess", lambda: postprocess(components), max(1, len(components)), "components"),
+        Stage(
+            "calculate_costs",
+            lambda: calculate_costs(processed_components),
+            max(1, len(processed_components.cls)),
+            "components",
+        ),
+    ]
+    if with_ocr:
+        stages.append(Stage("ocr", lambda: ai_module.extract_text(processed), megapixels, "MPx"))
+        stages.append(Stage("analyze_drawing", lambda: ai_module.analyze_drawing(data), megapixels, "MPx"))
+    return stages
+
+
+def run(
+    sizes: List[Tuple[int, int]],
+    repeat: int,
+    seed: int = 0,
+    noise: float = 0.2,
+    only: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Benchmark every stage at every size. Returns {"<width>x<height>/<stage>": result}.
+    """
+    with_ocr = tesseract_available()
+    if not with_ocr:
+        logger.warning("tesseract not found: skipping the ocr and analyze_drawing stages")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for width, height in sizes:
+        for stage in plan_stages(width, height, seed, noise, with_ocr):
+            if only and stage.name not in only:
+                continue
+            key = f"{width}x{height}/{stage.name}"
+            results[key] = measure(stage, repeat)
+            logger.info(f"{key}: {results[key]['median_ms']}ms")
+
+    if not only or "calculate_costs" in only:
+        components = synthetic_components(COST_COMPONENTS, seed)
+        stage = Stage("calculate_costs", lambda: calculate_costs(components), COST_COMPONENTS, "components")
+        results[f"{COST_COMPONENTS}_components/calculate_costs"] = measure(stage, repeat)
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float = BENCHMARK_THRESHOLD
+) -> List[str]:
+    """
+    Regressions of `results` against `baseline`: stages whose median
+    latency or peak memory grew by more than `threshold` (relative) and
+    more than BENCHMARK_MIN_DELTA_MS / BENCHMARK_MIN_DELTA_MB (absolute,
+    so noise on sub-millisecond stages doesn't fail a run).
+    """
+    failures = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        slower = result["median_ms"] - base["median_ms"]
+        if slower > BENCHMARK_MIN_DELTA_MS and result["median_ms"] > base["median_ms"] * (1 + threshold):
+            failures.append(f"{key}: median {base['median_ms']}ms -> {result['median_ms']}ms")
+        grown = result["peak_mb"] - base["peak_mb"]
+        if grown > BENCHMARK_MIN_DELTA_MB and result["peak_mb"] > base["peak_mb"] * (1 + threshold):
+            failures.append(f"{key}: peak memory {base['peak_mb']}MB -> {result['peak_mb']}MB")
+    return failures
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "detector": ai_module.model.backend if ai_module.model is not None else None,
+    }
+
+
+def print_table(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'stage':<42}{'median ms':>12}{'p95 ms':>10}{'throughput':>26}{'peak MB':>10}{'vs base':>10}")
+    for key, result in results.items():
+        base = baseline.get(key)
+        change = f"{(result['median_ms'] / base['median_ms'] - 1) * 100:+.0f}%" if base and base["median_ms"] else ""
+        throughput = f"{result['throughput']} {result['unit']}" if result["throughput"] is not None else ""
+        print(
+            f"{key:<42}{result['median_ms']:>12}{result['p95_ms']:>10}"
+            f"{throughput:>26}{result['peak_mb']:>10}{change:>10}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Page sizes as WxH,WxH,...")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=0.2, help="Scan noise level, 0 to 1")
+    parser.add_argument("--stages", help=f"Comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--model", help="Benchmark these weights instead of the stub detector")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=BENCHMARK_THRESHOLD)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for name in ("app", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    ai_module.model = load_detector(args.model, strict=True) if args.model else StubDetector()
+    only = [stage.strip() for stage in args.stages.split(",")] if args.stages else None
+    results = run(parse_sizes(args.sizes), max(1, args.repeat), args.seed, args.noise, only)
+    report = {"environment": environment(), "results": results}
+
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+
+    failures = compare(results, baseline, args.threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""Composite (name, region) indexes for the price catalog tables
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_material_costs_name_region", "material_costs", ["name", "region"])
+    op.create_index("ix_labor_costs_trade_region", "labor_costs", ["trade", "region"])
+    op.create_index("ix_equipment_costs_name_region", "equipment_costs", ["name", "region"])
+    op.create_index("ix_indirect_costs_region_name", "indirect_costs", ["region", "name"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_indirect_costs_region_name", table_name="indirect_costs")
+    op.drop_index("ix_equipment_costs_name_region", table_name="equipment_costs")
+    op.drop_index("ix_labor_costs_trade_region", table_name="labor_costs")
+    op.drop_index("ix_material_costs_name_region", table_name="material_costs")
@@ -0,0 +1,33 @@
+"""Hashed, indexed API keys
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("api_key_hash", sa.String(length=64), nullable=True))
+    op.create_index("ix_users_api_key_hash", "users", ["api_key_hash"], unique=True)
+    # Move existing keys over to their hash; the plain-text column is kept
+    # (nullable) for now but no longer read.
+    op.execute(
+        "UPDATE users SET api_key_hash = encode(sha256(api_key::bytea), 'hex'), api_key = NULL "
+        "WHERE api_key IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    # Plain-text keys can't be recovered from their hashes
+    op.drop_index("ix_users_api_key_hash", table_name="users")
+    op.drop_column("users", "api_key_hash")
@@ -0,0 +1,28 @@
+"""Detected components, region and pricing time on projects
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("projects", sa.Column("components", sa.LargeBinary(), nullable=True))
+    op.add_column("projects", sa.Column("region", sa.String(), nullable=True))
+    op.add_column("projects", sa.Column("priced_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("projects", "priced_at")
+    op.drop_column("projects", "region")
+    op.drop_column("projects", "components")
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from app import analysis_config
+from app.analysis_cache import AnalysisCache, settings_fingerprint
+from app.analysis_config import preset_name
+from app.components import ComponentBatch
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(directory=str(tmp_path), model_path=str(tmp_path / "missing.pt"))
+
+
+def batch():
+    return ComponentBatch(["wall"], np.array([0]), np.array([0.9], np.float32), np.array([[0, 0, 100, 10]], np.float64))
+
+
+def test_requests_without_a_preset_share_entries_with_the_default(monkeypatch):
+    monkeypatch.setattr(analysis_config, "PREPROCESS_PRESET", "Balanced")
+    assert preset_name(None) == preset_name("balanced") == preset_name("BALANCED") == "balanced"
+    default = AnalysisCache.key_for_digest("ab", preset_name(None))
+    assert default == AnalysisCache.key_for_digest("ab", preset_name("balanced"))
+    assert default != AnalysisCache.key_for_digest("ab", preset_name("quality"))
+
+
+@pytest.mark.parametrize("name, value", [
+    ("DETECTOR_CONF_THRESHOLD", 0.5),
+    ("DETECTOR_MAX_DETECTIONS", 50),
+    ("TILE_SIZE", 640),
+    ("POSTPROCESS_ENABLED", False),
+    ("PREPROCESS_NOISE_HIGH", 9.0),
+    ("OCR_TESSERACT_CONFIG", "--psm 11"),
+])
+def test_settings_that_change_the_output_change_the_version(tmp_path, monkeypatch, name, value):
+    before = AnalysisCache(directory=str(tmp_path)).version
+    monkeypatch.setattr(analysis_config, name, value)
+    assert AnalysisCache(directory=str(tmp_path)).version != before
+
+
+def test_settings_fingerprint_is_stable():
+    assert settings_fingerprint() == settings_fingerprint()
+    assert all(hasattr(analysis_config, name) for name in analysis_config.FINGERPRINTED)
+
+
+def test_modules_apply_the_fingerprinted_settings():
+    from app import ai_module, detectors, ocr, postprocess
+
+    assert detectors.DETECTOR_IOU_THRESHOLD == analysis_config.DETECTOR_IOU_THRESHOLD
+    assert ai_module.TILE_SIZE == analysis_config.TILE_SIZE
+    assert postprocess.WALL_MERGE_GAP == analysis_config.WALL_MERGE_GAP
+    assert ocr.OCR_MAX_REGIONS == analysis_config.OCR_MAX_REGIONS
+
+
+def test_entries_from_other_settings_are_not_served(tmp_path, monkeypatch, cache):
+    key = AnalysisCache.key_for_digest("ab", "balanced")
+    cache.put(key, batch())
+    assert AnalysisCache(directory=str(tmp_path), model_path=cache.model_path).get(key) is not None
+
+    monkeypatch.setattr(analysis_config, "DETECTOR_IOU_THRESHOLD", 0.3)
+    assert AnalysisCache(directory=str(tmp_path), model_path=cache.model_path).get(key) is None
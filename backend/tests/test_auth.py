@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import auth
+from app.auth import PrincipalCache
+from app.models import Base, User, UserPlan
+
+
+def make_user(user_id, email=None):
+    return User(id=user_id, email=email or f"user{user_id}@example.com", plan=UserPlan.FREE)
+
+
+def test_get_returns_cached_users_until_the_ttl():
+    cache = PrincipalCache(ttl=0.05)
+    user = make_user(1)
+    cache.put("key", user)
+    assert cache.get("key") is user
+    time.sleep(0.06)
+    assert cache.get("key") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_with_the_token():
+    cache = PrincipalCache(ttl=60)
+    cache.put("token", make_user(1), expires_at=time.time() - 1)
+    assert cache.get("token") is None
+
+
+def test_invalidate_user_drops_every_key_of_that_user():
+    cache = PrincipalCache(ttl=60)
+    cache.put("token-a", make_user(1))
+    cache.put("api-key", make_user(1))
+    cache.put("token-b", make_user(2))
+
+    cache.invalidate_user(1)
+    assert cache.get("token-a") is None
+    assert cache.get("api-key") is None
+    assert cache.get("token-b") is not None
+    # Unknown and missing ids are a no-op
+    cache.invalidate_user(3)
+    cache.invalidate_user(None)
+
+
+def test_full_cache_evicts_the_least_recently_used_entry():
+    cache = PrincipalCache(ttl=60, max_size=2)
+    cache.put("old", make_user(1))
+    cache.put("used", make_user(2))
+    cache.get("old")
+    cache.put("new", make_user(3))
+    assert cache.get("used") is None
+    assert cache.get("old") is not None and cache.get("new") is not None
+
+    cache.invalidate_user(2)
+    cache.put("new", make_user(3))
+    assert cache.get("old") is not None
+
+
+def test_zero_ttl_disables_the_cache():
+    cache = PrincipalCache(ttl=0)
+    cache.put("key", make_user(1))
+    assert cache.get("key") is None
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(auth, "principal_cache", PrincipalCache(ttl=60))
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.mark.parametrize("change", [
+    lambda user: setattr(user, "plan", UserPlan.ENTERPRISE),
+    lambda user: setattr(user, "email", "renamed@example.com"),
+    lambda user: auth.set_api_key(user),
+])
+def test_changing_a_stored_user_invalidates_its_entries(db, change):
+    user = User(email="owner@example.com", password_hash="x", plan=UserPlan.FREE)
+    db.add(user)
+    db.commit()
+    auth.principal_cache.put("key", user)
+
+    change(user)
+    assert auth.principal_cache.get("key") is None
+
+
+def test_deleting_a_user_invalidates_its_entries(db):
+    user = User(email="owner@example.com", password_hash="x", plan=UserPlan.FREE)
+    db.add(user)
+    db.commit()
+    auth.principal_cache.put("key", user)
+
+    db.delete(user)
+    db.commit()
+    assert auth.principal_cache.get("key") is None
+
+
+def test_unchanged_or_new_users_keep_their_entries(db):
+    user = User(email="owner@example.com", password_hash="x", plan=UserPlan.FREE)
+    db.add(user)
+    db.commit()
+    auth.principal_cache.put("key", user)
+
+    user.plan = UserPlan.FREE
+    User(id=user.id, email="copy@example.com", plan=UserPlan.PROFESSIONAL)
+    assert auth.principal_cache.get("key") is user
+
+
+def test_bearer_tokens_are_cached_by_digest(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, "principal_cache", PrincipalCache(ttl=60))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'auth.db'}")
+
+    async def scenario():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            session.add(User(email="owner@example.com", password_hash="x", plan=UserPlan.FREE))
+            await session.commit()
+            token = auth.create_access_token({"sub": "owner@example.com"})
+            first = await auth.get_current_user(token, session)
+            second = await auth.get_current_user(token, session)
+        await engine.dispose()
+        return token, first, second
+
+    token, first, second = asyncio.run(scenario())
+    assert first.email == second.email == "owner@example.com"
+    assert auth.principal_cache.hits == 1
+    keys = list(auth.principal_cache._entries)
+    assert keys == [f"token:{hashlib.sha256(token.encode()).hexdigest()}"]
+    assert not any(token in key for key in keys)
@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.ai_module import BatchScheduler
+
+
+def image(value):
+    return np.full((4, 4), value, np.uint8)
+
+
+class RecordingModel:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, images):
+        with self.lock:
+            self.batches.append(len(images))
+        time.sleep(self.delay)
+        return [int(im[0, 0]) for im in images]
+
+
+def test_full_batch_runs_without_waiting_for_the_window():
+    model = RecordingModel()
+    batcher = BatchScheduler(model, max_batch_size=4, window_ms=10_000)
+    start = time.monotonic()
+    with ThreadPoolExecutor(4) as callers:
+        results = list(callers.map(lambda v: batcher.predict(image(v)), range(4)))
+    assert time.monotonic() - start < 5
+    assert sorted(results) == [0, 1, 2, 3]
+    assert model.batches == [4]
+
+
+def test_partial_batch_runs_when_the_window_closes():
+    model = RecordingModel()
+    batcher = BatchScheduler(model, max_batch_size=8, window_ms=50)
+    start = time.monotonic()
+    assert batcher.predict(image(7)) == 7
+    assert 0.04 <= time.monotonic() - start < 5
+    assert model.batches == [1]
+    assert batcher.stats()["batch_size_histogram"] == {1: 1}
+
+
+def test_every_caller_gets_the_result_for_its_own_image():
+    model = RecordingModel(delay=0.01)
+    batcher = BatchScheduler(model, max_batch_size=5, window_ms=20)
+    with ThreadPoolExecutor(16) as callers:
+        results = list(callers.map(lambda v: batcher.predict(image(v)), range(64)))
+    assert results == list(range(64))
+    assert sum(model.batches) == 64
+    assert max(model.batches) <= 5 and len(model.batches) < 64
+    stats = batcher.stats()
+    assert stats["images"] == 64 and stats["batches"] == len(model.batches)
+
+
+def test_a_failing_batch_fails_each_of_its_callers():
+    def predict(images):
+        raise RuntimeError("out of memory")
+
+    batcher = BatchScheduler(predict, max_batch_size=3, window_ms=10_000)
+    with ThreadPoolExecutor(3) as callers:
+        futures = [callers.submit(batcher.predict, image(v)) for v in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="out of memory"):
+                future.result(timeout=5)
+    # The batching thread survives the failure
+    batcher.predict_batch = RecordingModel()
+    with ThreadPoolExecutor(3) as callers:
+        assert sorted(callers.map(lambda v: batcher.predict(image(v)), range(3))) == [0, 1, 2]
+
+
+def test_batch_size_one_calls_the_model_directly():
+    model = RecordingModel()
+    batcher = BatchScheduler(model, max_batch_size=1, window_ms=10_000)
+    assert [batcher.predict(image(v)) for v in range(3)] == [0, 1, 2]
+    assert model.batches == [1, 1, 1] and batcher._thread is None
@@ -0,0 +1,81 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from app.components import BINARY_HEADER, MEASURED_FIELDS, ComponentBatch
+
+
+def batch():
+    measured = np.full((3, len(MEASURED_FIELDS)), np.nan)
+    measured[0, 0] = 4.5
+    measured[1, 1] = 1.89
+    measured[2, -1] = 12.25
+    return ComponentBatch(
+        ["wall", "door", "window"],
+        np.array([0, 1, 0], np.int64),
+        np.array([0.9, 0.75, 0.5], np.float32),
+        np.array([[0.5, 1.25, 100.125, 10.0], [20, 30, 60, 230], [1e6 / 3, 0, 1e6 / 3 + 1, 5]], np.float64),
+        texts=[{"type": "text_annotation", "text": "4.5m"}],
+        measured=measured,
+    )
+
+
+def test_bytes_round_trip_is_exact_and_drops_texts():
+    original = batch()
+    restored = ComponentBatch.from_bytes(original.to_bytes())
+    assert restored.names == original.names
+    assert restored.cls.tolist() == original.cls.tolist()
+    assert restored.conf.tolist() == original.conf.tolist()
+    # Boxes stay float64, so re-pricing reproduces the stored estimate
+    assert restored.xyxy.tolist() == original.xyxy.tolist()
+    np.testing.assert_array_equal(restored.measured, original.measured)
+    assert restored.texts == []
+    assert restored.detection_components() == original.detection_components()
+
+
+def test_empty_batch_round_trips():
+    restored = ComponentBatch.from_bytes(ComponentBatch.empty().to_bytes())
+    assert len(restored) == 0 and restored.names == []
+    assert restored.measured.shape == (0, len(MEASURED_FIELDS))
+
+
+@pytest.mark.parametrize("magic,fields", [(b"CB01", 0), (b"CB02", 2)])
+def test_reads_older_layouts(magic, fields):
+    # CB01 predates the measurements, CB02 stored only length and area
+    original = batch()
+    names = "\n".join(original.names).encode()
+    legacy = zlib.compress(b"".join([
+        BINARY_HEADER.pack(magic, 3, len(names)),
+        names,
+        original.cls.astype("<i4").tobytes(),
+        original.conf.astype("<f4").tobytes(),
+        original.xyxy.astype("<f8").tobytes(),
+        original.measured[:, :fields].astype("<f8").tobytes(),
+    ]))
+    restored = ComponentBatch.from_bytes(legacy)
+    assert restored.xyxy.tolist() == original.xyxy.tolist()
+    assert restored.measured.shape == (3, len(MEASURED_FIELDS))
+    np.testing.assert_array_equal(restored.measured[:, :fields], original.measured[:, :fields])
+    assert np.isnan(restored.measured[:, fields:]).all()
+
+
+def raw(data):
+    return zlib.decompress(data)
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: b"not zlib at all",
+    lambda data: zlib.compress(b"CB0"),
+    lambda data: zlib.compress(b"XXXX" + raw(data)[4:]),
+    lambda data: zlib.compress(raw(data)[:-8]),
+    lambda data: zlib.compress(raw(data) + b"\0" * 8),
+    # One more detection in the header than in the body
+    lambda data: zlib.compress(raw(data)[:4] + struct.pack("<I", 4) + raw(data)[8:]),
+    # A class id past the names
+    lambda data: zlib.compress(raw(data).replace(struct.pack("<i", 1), struct.pack("<i", 7), 1)),
+], ids=["zlib", "short", "magic", "truncated", "trailing", "count", "class"])
+def test_rejects_malformed_data(corrupt):
+    with pytest.raises(ValueError):
+        ComponentBatch.from_bytes(corrupt(batch().to_bytes()))
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app.cost_calc import (
+    COST_RATES, REGIONAL_FACTORS, calculate_costs, calculate_scenarios, component_arrays, RATE_TABLE
+)
+from app.cost_engine import _round_array, component_quantities, sweep_costs
+
+
+def component(component_type, width, height, x=0.0, y=0.0):
+    return {
+        "type": component_type,
+        "confidence": 0.9,
+        "dimensions": {"x": x, "y": y, "width": width, "height": height},
+    }
+
+
+def expected_columns(result):
+    direct = result["direct_costs"]
+    return {
+        "total_cost": result["total_cost"],
+        "direct_total": direct["total"],
+        "material_total": direct["material_total"],
+        "labor_total": direct["labor_total"],
+        "equipment_total": direct["equipment_total"],
+        "indirect_total": round(result["indirect_costs"]["total"], 2),
+    }
+
+
+def assert_sweep_matches(components):
+    table = calculate_scenarios(components)
+    columns = table["columns"]
+    for row, region in enumerate(table["dimensions"]["region"]):
+        expected = expected_columns(calculate_costs(components, region))
+        actual = {name: float(columns[name][row]) for name in expected}
+        assert actual == expected, region
+
+
+@pytest.mark.parametrize("component_type", list(COST_RATES))
+def test_sweep_matches_calculate_costs_for_every_region_and_type(component_type):
+    rng = np.random.default_rng(sum(map(ord, component_type)))
+    for width, height in rng.uniform(50, 9000, (200, 2)):
+        assert_sweep_matches([component(component_type, float(width), float(height))])
+
+
+def test_sweep_matches_the_reported_door():
+    # 718.04 from the old aggregate sweep, 718.03 from calculate_costs
+    assert_sweep_matches([component("door", 900, 2100)])
+
+
+def test_sweep_matches_calculate_costs_for_mixed_drawings():
+    rng = np.random.default_rng(7)
+    types = list(COST_RATES) + ["text_annotation", "unknown_thing"]
+    components = [
+        component(types[i], float(w), float(h), float(x), float(y))
+        for i, (w, h, x, y) in zip(rng.integers(0, len(types), 2000), rng.uniform(10, 6000, (2000, 4)))
+    ]
+    assert_sweep_matches(components)
+    assert_sweep_matches([])
+
+
+def test_sweep_chunking_does_not_change_results():
+    rng = np.random.default_rng(3)
+    components = [component("wall", float(w), float(h)) for w, h in rng.uniform(100, 5000, (50, 2))]
+    quantities = component_quantities(RATE_TABLE, component_arrays(components))
+    args = (
+        np.array(list(REGIONAL_FACTORS.values())),
+        np.tile(RATE_TABLE.material_rate, (3, 1)) * [[1.0], [1.1], [0.9]],
+        np.tile(RATE_TABLE.labor_rate, (3, 1)),
+        np.tile(RATE_TABLE.equipment_rate, (3, 1)),
+        np.array([[0.1, 0.05], [0.2, 0.0]]),
+    )
+    whole = sweep_costs(quantities, *args)
+    chunked = sweep_costs(quantities, *args, chunk_elements=1)
+    for name in whole:
+        np.testing.assert_array_equal(whole[name], chunked[name])
+
+
+def test_round_array_matches_builtin_round():
+    rng = np.random.default_rng(11)
+    values = np.concatenate([
+        rng.uniform(-1e6, 1e6, 5000),
+        np.arange(0, 50, 0.005),           # half-cent values close to ties
+        np.array([0.125, 2.675, 1.005, 244.375, 1e17, 0.0, -0.0]),
+    ])
+    assert _round_array(values).tolist() == [round(value, 2) for value in values.tolist()]
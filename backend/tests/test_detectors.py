@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+from app.detectors import ExportedDetector, detect_backend, load_detector, non_max_suppression, postprocess
+
+NAMES = {0: "wall", 1: "door"}
+
+# Raw YOLOv8 head for a 640x640 input: (cx, cy, w, h, score per class) x anchors
+HEAD = np.array([
+    # cx     cy     w     h    wall  door
+    [100.0, 260.0, 40.0, 40.0, 0.9, 0.0],
+    [102.0, 261.0, 40.0, 40.0, 0.8, 0.0],  # the same wall again: suppressed
+    [100.0, 260.0, 40.0, 40.0, 0.0, 0.7],  # a door there: other class, kept
+    [400.0, 300.0, 20.0, 20.0, 0.1, 0.1],  # below the confidence threshold
+], np.float32).T
+
+
+def greedy_nms(boxes, scores, threshold):
+    def iou(a, b):
+        w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+        h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+        inter = w * h
+        return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+    keep = []
+    for i in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        if all(iou(boxes[i], boxes[k]) <= threshold for k in keep):
+            keep.append(i)
+    return keep
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_nms_matches_greedy_reference(seed):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 500, (200, 2))
+    boxes = np.concatenate([xy, xy + rng.uniform(10, 80, (200, 2))], axis=1)
+    scores = rng.random(200)
+    expected = greedy_nms(boxes, scores, 0.5)
+    assert non_max_suppression(boxes, scores, 0.5).tolist() == expected
+    assert non_max_suppression(boxes, scores, 0.5, max_keep=10).tolist() == expected[:10]
+
+
+def test_postprocess_filters_suppresses_per_class_and_undoes_the_letterbox():
+    # A 320x160 image letterboxed into 640x640: gain 2, padded 160 px top and bottom
+    found = postprocess(HEAD, 2.0, (0, 160), (160, 320))
+    assert found.cls.tolist() == [0, 1]
+    assert found.conf.tolist() == pytest.approx([0.9, 0.7])
+    assert found.xyxy.tolist() == [[40, 40, 60, 60], [40, 40, 60, 60]]
+
+
+def test_postprocess_without_confident_anchors():
+    assert len(postprocess(np.zeros((6, 10), np.float32), 1.0, (0, 0), (640, 640))) == 0
+
+
+class FixedHead(ExportedDetector):
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size
+        self.batches = []
+
+    def _infer(self, batch):
+        self.batches.append(len(batch))
+        return np.repeat(HEAD[None], len(batch), axis=0)
+
+
+@pytest.mark.parametrize("batch_size,expected", [(None, [3]), (2, [2, 2])])
+def test_exported_detector_runs_fixed_batch_exports_in_padded_chunks(batch_size, expected):
+    detector = FixedHead(batch_size)
+    images = [np.full((160, 320), 255, np.uint8), np.full((160, 320, 3), 255, np.uint8), np.zeros((160, 320), np.uint8)]
+    results = detector.predict(images)
+    assert detector.batches == expected
+    assert [r.xyxy.tolist() for r in results] == [[[40, 40, 60, 60], [40, 40, 60, 60]]] * 3
+
+
+def export_head(path, batch="batch"):
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper, numpy_helper
+
+    # Ignores the image: a constant head, broadcast over the batch
+    nodes = [
+        helper.make_node("ReduceMean", ["images"], ["mean"], axes=[1, 2, 3], keepdims=1),
+        helper.make_node("Squeeze", ["mean", "last"], ["per_image"]),
+        helper.make_node("Mul", ["per_image", "zero"], ["zeros"]),
+        helper.make_node("Add", ["zeros", "head"], ["output0"]),
+    ]
+    initializers = [
+        numpy_helper.from_array(np.array([3], np.int64), "last"),
+        numpy_helper.from_array(np.zeros(1, np.float32), "zero"),
+        numpy_helper.from_array(HEAD[None], "head"),
+    ]
+    graph = helper.make_graph(
+        nodes, "head",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, [batch, 3, 640, 640])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, [batch, 6, HEAD.shape[1]])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    helper.set_model_props(model, {"names": repr(NAMES), "imgsz": "[640, 640]"})
+    onnx.save(model, str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize("batch", ["batch", 2])
+def test_onnx_detector(tmp_path, batch):
+    pytest.importorskip("onnxruntime")
+    detector = load_detector(export_head(tmp_path / "model.onnx", batch), strict=True)
+    assert detector.backend == "onnxruntime"
+    assert detector.names == NAMES
+    assert detector.input_size == (640, 640)
+    assert detector.batch_size == (None if batch == "batch" else 2)
+    results = detector.predict([np.full((160, 320), 255, np.uint8)] * 3)
+    assert [r.cls.tolist() for r in results] == [[0, 1]] * 3
+    assert results[2].xyxy.tolist() == [[40, 40, 60, 60], [40, 40, 60, 60]]
+
+
+def test_openvino_detector(tmp_path):
+    ov = pytest.importorskip("openvino")
+    directory = tmp_path / "model_openvino_model"
+    directory.mkdir()
+    ov.save_model(ov.convert_model(export_head(tmp_path / "model.onnx")), str(directory / "model.xml"))
+    (directory / "metadata.yaml").write_text("names:\n  0: wall\n  1: door\nimgsz: [640, 640]\n")
+    detector = load_detector(str(directory), strict=True)
+    assert detector.backend == "openvino"
+    assert detector.names == NAMES
+    results = detector.predict([np.full((160, 320), 255, np.uint8)] * 2)
+    assert [r.cls.tolist() for r in results] == [[0, 1]] * 2
+
+
+def test_backend_follows_the_model_path():
+    assert detect_backend("best.onnx") == "onnxruntime"
+    assert detect_backend("best.int8.onnx") == "onnxruntime"
+    assert detect_backend("best_openvino_model/") == "openvino"
+    assert detect_backend("best_openvino_model/best.xml") == "openvino"
+    assert detect_backend("best.pt") == "ultralytics"
+
+
+def test_unloadable_model(tmp_path):
+    missing = str(tmp_path / "missing.onnx")
+    assert load_detector(missing) is None
+    with pytest.raises(Exception):
+        load_detector(missing, strict=True)
+    with pytest.raises(ValueError, match="Unknown detector backend"):
+        load_detector(missing, backend="tensorrt", strict=True)
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+from app import exports
+from app.components import ComponentBatch
+from app.exports import ExportCache
+
+
+def components(width):
+    batch = ComponentBatch(
+        ["wall", "door"],
+        np.array([0, 1]),
+        np.array([0.9, 0.8], np.float32),
+        np.array([[0, 0, width, 10], [50, 0, 140, 210]], np.float64),
+    )
+    return batch.to_bytes()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ExportCache(directory=str(tmp_path))
+    monkeypatch.setattr(exports, "cache", cache)
+    return cache
+
+
+def test_key_depends_on_the_project_components_and_region():
+    key = ExportCache.key(1, components(100), "amsterdam")
+    assert key == ExportCache.key(1, components(100), "amsterdam")
+    assert key != ExportCache.key(1, components(200), "amsterdam")
+    assert key != ExportCache.key(1, components(100), "rotterdam")
+    assert key != ExportCache.key(2, components(100), "amsterdam")
+
+
+def test_version_follows_the_cost_rates(tmp_path, monkeypatch):
+    before = ExportCache(directory=str(tmp_path)).version
+    rates = dict(exports.COST_RATES, wall=dict(exports.COST_RATES["wall"], material={"rate": 96, "unit": "m2"}))
+    monkeypatch.setattr(exports, "COST_RATES", rates)
+    assert ExportCache(directory=str(tmp_path)).version != before
+
+
+@pytest.mark.parametrize("export_format", ["pdf", "xlsx"])
+def test_repeat_exports_are_served_from_the_cache(cache, export_format):
+    first = exports.export(1, components(100), "amsterdam", export_format, "House")
+    second = exports.export(1, components(100), "amsterdam", export_format, "House")
+    assert not first["cached"] and second["cached"]
+    assert first["path"] == second["path"] and first["bytes"] > 0
+    assert cache.renders == 1
+
+
+def test_new_components_replace_the_projects_older_file(cache):
+    old = exports.export(1, components(100), "amsterdam", "pdf", "House")
+    other_region = exports.export(1, components(100), "rotterdam", "pdf", "House")
+    other_project = exports.export(2, components(100), "amsterdam", "pdf", "House")
+    new = exports.export(1, components(200), "amsterdam", "pdf", "House")
+
+    assert not new["cached"]
+    assert not os.path.exists(old["path"])
+    assert all(os.path.exists(r["path"]) for r in (other_region, other_project, new))
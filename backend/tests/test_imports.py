@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_after(code, modules):
+    """
+    Which of `modules` a fresh interpreter has imported after running `code`.
+    """
+    check = f"{code}\nimport sys\nprint(' '.join(m for m in {modules!r} if m in sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", check], cwd=BACKEND, capture_output=True, text=True, check=True
+    ).stdout
+    return output.split()
+
+
+def test_cache_keys_need_no_analysis_modules():
+    code = (
+        "import app.main\n"
+        "from app.analysis_config import preset_name\n"
+        "app.main.analysis_cache.key_for_digest('ab', preset_name(None))\n"
+        "app.main.analysis_cache.version"
+    )
+    heavy = ["app.ai_module", "app.detectors", "app.ocr", "app.preprocessing", "pytesseract"]
+    assert loaded_after(code, heavy) == []
+
+
+def test_api_process_does_not_load_opencv():
+    assert loaded_after("import app.main", ["cv2", "app.ai_module", "app.preprocessing"]) == []
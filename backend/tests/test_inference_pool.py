@@ -0,0 +1,64 @@
+import asyncio
+import os
+import signal
+import time
+
+import pytest
+
+from app.inference_pool import InferencePool, WorkerLost
+
+
+def wait_until_reaped(pid, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"worker {pid} was not reaped")
+
+
+def test_pool_replaces_a_killed_worker():
+    pool = InferencePool(workers=1, max_queue=1, timeout=60, mode="process", preload=False)
+
+    async def scenario():
+        first = await pool.run("model_status")
+        # As the kernel's OOM killer would
+        os.kill(first["pid"], signal.SIGKILL)
+        await asyncio.get_running_loop().run_in_executor(None, wait_until_reaped, first["pid"])
+        second = await pool.run("model_status")
+        return first["pid"], second["pid"]
+
+    try:
+        killed, replacement = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert replacement != killed
+    stats = pool.stats()
+    assert stats["restarts"] == 1
+    assert stats["completed"] == 2 and stats["running"] == 0
+
+
+def test_run_whose_worker_dies_can_be_retried():
+    pool = InferencePool(workers=1, max_queue=1, timeout=60, mode="process", preload=False, retry_after=7)
+
+    async def scenario():
+        pool.start()
+        running = asyncio.ensure_future(pool.run("model_status", load=True))
+        # Kill the worker while it is still starting up for this run
+        while not pool._executor._processes:
+            await asyncio.sleep(0.01)
+        os.kill(next(iter(pool._executor._processes)), signal.SIGKILL)
+        with pytest.raises(WorkerLost) as lost:
+            await running
+        assert lost.value.retry_after == 7
+        return await pool.run("model_status")
+
+    try:
+        status = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert status["pid"] != os.getpid()
+    stats = pool.stats()
+    assert stats["failed"] == 1 and stats["restarts"] == 1 and stats["running"] == 0
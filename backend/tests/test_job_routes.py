@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import auth
+from app.auth import PrincipalCache, create_access_token
+from app.database import get_async_db
+from app.jobs import MemoryJobStore
+from app.main import app, job_manager
+from app.models import Base, Project, User, UserPlan
+
+RESULT = {
+    "components": [{"type": "wall", "confidence": 0.9, "dimensions": {"x1": 0, "y1": 0, "x2": 100, "y2": 10}}],
+    "cost_breakdown": {"total_cost": 1234.5},
+}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+
+    async def setup():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            users = [
+                User(email=f"{name}@example.com", password_hash="x", plan=UserPlan.FREE) for name in ("owner", "other")
+            ]
+            session.add_all(users)
+            await session.commit()
+            return [user.id for user in users]
+
+    owner_id, other_id = asyncio.run(setup())
+
+    async def get_test_db():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    monkeypatch.setattr(auth, "principal_cache", PrincipalCache(ttl=0))
+    monkeypatch.setattr(job_manager, "store", MemoryJobStore())
+    app.dependency_overrides[get_async_db] = get_test_db
+    client = TestClient(app)
+    client.users = {"owner": owner_id, "other": other_id}
+    yield client
+    app.dependency_overrides.clear()
+    asyncio.run(engine.dispose())
+
+
+def headers(name):
+    return {"Authorization": f"Bearer {create_access_token({'sub': f'{name}@example.com'})}"}
+
+
+def stored_job(owner_id, status):
+    now = time.time()
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": status,
+        "stage": "priced",
+        "filename": "plan.png",
+        "preset": None,
+        "result": RESULT,
+        "error": None,
+        "project_id": None,
+        "owner_id": owner_id,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + 60,
+    }
+    job_manager.store.create(job)
+    return job["id"]
+
+
+def completed_job(owner_id):
+    job_id = stored_job(owner_id, "completed")
+    job_manager.store.add_event(job_id, "completed", {})
+    return job_id
+
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/jobs/{job_id}"),
+    ("get", "/jobs/{job_id}/events"),
+    ("get", "/jobs/{job_id}/export"),
+    ("post", "/jobs/{job_id}/project"),
+])
+def test_job_routes_require_authentication(client, method, path):
+    job_id = completed_job(client.users["owner"])
+    assert getattr(client, method)(path.format(job_id=job_id)).status_code == 401
+
+
+def test_submitting_a_job_requires_authentication(client):
+    assert client.post("/jobs").status_code == 401
+
+
+def test_owners_see_their_jobs(client):
+    job_id = completed_job(client.users["owner"])
+    response = client.get(f"/jobs/{job_id}", headers=headers("owner"))
+    assert response.status_code == 200
+    assert response.json()["result"]["cost_breakdown"] == RESULT["cost_breakdown"]
+
+    events = client.get(f"/jobs/{job_id}/events?format=ndjson", headers=headers("owner"))
+    assert events.status_code == 200
+    assert '"completed"' in events.text
+
+
+
+def test_streaming_a_job_run_by_another_worker_leaves_no_watch_behind(client):
+    job_id = stored_job(client.users["owner"], "running")
+    store = job_manager.store
+
+    def finish():
+        # As a job finished by another worker: written to the shared store
+        # without notifying this process
+        store.update(job_id, status="completed")
+        store.add_event(job_id, "completed", {})
+
+    timer = threading.Timer(0.2, finish)
+    timer.start()
+    events = client.get(f"/jobs/{job_id}/events?format=ndjson", headers=headers("owner"))
+    timer.join()
+    assert events.status_code == 200 and '"completed"' in events.text
+    assert job_id not in job_manager._changed and job_id not in job_manager._subscribers
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/jobs/{job_id}"),
+    ("get", "/jobs/{job_id}/events"),
+    ("get", "/jobs/{job_id}/export"),
+    ("post", "/jobs/{job_id}/project"),
+])
+def test_other_users_jobs_are_not_found(client, method, path):
+    job_id = completed_job(client.users["owner"])
+    response = getattr(client, method)(path.format(job_id=job_id), headers=headers("other"))
+    assert response.status_code == 404
+
+
+def test_scenarios_from_a_job_need_its_owner(client):
+    job_id = completed_job(client.users["owner"])
+    grid = {"job_id": job_id, "regions": ["default"]}
+    assert client.post("/scenarios", json=grid).status_code == 401
+    assert client.post("/scenarios", json=grid, headers=headers("other")).status_code == 404
+    assert client.post("/scenarios", json=grid, headers=headers("owner")).status_code == 200
+    # Inline components need no account
+    inline = {"components": RESULT["components"], "regions": ["default"]}
+    assert client.post("/scenarios", json=inline).status_code == 200
+
+
+def create_project(client, name):
+    async def create():
+        async for session in app.dependency_overrides[get_async_db]():
+            project = Project(user_id=client.users[name], name=f"{name}'s house", total_cost=1.0)
+            session.add(project)
+            await session.commit()
+            return project.id
+
+    return asyncio.run(create())
+
+
+def project_cost(project_id):
+    async def read():
+        async for session in app.dependency_overrides[get_async_db]():
+            return (await session.get(Project, project_id)).total_cost
+
+    return asyncio.run(read())
+
+
+def test_attaching_a_job_creates_or_updates_the_owners_project(client):
+    job_id = completed_job(client.users["owner"])
+    created = client.post(f"/jobs/{job_id}/project", headers=headers("owner"))
+    assert created.status_code == 200
+    assert created.json()["total_cost"] == 1234.5
+
+    project_id = create_project(client, "owner")
+    updated = client.post(f"/jobs/{job_id}/project?project_id={project_id}", headers=headers("owner"))
+    assert updated.status_code == 200
+    assert project_cost(project_id) == 1234.5
+    assert job_manager.store.get(job_id)["project_id"] == project_id
+
+
+def test_another_users_job_cannot_be_attached_to_your_project(client):
+    job_id = completed_job(client.users["owner"])
+    project_id = create_project(client, "other")
+    response = client.post(f"/jobs/{job_id}/project?project_id={project_id}", headers=headers("other"))
+    assert response.status_code == 404
+    assert project_cost(project_id) == 1.0
+    assert job_manager.store.get(job_id)["project_id"] is None
+
+
+def test_a_job_cannot_be_attached_to_another_users_project(client):
+    job_id = completed_job(client.users["owner"])
+    project_id = create_project(client, "other")
+    response = client.post(f"/jobs/{job_id}/project?project_id={project_id}", headers=headers("owner"))
+    assert response.status_code == 404
+    assert project_cost(project_id) == 1.0
+
+
+def test_stats_and_metrics_report_stored_jobs(client):
+    completed_job(client.users["owner"])
+    stored_job(client.users["owner"], "running")
+    assert client.get("/stats").json()["jobs"]["jobs"] == {"completed": 1, "running": 1}
+    metrics_text = client.get("/metrics").text
+    assert 'jobs{status="running"} 1' in metrics_text
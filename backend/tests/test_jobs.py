@@ -0,0 +1,224 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app.jobs import JobManager, JobQueueFull, MemoryJobStore, SQLiteJobStore
+
+
+class FailingEventStore(MemoryJobStore):
+    """
+    Memory store whose add_event fails for one stage.
+    """
+
+    def __init__(self, failing_stage):
+        super().__init__()
+        self.failing_stage = failing_stage
+
+    def add_event(self, job_id, stage, data):
+        if stage == self.failing_stage:
+            raise RuntimeError("database is locked")
+        return super().add_event(job_id, stage, data)
+
+
+async def run_job(manager, work, **fields):
+    job = await manager.start(work, **fields)
+    while job["id"] in manager._tasks:
+        await asyncio.sleep(0.01)
+    return manager.store.get(job["id"]), manager.store.events(job["id"])
+
+
+def test_completed_job_records_result_and_events():
+    async def work(progress):
+        progress("decoded", {"width": 10})
+        progress("detected", {"components": 2})
+        return {"total": 1}
+
+    manager = JobManager(store=MemoryJobStore(), workers=1)
+    job, events = asyncio.run(run_job(manager, work, filename="a.png"))
+
+    assert job["status"] == "completed"
+    assert job["result"] == {"total": 1}
+    assert job["filename"] == "a.png"
+    # The skipped "preprocessed" stage is filled in, in order
+    assert [event["stage"] for event in events] == ["decoded", "preprocessed", "detected", "completed"]
+    assert [event["seq"] for event in events] == [1, 2, 3, 4]
+    assert manager.completed == 1
+
+
+def test_failing_work_marks_the_job_failed_and_runs_cleanup():
+    async def work(progress):
+        raise ValueError("bad drawing")
+
+    manager = JobManager(store=MemoryJobStore(), workers=1)
+    cleaned = []
+
+    async def scenario():
+        job = await manager.start(work, cleanup=lambda: cleaned.append(True))
+        while job["id"] in manager._tasks:
+            await asyncio.sleep(0.01)
+        return manager.store.get(job["id"]), manager.store.events(job["id"])
+
+    job, events = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert job["error"] == "bad drawing"
+    assert events[-1]["stage"] == "failed"
+    assert cleaned == [True]
+
+
+def test_failed_event_write_still_records_the_final_status():
+    async def work(progress):
+        progress("detected", {"components": 1})
+        await asyncio.sleep(0.01)
+        return {"total": 1}
+
+    manager = JobManager(store=FailingEventStore("detected"), workers=1)
+    job, events = asyncio.run(run_job(manager, work))
+
+    assert job["status"] == "failed"
+    assert "database is locked" in job["error"]
+    assert events[-1]["stage"] == "failed"
+    assert manager.failed == 1
+    assert not manager._tasks
+
+
+def test_full_queue_rejects_and_cleans_up():
+    async def scenario():
+        manager = JobManager(store=MemoryJobStore(), workers=1, max_pending=1)
+        release = asyncio.Event()
+
+        async def work(progress):
+            await release.wait()
+            return {}
+
+        await manager.start(work)
+        cleaned = []
+        with pytest.raises(JobQueueFull):
+            await manager.start(work, cleanup=lambda: cleaned.append(True))
+        release.set()
+        while manager._tasks:
+            await asyncio.sleep(0.01)
+        return cleaned, manager.rejected
+
+    assert asyncio.run(scenario()) == ([True], 1)
+
+
+
+def test_job_events_are_dropped_when_the_last_subscriber_leaves():
+    manager = JobManager(store=MemoryJobStore(), workers=1)
+
+    async def scenario():
+        manager.subscribe("a")
+        manager.subscribe("a")
+        changed = manager.watch("a")
+        manager.unsubscribe("a")
+        # The other subscriber still waits on the same event
+        assert manager.watch("a") is changed
+        manager.unsubscribe("a")
+        return dict(manager._changed), dict(manager._subscribers)
+
+    assert asyncio.run(scenario()) == ({}, {})
+
+
+def test_stats_include_the_store_counts():
+    async def work(progress):
+        return {}
+
+    manager = JobManager(store=MemoryJobStore(), workers=1)
+
+    async def scenario():
+        await run_job(manager, work)
+        return await manager.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["jobs"] == {"completed": 1} and stats["completed"] == 1
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    return MemoryJobStore()
+
+
+def new_job(job_id, expires_at=None):
+    now = time.time()
+    return {
+        "id": job_id,
+        "status": "queued",
+        "stage": None,
+        "filename": "plan.png",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": expires_at if expires_at is not None else now + 60,
+    }
+
+
+def test_store_round_trips_jobs_and_results(store):
+    store.create(new_job("a"))
+    store.update("a", status="completed", result={"components": [{"type": "wall"}], "total": 1.5})
+
+    job = store.get("a")
+    assert job["status"] == "completed"
+    assert job["filename"] == "plan.png"
+    assert job["result"] == {"components": [{"type": "wall"}], "total": 1.5}
+    assert store.get("missing") is None
+    assert store.counts() == {"completed": 1}
+
+
+def test_store_numbers_events_per_job(store):
+    store.create(new_job("a"))
+    store.create(new_job("b"))
+
+    assert [store.add_event("a", stage, {"n": n}) for n, stage in enumerate(["decoded", "detected"])] == [1, 2]
+    assert store.add_event("b", "decoded", {}) == 1
+    # Events for unknown jobs are dropped
+    assert store.add_event("missing", "decoded", {}) == 0
+
+    events = store.events("a")
+    assert [(event["seq"], event["stage"], event["data"]) for event in events] == [
+        (1, "decoded", {"n": 0}),
+        (2, "detected", {"n": 1}),
+    ]
+    assert [event["seq"] for event in store.events("a", after=1)] == [2]
+    assert store.events("missing") == []
+
+
+def test_store_expires_jobs_with_their_events(store):
+    now = time.time()
+    store.create(new_job("old", expires_at=now - 1))
+    store.create(new_job("new", expires_at=now + 60))
+    store.add_event("old", "decoded", {})
+
+    assert store.expire(now) == 1
+    assert store.get("old") is None
+    assert store.events("old") == []
+    assert store.get("new") is not None
+
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    writer = SQLiteJobStore(path)
+    reader = SQLiteJobStore(path)
+
+    writer.create(new_job("a"))
+    writer.add_event("a", "decoded", {"width": 10})
+    writer.update("a", status="running", stage="decoded")
+
+    assert reader.get("a")["status"] == "running"
+    assert reader.events("a")[0]["data"] == {"width": 10}
+
+
+def test_sqlite_store_adds_the_owner_to_older_files(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT, filename TEXT, preset TEXT,"
+        " result TEXT, error TEXT, project_id INTEGER, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+        " expires_at REAL NOT NULL)"
+    )
+    db.close()
+
+    store = SQLiteJobStore(path)
+    store.create(dict(new_job("a"), owner_id=7))
+    assert store.get("a")["owner_id"] == 7
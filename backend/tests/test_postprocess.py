@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from app.components import ComponentBatch
+from app.postprocess import GridIndex, extract_measurements, link_measurements, pair_iou, suppress_duplicates
+
+
+def random_boxes(count, seed=0, page=5000.0):
+    rng = np.random.default_rng(seed)
+    origin = rng.uniform(0, page, (count, 2))
+    size = rng.uniform(5, 300, (count, 2))
+    return np.hstack([origin, origin + size])
+
+
+def touching_pairs(xyxy):
+    """
+    Every pair (i, j), i < j, of boxes that overlap or touch, by brute force.
+    """
+    found = set()
+    for i in range(len(xyxy)):
+        for j in range(i + 1, len(xyxy)):
+            a, b = xyxy[i], xyxy[j]
+            if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]:
+                found.add((i, j))
+    return found
+
+
+def make_batch(names, cls, conf, xyxy):
+    return ComponentBatch(names, np.asarray(cls, np.int64), np.asarray(conf, np.float32), np.asarray(xyxy, np.float64))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_grid_pairs_cover_every_overlapping_pair(seed):
+    xyxy = random_boxes(400, seed)
+    pairs = GridIndex(xyxy).pairs()
+
+    found = {tuple(pair) for pair in pairs.tolist()}
+    assert len(found) == len(pairs), "pairs are unique"
+    assert all(i < j for i, j in found)
+    assert touching_pairs(xyxy) <= found
+
+
+def test_grid_pairs_only_share_cells():
+    xyxy = np.array([[0, 0, 10, 10], [5, 5, 15, 15], [1000, 1000, 1010, 1010]], np.float64)
+    assert GridIndex(xyxy, cell_size=20).pairs().tolist() == [[0, 1]]
+
+
+def test_grid_pairs_for_small_inputs():
+    assert GridIndex(np.zeros((0, 4))).pairs().shape == (0, 2)
+    assert GridIndex(np.array([[0, 0, 10, 10]], np.float64)).pairs().shape == (0, 2)
+
+
+def test_grid_query_finds_every_intersecting_box():
+    xyxy = random_boxes(300, seed=7)
+    index = GridIndex(xyxy)
+    box = np.array([1000, 1000, 1600, 1400], np.float64)
+    found = set(index.query(box).tolist())
+    expected = {
+        i for i, b in enumerate(xyxy)
+        if b[0] <= box[2] and box[0] <= b[2] and b[1] <= box[3] and box[1] <= b[3]
+    }
+    assert expected <= found
+
+
+def test_pair_iou():
+    xyxy = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30], [0, 0, 10, 10]], np.float64)
+    pairs = np.array([[0, 1], [0, 2], [0, 3]])
+    assert pair_iou(xyxy, pairs).tolist() == pytest.approx([50 / 150, 0.0, 1.0])
+
+
+def test_suppress_duplicates_keeps_the_most_confident_of_overlapping_detections():
+    batch = make_batch(
+        ["wall", "floor"],
+        [0, 1, 0, 0],
+        [0.6, 0.9, 0.8, 0.7],
+        [[0, 0, 100, 10], [1, 0, 100, 10], [500, 500, 600, 510], [0, 200, 100, 210]],
+    )
+    kept = suppress_duplicates(batch, iou_threshold=0.8)
+    assert kept.types.tolist() == ["floor", "wall", "wall"]
+    assert kept.conf.tolist() == pytest.approx([0.9, 0.8, 0.7])
+
+
+def test_suppress_duplicates_does_not_chain():
+    # b overlaps a and c, a and c barely overlap: greedy NMS drops b for a
+    # and keeps c, since the only detection overlapping it was dropped
+    batch = make_batch(
+        ["wall"],
+        [0, 0, 0],
+        [0.9, 0.8, 0.7],
+        [[0, 0, 100, 10], [20, 0, 120, 10], [40, 0, 140, 10]],
+    )
+    assert suppress_duplicates(batch, iou_threshold=0.5).conf.tolist() == pytest.approx([0.9, 0.7])
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("5m", {"length": 5.0}),
+    ("lengte: 4500mm", {"length": 4.5}),
+    ("width 3,5m", {"width": 3.5}),
+    ("hoogte 260cm", {"height": 2.6}),
+    ("20m²", {"area": 20.0}),
+    ("4x3m", {"width": 4.0, "length": 3.0, "area": 12.0}),
+    ("area: 20m", {}),
+    ("kitchen", {}),
+])
+def test_extract_measurements(text, expected):
+    assert extract_measurements(text) == pytest.approx(expected)
+
+
+def text_at(text, x, y):
+    return {"type": "text_annotation", "text": text, "dimensions": {"x": x, "y": y, "width": 20, "height": 10}}
+
+
+def test_every_parsed_measurement_is_linked_to_the_nearest_detection():
+    batch = make_batch(["room", "wall"], [0, 1], [0.9, 0.9], [[0, 0, 400, 300], [1000, 0, 1010, 300]]).with_texts([
+        text_at("4x3m", 100, 100),
+        text_at("hoogte 2,6m", 150, 200),
+        text_at("5m", 1020, 100),
+        text_at("12m", 5000, 5000),
+    ])
+    linked = link_measurements(batch, max_distance=50)
+    room, wall = linked.detection_components()
+    assert room["measured"] == pytest.approx({"length": 3.0, "area": 12.0, "width": 4.0, "height": 2.6})
+    assert wall["measured"] == {"length": 5.0}
+    assert [text.get("component") for text in linked.texts] == [0, 0, 1, None]
+    assert linked.texts[3]["measurement"] == {"length": 12.0}
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, delete, update
+from sqlalchemy.orm import Session
+
+from app import price_catalog
+from app.models import Base, EquipmentCost, IndirectCost, LaborCost, MaterialCost
+from app.price_catalog import PriceCatalog
+
+T0 = datetime(2024, 1, 1, 8, 0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([
+            MaterialCost(name="concrete", region="amsterdam", unit_cost=100.0, last_updated=T0),
+            MaterialCost(name="concrete", region="rotterdam", unit_cost=95.0, last_updated=T0),
+            MaterialCost(name="brick", region="amsterdam", unit_cost=40.0, last_updated=T0),
+            LaborCost(trade="concrete", region="amsterdam", hourly_rate=55.0, last_updated=T0),
+            EquipmentCost(name="crane", region="amsterdam", daily_rate=900.0, last_updated=T0),
+            IndirectCost(name="overhead", region="amsterdam", percentage=10.0, last_updated=T0),
+        ])
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def test_load(db):
+    catalog = PriceCatalog()
+    catalog.load(db)
+    assert catalog.loaded
+    assert catalog.get("material", "concrete", "rotterdam") == 95.0
+    assert catalog.get_many("material", [("brick", "amsterdam"), ("brick", "rotterdam")]) == [40.0, None]
+    assert catalog.indirect("amsterdam") == [("overhead", 10.0)]
+    assert catalog.version == T0
+    assert catalog.cost_data("concrete", "amsterdam") == {
+        "item": "concrete",
+        "region": "amsterdam",
+        "unit_cost": 100.0,
+        "labor_rate": 55.0,
+        "equipment_rate": None,
+        "last_updated": T0,
+    }
+    assert catalog.cost_data("steel", "amsterdam") is None
+
+
+def test_refresh_only_applies_changed_rows(db, monkeypatch):
+    monkeypatch.setattr(price_catalog, "PRICE_CATALOG_FULL_RELOAD_EVERY", 0)
+    catalog = PriceCatalog()
+    catalog.load(db)
+    assert catalog.refresh(db) == 0
+
+    later = T0 + timedelta(hours=1)
+    db.execute(
+        update(MaterialCost)
+        .where(MaterialCost.name == "brick")
+        .values(unit_cost=42.0, last_updated=later)
+    )
+    db.add(MaterialCost(name="steel", region="amsterdam", unit_cost=700.0, last_updated=later))
+    db.add(IndirectCost(name="profit", region="amsterdam", percentage=5.0, last_updated=later))
+    db.commit()
+
+    assert catalog.refresh(db) == 3
+    assert catalog.get("material", "brick", "amsterdam") == 42.0
+    assert catalog.get("material", "steel", "amsterdam") == 700.0
+    assert catalog.get("material", "concrete", "amsterdam") == 100.0
+    assert sorted(catalog.indirect("amsterdam")) == [("overhead", 10.0), ("profit", 5.0)]
+    assert catalog.version == later
+    assert catalog.cost_data("brick", "amsterdam")["last_updated"] == later
+    # Nothing changed since: the watermark moved with the refresh
+    assert catalog.refresh(db) == 0
+
+
+def test_refresh_misses_deletes_until_the_periodic_full_reload(db, monkeypatch):
+    monkeypatch.setattr(price_catalog, "PRICE_CATALOG_FULL_RELOAD_EVERY", 2)
+    catalog = PriceCatalog()
+    catalog.load(db)
+
+    db.execute(delete(MaterialCost).where(MaterialCost.name == "brick"))
+    db.commit()
+
+    catalog.refresh(db)
+    assert catalog.get("material", "brick", "amsterdam") == 40.0
+    catalog.refresh(db)
+    assert catalog.get("material", "brick", "amsterdam") is None
+    assert catalog.stats()["entries"]["material"] == 2
+
+
+def test_refresh_loads_an_empty_catalog(db):
+    catalog = PriceCatalog()
+    assert catalog.refresh(db) == catalog.size == 6
+    assert catalog.loaded
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+from starlette.requests import Request
+
+from app.responses import http_date, not_modified, parse_quality_header, weak_etag
+
+LAST_MODIFIED = datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+
+def make_request(method="GET", **headers):
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": method, "headers": raw})
+
+
+def test_parse_quality_header():
+    assert parse_quality_header("gzip, br;q=0.8, *;q=0") == {"gzip": 1.0, "br": 0.8, "*": 0.0}
+    assert parse_quality_header("Application/JSON ; q=0.5 ; charset=utf-8") == {"application/json": 0.5}
+    # Invalid q values rank as unacceptable; repeats keep the best
+    assert parse_quality_header("gzip;q=high, br;q=0.2, br;q=0.9") == {"gzip": 0.0, "br": 0.9}
+    assert parse_quality_header("") == {}
+    assert parse_quality_header(" , ,") == {}
+
+
+def test_weak_etag():
+    etag = weak_etag("amsterdam", 3, None)
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == weak_etag("amsterdam", 3, None)
+    assert etag != weak_etag("amsterdam", 4, None)
+    # Parts are separated, not just concatenated
+    assert weak_etag("ab", "c") != weak_etag("a", "bc")
+
+
+def test_not_modified_matches_etags_weakly():
+    etag = weak_etag("item")
+    opaque = etag[2:]
+    assert not_modified(make_request(if_none_match=etag), etag, None)
+    assert not_modified(make_request(if_none_match=opaque), etag, None)
+    assert not_modified(make_request(if_none_match=f'"other", {etag}'), etag, None)
+    assert not_modified(make_request(if_none_match="*"), etag, None)
+    assert not not_modified(make_request(if_none_match='W/"other"'), etag, None)
+    assert not_modified(make_request("HEAD", if_none_match=etag), etag, None)
+    assert not not_modified(make_request("POST", if_none_match=etag), etag, None)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    request = make_request(if_none_match='W/"other"', if_modified_since=http_date(LAST_MODIFIED))
+    assert not not_modified(request, weak_etag("item"), LAST_MODIFIED)
+
+
+def test_not_modified_compares_dates_to_the_second():
+    etag = weak_etag("item")
+    assert not_modified(make_request(if_modified_since=http_date(LAST_MODIFIED)), etag, LAST_MODIFIED)
+    later = http_date(LAST_MODIFIED + timedelta(hours=1))
+    assert not_modified(make_request(if_modified_since=later), etag, LAST_MODIFIED)
+    earlier = http_date(LAST_MODIFIED - timedelta(seconds=1))
+    assert not not_modified(make_request(if_modified_since=earlier), etag, LAST_MODIFIED)
+    # Aware and naive (UTC) datetimes compare alike
+    aware = LAST_MODIFIED.replace(tzinfo=timezone.utc)
+    assert not_modified(make_request(if_modified_since=http_date(LAST_MODIFIED)), etag, aware)
+
+
+def test_not_modified_ignores_unusable_dates():
+    etag = weak_etag("item")
+    assert not not_modified(make_request(if_modified_since="yesterday"), etag, LAST_MODIFIED)
+    assert not not_modified(make_request(if_modified_since=http_date(LAST_MODIFIED)), etag, None)
+    assert not not_modified(make_request(), etag, LAST_MODIFIED)
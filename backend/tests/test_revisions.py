@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+import pytest
+
+from app import ai_module
+from app.components import ComponentBatch
+from app.revisions import align, changed_tiles, estimate_shift, thumbnail, tile_signatures
+from app.tiling import tile_grid
+
+
+def drawing(width=1200, height=900):
+    page = np.full((height, width), 255, np.uint8)
+    for x in range(100, width - 100, 170):
+        cv2.line(page, (x, 80), (x, height - 80), 0, 3)
+    for y in range(80, height - 80, 130):
+        cv2.line(page, (60, y), (width - 60, y), 0, 2)
+    cv2.rectangle(page, (300, 250), (520, 400), 0, 4)
+    cv2.circle(page, (850, 600), 70, 0, 3)
+    return page
+
+
+@pytest.mark.parametrize("dx,dy", [(24, -16), (-40, 30)])
+def test_shift_between_revisions_is_recovered(dx, dy):
+    reference = drawing()
+    small, scale = thumbnail(reference, 600)
+    # The revision shows reference[y, x] at [y + dy, x + dx]
+    moved = align(reference, -dx, -dy)
+    (sx, sy), response = estimate_shift(small, moved, scale)
+    assert abs(sx - dx) <= 2 and abs(sy - dy) <= 2
+    assert response > 0.2
+    restored = align(moved, sx, sy)
+    assert np.mean(restored[100:-100, 100:-100] != reference[100:-100, 100:-100]) < 0.02
+
+
+def test_identical_pages_need_no_alignment():
+    page = drawing()
+    small, scale = thumbnail(page, 600)
+    assert estimate_shift(small, page, scale)[0] == (0, 0)
+
+
+def test_only_tiles_with_an_edit_change():
+    page = drawing()
+    tiles = tile_grid(page.shape[1], page.shape[0], 400, 40)
+    before = tile_signatures(page, tiles)
+    edited = page.copy()
+    cv2.rectangle(edited, (60, 60), (200, 200), 0, -1)
+    changed = changed_tiles(before, tile_signatures(edited, tiles))
+    touched = [x0 < 200 and y0 < 200 for x0, y0, _, _ in tiles]
+    assert changed.tolist() == touched
+    assert not changed_tiles(before, tile_signatures(page.copy(), tiles)).any()
+
+
+@pytest.fixture
+def analyzed_tiles(monkeypatch):
+    analyzed = []
+
+    def analyze_tile(image, tile, preset, timing=None):
+        analyzed.append(tile)
+        return ComponentBatch.empty(), []
+
+    monkeypatch.setattr(ai_module, "load_model", lambda: None)
+    monkeypatch.setattr(ai_module, "analyze_tile", analyze_tile)
+    monkeypatch.setattr(ai_module, "TILE_SIZE", 400)
+    monkeypatch.setattr(ai_module, "TILE_OVERLAP", 40)
+    return analyzed
+
+
+def png(page):
+    return cv2.imencode(".png", page)[1].tobytes()
+
+
+def test_unchanged_tiles_of_a_revision_are_reused(analyzed_tiles):
+    page = drawing()
+    _, state, stats = ai_module.analyze_revision(png(page), preset="clean")
+    assert not stats["incremental"] and stats["analyzed"] == stats["tiles"]
+
+    analyzed_tiles.clear()
+    edited = page.copy()
+    cv2.rectangle(edited, (60, 60), (200, 200), 0, -1)
+    _, _, stats = ai_module.analyze_revision(png(edited), state, preset="clean")
+    assert stats["incremental"]
+    assert stats["analyzed"] == len(analyzed_tiles) == 1
+    assert stats["reused"] == stats["tiles"] - 1
+    assert analyzed_tiles == [(0, 0, 400, 400)]
+
+
+def test_shifted_revision_is_aligned_before_comparing_tiles(analyzed_tiles):
+    page = drawing()
+    _, state, _ = ai_module.analyze_revision(png(page), preset="clean")
+    _, _, stats = ai_module.analyze_revision(png(align(page, -20, -12)), state, preset="clean")
+    assert stats["reused"] == stats["tiles"]
+    assert stats["alignment"]["dx"] == pytest.approx(20, abs=2)
+    assert stats["alignment"]["dy"] == pytest.approx(12, abs=2)
+
+
+def test_other_preset_analyzes_every_tile(analyzed_tiles):
+    page = drawing()
+    _, state, _ = ai_module.analyze_revision(png(page), preset="clean")
+    _, _, stats = ai_module.analyze_revision(png(page), state, preset="balanced")
+    assert not stats["incremental"] and stats["reused"] == 0
@@ -0,0 +1,163 @@
+import gc
+import os
+import signal
+import socket
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import ai_module, main, serve
+from app.detectors import Detections, Detector
+from app.inference_pool import InferencePool, ModelUnavailable
+
+SERVE_ENV = ("JOB_STORE", "INFERENCE_POOL_MODE", "INFERENCE_WORKERS", "INFERENCE_THREADS_PER_WORKER")
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name in SERVE_ENV:
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_configure_shares_jobs_and_the_cores_between_workers(env):
+    serve.configure(4, analyses_per_worker=3)
+    assert os.environ["JOB_STORE"] == "sqlite"
+    assert os.environ["INFERENCE_POOL_MODE"] == "thread"
+    assert os.environ["INFERENCE_WORKERS"] == "3"
+    assert os.environ["INFERENCE_THREADS_PER_WORKER"] == str(max(1, (os.cpu_count() or 1) // 4))
+
+
+def test_configure_keeps_explicit_settings_and_forces_thread_mode(env):
+    env.setenv("INFERENCE_POOL_MODE", "process")
+    env.setenv("INFERENCE_WORKERS", "5")
+    env.setenv("INFERENCE_THREADS_PER_WORKER", "2")
+    env.setenv("JOB_STORE", "memory")
+    serve.configure(1)
+    assert os.environ["INFERENCE_POOL_MODE"] == "thread"
+    assert os.environ["INFERENCE_WORKERS"] == "5"
+    assert os.environ["INFERENCE_THREADS_PER_WORKER"] == "2"
+    # One worker can keep jobs in memory
+    assert os.environ["JOB_STORE"] == "memory"
+
+
+def test_workers_cannot_share_an_in_memory_job_store(env):
+    env.setenv("JOB_STORE", "memory")
+    with pytest.raises(ValueError, match="JOB_STORE=memory"):
+        serve.configure(2)
+    assert serve.main(["--workers", "2"]) == 1
+
+
+def test_missing_required_model_stops_startup(env, tmp_path):
+    env.setattr(ai_module, "MODEL_PATH", str(tmp_path / "missing.pt"))
+    env.setattr(ai_module, "model", None)
+    env.setattr(ai_module, "_model_state", {"loaded": False, "warmed": False, "backend": None, "error": None})
+    with pytest.raises(ModelUnavailable):
+        serve.preload()
+
+    def unavailable():
+        raise ModelUnavailable("no weights")
+
+    env.setattr(serve, "preload", unavailable)
+    assert serve.main(["--workers", "1"]) == 1
+
+
+class ExitingSupervisor(serve.Supervisor):
+    """
+    Workers that exit right away instead of serving; stops itself after
+    `spawns` workers were started.
+    """
+
+    def __init__(self, workers, spawns):
+        class Config:
+            def bind_socket(self):
+                return socket.socket()
+
+        super().__init__(Config(), workers)
+        self.spawns = spawns
+        self.started = 0
+
+    def _run_worker(self):
+        time.sleep(0.05)
+        os._exit(3)
+
+    def spawn(self):
+        super().spawn()
+        self.started += 1
+        if self.started == self.spawns:
+            self.stop(signal.SIGTERM, None)
+
+
+def test_supervisor_restarts_workers_until_stopped(monkeypatch):
+    monkeypatch.setattr(serve, "SERVE_RESTART_DELAY", 0.0)
+    handlers = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+    supervisor = ExitingSupervisor(workers=2, spawns=5)
+    try:
+        supervisor.run()
+    finally:
+        signal.signal(signal.SIGTERM, handlers[0])
+        signal.signal(signal.SIGINT, handlers[1])
+        gc.unfreeze()
+    assert supervisor.started == 5
+    assert supervisor.children == set()
+    assert supervisor.socket.fileno() == -1
+
+
+class BlankDetector(Detector):
+    backend = "fake"
+    names = {0: "wall"}
+
+    def predict(self, images):
+        return [Detections.empty() for _ in images]
+
+
+def wait_for(client, path, status, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(path)
+        if response.status_code == status or time.monotonic() > deadline:
+            return response
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ai_module, "model", None)
+    monkeypatch.setattr(ai_module, "_model_state", {"loaded": False, "warmed": False, "backend": None, "error": None})
+    monkeypatch.setattr(ai_module, "TILE_SIZE", 64)  # small warm-up page
+    pool = InferencePool(workers=2, max_queue=0, mode="thread", preload=True)
+    monkeypatch.setattr(main, "inference_pool", pool)
+    yield pool
+    pool.shutdown()
+
+
+def test_ready_once_the_model_is_loaded_and_warm(pool, monkeypatch):
+    monkeypatch.setattr(ai_module, "load_detector", lambda path, strict: BlankDetector())
+    client = TestClient(main.app)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["model"]["workers_reporting"] == 0
+
+    pool.start()
+    response = wait_for(client, "/ready", 200)
+    assert response.status_code == 200
+    model = response.json()["model"]
+    assert model["backend"] == "fake" and model["loaded"] == 1 and model["warmed"] == 1
+    assert ai_module.model_status()["ready"]
+
+
+def test_not_ready_when_the_required_model_fails_to_load(pool, monkeypatch):
+    def broken(path, strict):
+        raise OSError("truncated weights")
+
+    monkeypatch.setattr(ai_module, "load_detector", broken)
+    monkeypatch.setattr(ai_module, "MODEL_REQUIRED", True)
+    pool.start()
+    client = TestClient(main.app)
+    deadline = time.monotonic() + 10
+    while not pool.model_status()["workers_reporting"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert "truncated weights" in response.json()["model"]["errors"][0]
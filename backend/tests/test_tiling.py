@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from app.components import ComponentBatch
+from app.tiling import core_region, merge_detections, merge_groups, tile_grid
+
+
+def tile(names, cls, conf, xyxy):
+    return ComponentBatch(names, np.asarray(cls, np.int64), np.asarray(conf, np.float32), np.asarray(xyxy, np.float64))
+
+
+def test_wall_cut_by_a_tile_edge_is_joined():
+    left = tile(["wall"], [0], [0.7], [[100, 500, 1280, 520]])
+    right = tile(["wall"], [0], [0.9], [[1200, 501, 2000, 519]])
+    merged = merge_detections([left, right])
+    assert merged.xyxy.tolist() == [[100, 500, 2000, 520]]
+    assert merged.conf.tolist() == pytest.approx([0.9])
+
+
+def test_object_seen_by_neighbouring_tiles_collapses():
+    left = tile(["door"], [0], [0.8], [[1200, 300, 1290, 510]])
+    right = tile(["door"], [0], [0.6], [[1201, 301, 1290, 510]])
+    merged = merge_detections([left, right])
+    assert len(merged.cls) == 1
+    assert merged.xyxy.tolist() == [[1200, 300, 1290, 510]]
+
+
+def test_perpendicular_walls_meeting_in_a_corner_stay_apart():
+    horizontal = tile(["wall"], [0], [0.9], [[0, 0, 1300, 20]])
+    vertical = tile(["wall"], [0], [0.9], [[1280, 0, 1300, 1500]])
+    assert len(merge_detections([horizontal, vertical]).cls) == 2
+
+
+def test_only_detections_of_the_same_class_from_different_tiles_merge():
+    first = tile(["door", "window"], [0, 0], [0.8, 0.7], [[0, 0, 90, 200], [10, 0, 100, 200]])
+    second = tile(["window"], [0], [0.9], [[0, 0, 90, 200]])
+    merged = merge_detections([first, second])
+    # The two doors of one tile stay separate, the window is not a door
+    assert merged.types.tolist() == ["door", "door", "window"]
+    assert merged.conf.tolist() == pytest.approx([0.8, 0.7, 0.9])
+
+
+def test_chains_across_several_tiles_merge_into_one():
+    tiles = [tile(["wall"], [0], [0.5 + i / 10], [[i * 1000, 0, i * 1000 + 1100, 20]]) for i in range(4)]
+    merged = merge_detections(tiles)
+    assert merged.xyxy.tolist() == [[0, 0, 4100, 20]]
+    assert merged.conf.tolist() == pytest.approx([0.8])
+
+
+def test_merging_keeps_text_annotations_and_empty_input():
+    text = {"type": "text_annotation", "text": "3000"}
+    first = tile(["wall"], [0], [0.9], [[0, 0, 100, 10]]).with_texts([text])
+    merged = merge_detections([first, ComponentBatch.empty(["wall"])])
+    assert len(merged.cls) == 1 and merged.texts == [text]
+    assert len(merge_detections([ComponentBatch.empty()]).cls) == 0
+
+
+def test_tile_grid_covers_the_page_with_overlap():
+    tiles = tile_grid(3000, 2000, 1280, 128)
+    covered = np.zeros((2000, 3000), bool)
+    for x0, y0, x1, y1 in tiles:
+        assert x1 - x0 <= 1280 and y1 - y0 <= 1280
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+    # Core regions cover the page too (the shifted last tiles overlap more)
+    owner = np.zeros((2000, 3000), np.int64)
+    for t in tiles:
+        x0, y0, x1, y1 = core_region(t, 3000, 2000, 128)
+        owner[y0:y1, x0:x1] += 1
+    assert (owner >= 1).all()
+
+
+def merge_every_pair(tile_detections, threshold=0.6):
+    # Reference: compare every pair of detections, as merge_detections once did
+    batch = ComponentBatch.concatenate(tile_detections)
+    tiles = np.repeat(np.arange(len(tile_detections)), [len(b.cls) for b in tile_detections])
+    parent = list(range(len(batch.cls)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    def axis_iou(a0, a1, b0, b1):
+        union = max(a1, b1) - min(a0, b0)
+        return max(min(a1, b1) - max(a0, b0), 0) / union if union > 0 else 0.0
+
+    for i in range(len(parent)):
+        for j in range(i + 1, len(parent)):
+            if batch.cls[i] != batch.cls[j] or tiles[i] == tiles[j]:
+                continue
+            (ax0, ay0, ax1, ay1), (bx0, by0, bx1, by1) = batch.xyxy[i], batch.xyxy[j]
+            x_iou, y_iou = axis_iou(ax0, ax1, bx0, bx1), axis_iou(ay0, ay1, by0, by1)
+            if x_iou > 0 and y_iou > 0 and (x_iou >= threshold or y_iou >= threshold):
+                parent[find(j)] = find(i)
+    return merge_groups(batch, np.array([find(i) for i in range(len(parent))]))
+
+
+def test_grid_merge_matches_comparing_every_pair():
+    rng = np.random.default_rng(4)
+    tiles = []
+    for t in range(6):
+        count = 60
+        x0 = rng.uniform(0, 3000, count)
+        y0 = rng.uniform(0, 2000, count)
+        # Mostly small objects, some long walls crossing seams
+        long = rng.random(count) < 0.2
+        w = np.where(long, rng.uniform(500, 2500, count), rng.uniform(10, 150, count))
+        h = np.where(long, rng.uniform(8, 25, count), rng.uniform(10, 150, count))
+        xyxy = np.stack([x0, y0, x0 + w, y0 + h], axis=1)
+        tiles.append(tile(["door", "wall"], rng.integers(0, 2, count), rng.random(count), xyxy))
+    expected = merge_every_pair(tiles)
+    merged = merge_detections(tiles)
+    assert len(merged.cls) < sum(len(t.cls) for t in tiles)
+    assert merged.xyxy.tolist() == expected.xyxy.tolist()
+    assert merged.cls.tolist() == expected.cls.tolist()
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from starlette.requests import Request
+
+from app.uploads import (
+    SNIFF_BYTES,
+    InvalidUpload,
+    UnsupportedUpload,
+    UploadTooLarge,
+    receive_upload,
+    sniff_image_type,
+)
+
+BOUNDARY = "----drawing-boundary"
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+def multipart(*parts):
+    """
+    Multipart body for (name, filename, content) parts; filename None for
+    plain form fields.
+    """
+    body = b""
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def make_request(body, chunk_size=7, content_length=None, content_type=None):
+    headers = [(b"content-type", (content_type or f"multipart/form-data; boundary={BOUNDARY}").encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+
+    async def receive():
+        chunk = chunks.pop(0) if chunks else b""
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+def receive(request, **kwargs):
+    return asyncio.run(receive_upload(request, **kwargs))
+
+
+@pytest.mark.parametrize("head, media_type", [
+    (PNG, "image/png"),
+    (b"\xff\xd8\xff\xe0" + b"\x00" * 8, "image/jpeg"),
+    (b"BM" + b"\x00" * 10, "image/bmp"),
+    (b"II*\x00" + b"\x00" * 8, "image/tiff"),
+    (b"MM\x00*" + b"\x00" * 8, "image/tiff"),
+    (b"RIFF\x10\x00\x00\x00WEBP", "image/webp"),
+    (b"RIFF\x10\x00\x00\x00WAVE", None),
+    (b"%PDF-1.7\n", None),
+    (b"", None),
+])
+def test_sniff_image_type(head, media_type):
+    assert sniff_image_type(head[:SNIFF_BYTES]) == media_type
+
+
+def test_receives_the_file_field_and_skips_other_fields():
+    body = multipart(("region", None, b"amsterdam"), ("file", "plan.png", PNG), ("notes", None, b"x" * 100))
+    upload = receive(make_request(body, content_length=len(body)))
+    try:
+        assert upload.filename == "plan.png"
+        assert upload.media_type == "image/png"
+        assert upload.size == len(PNG)
+        assert upload.sha256 == hashlib.sha256(PNG).hexdigest()
+        assert bytes(upload.view()) == PNG
+        assert upload.path is None
+    finally:
+        upload.close()
+
+
+def test_large_uploads_spool_to_disk():
+    body = multipart(("file", "plan.png", PNG))
+    upload = receive(make_request(body, chunk_size=100), spool_bytes=256)
+    try:
+        assert upload.path is not None and os.path.exists(upload.path)
+        assert bytes(upload.view()) == PNG
+        assert upload.head() == PNG[:SNIFF_BYTES]
+        assert upload.sha256 == hashlib.sha256(PNG).hexdigest()
+    finally:
+        upload.close()
+    assert not os.path.exists(upload.path)
+
+
+def test_rejects_files_that_are_not_images():
+    body = multipart(("file", "plan.pdf", b"%PDF-1.7\n" + b"x" * 100))
+    with pytest.raises(UnsupportedUpload):
+        receive(make_request(body))
+
+
+def test_rejects_short_non_images_once_the_part_ends():
+    with pytest.raises(UnsupportedUpload):
+        receive(make_request(multipart(("file", "a.txt", b"hello"))))
+
+
+def test_rejects_empty_files():
+    with pytest.raises(UnsupportedUpload):
+        receive(make_request(multipart(("file", "plan.png", b""))))
+
+
+def test_requires_the_file_field():
+    with pytest.raises(InvalidUpload):
+        receive(make_request(multipart(("image", "plan.png", PNG))))
+    # A plain form field of the same name is not a file
+    with pytest.raises(InvalidUpload):
+        receive(make_request(multipart(("file", None, PNG))))
+
+
+def test_requires_a_multipart_body():
+    with pytest.raises(InvalidUpload):
+        receive(make_request(PNG, content_type="image/png"))
+
+
+def test_refuses_a_declared_length_over_the_limit_before_reading():
+    body = multipart(("file", "plan.png", PNG))
+    request = make_request(body, content_length=10 ** 9)
+    with pytest.raises(UploadTooLarge):
+        receive(request, max_bytes=1024)
+
+
+def test_stops_reading_once_the_file_exceeds_the_limit():
+    body = multipart(("file", "plan.png", PNG))
+    with pytest.raises(UploadTooLarge):
+        receive(make_request(body, chunk_size=64), max_bytes=1024)